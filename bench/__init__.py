@@ -0,0 +1 @@
+"""Offline load-test and benchmark harness. Run with `python -m bench.run --help`."""
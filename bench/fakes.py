@@ -0,0 +1,175 @@
+"""In-process stand-ins for Discord, MongoDB and Gemini, just enough for the cogs' command paths."""
+import asyncio
+import itertools
+import random
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+from discord.utils import utcnow
+
+_ids = itertools.count(1)
+
+class FakeAttachment:
+    def __init__(self, filename: str, size: int):
+        self.id = next(_ids)
+        self.filename = filename
+        self.size = size
+        # Signed a day ahead, like a fresh CDN link
+        self.url = f"https://cdn.example/attachments/{self.id}/{filename}?ex={int(time.time()) + 86400:x}"
+
+class FakeMessage:
+    def __init__(self, channel, content: Optional[str], attachments=(), ephemeral: bool = False):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.attachments = list(attachments)
+        self.flags = SimpleNamespace(ephemeral=ephemeral)
+        self.edits = 0
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+        self.edits += 1
+
+class FakeDiscord:
+    """Simulated Discord API latency, shared by every fake interaction of a run."""
+    def __init__(self, latency: float = 0.05, upload_bytes_per_second: float = 20 * 1024**2):
+        self.latency = latency
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.calls = 0
+        self.uploaded_bytes = 0
+
+    async def call(self, upload_bytes: int = 0):
+        self.calls += 1
+        self.uploaded_bytes += upload_bytes
+        await asyncio.sleep(self.latency + upload_bytes / self.upload_bytes_per_second)
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+
+    async def defer(self, ephemeral: bool = False, **kwargs):
+        await self.interaction.discord.call()
+        self._done = True
+
+    async def send_message(self, content=None, ephemeral: bool = False, **kwargs):
+        await self.interaction.discord.call()
+        self._done = True
+
+    def is_done(self) -> bool:
+        return self._done
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+
+    async def send(self, content=None, file=None, ephemeral: bool = False, view=None, wait: bool = True, **kwargs):
+        attachments = []
+        size = 0
+        if file is not None:
+            # Read the body as discord.py would when building the multipart upload
+            data = await asyncio.to_thread(file.fp.read)
+            file.close()
+            size = len(data)
+            attachments.append(FakeAttachment(file.filename, size))
+        await self.interaction.discord.call(size)
+        message = FakeMessage(self.interaction.channel, content, attachments, ephemeral)
+        self.interaction.messages.append(message)
+        return message
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"bench-user-{user_id}"
+
+    def __str__(self):
+        return self.name
+
+class FakeInteraction:
+    def __init__(self, client, discord: FakeDiscord, command_name: Optional[str], user_id: int):
+        self.client = client
+        self.discord = discord
+        self.command = SimpleNamespace(name=command_name) if command_name else None
+        self.user = FakeUser(user_id)
+        self.guild = None  # DM: uploads use the default size limit
+        self.channel = SimpleNamespace(id=1)
+        self.created_at = utcnow()
+        self.namespace = SimpleNamespace()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.messages = []
+
+class FakeCollection:
+    """The subset of motor's collection API the cogs use, kept in a dict."""
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query):
+        return self.docs.get(query.get("_id"))
+
+    async def _iter(self):
+        for doc in list(self.docs.values()):
+            yield doc
+
+    def find(self, query=None):
+        return self._iter()
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        doc.update(update.get("$set", {}))
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = dict(doc, _id=query["_id"])
+
+    async def delete_one(self, query):
+        self.docs.pop(query.get("_id"), None)
+
+    async def create_index(self, *args, **kwargs):
+        return "bench"
+
+    async def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            self.docs[op._filter["_id"]] = dict(op._doc, _id=op._filter["_id"])
+
+class FakeMongo:
+    def __init__(self):
+        self._dbs = {}
+
+    def __getitem__(self, name):
+        return self._dbs.setdefault(name, _FakeDatabase())
+
+class _FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, FakeCollection())
+
+class FakeGemini:
+    """Mimics `client.aio` for streaming generation: a time to first chunk, then chunks at a steady rate."""
+    def __init__(self, first_chunk_latency: float = 0.4, chunk_interval: float = 0.05, chunks: int = 30,
+                 chunk_chars: int = 120, quota_error_rate: float = 0.0):
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.chunk_chars = chunk_chars
+        self.quota_error_rate = quota_error_rate
+        self.calls = 0
+        self.models = self
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        self.calls += 1
+        if random.random() < self.quota_error_rate:
+            raise QuotaError()
+        return self._stream()
+
+    async def _stream(self):
+        await asyncio.sleep(self.first_chunk_latency)
+        for i in range(self.chunks):
+            if i:
+                await asyncio.sleep(self.chunk_interval)
+            yield SimpleNamespace(text=("lorem ipsum " * self.chunk_chars)[:self.chunk_chars])
+
+class QuotaError(Exception):
+    code = 429
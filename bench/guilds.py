@@ -0,0 +1,128 @@
+"""Measure the bot's gateway cache memory on a synthetic guild load, with and without LOW_MEMORY.
+
+Each mode runs in a fresh interpreter. It builds a `PPBdpy` and feeds its connection state the GUILD_CREATE and
+MESSAGE_CREATE payloads Discord would send for the requested intents, as if every guild had been chunked and had
+seen some chat traffic. The RSS growth is then compared:
+
+    python -m bench.guilds --guilds 500 --members 200
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+import psutil
+
+MODES = {"full": "false", "lean": "true"}
+BOT_ID = 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.guilds", description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=500)
+    parser.add_argument("--members", type=int, default=200, help="members per guild")
+    parser.add_argument("--channels", type=int, default=20, help="text channels per guild")
+    parser.add_argument("--messages", type=int, default=20, help="messages received per guild")
+    parser.add_argument("--online", type=float, default=0.3, help="share of members with a presence")
+    parser.add_argument("--output", help="where to save results (default: bench/results/guilds-<timestamp>.json)")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)  # set for the child processes
+    return parser.parse_args(argv)
+
+def user(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": None, "avatar": None}
+
+def member(user_id: int) -> dict:
+    return {"user": user(user_id), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+def guild_payload(guild_id: int, args, intents) -> dict:
+    base = guild_id * 1_000_000
+    member_ids = [base + i for i in range(1, args.members + 1)]
+    # Without the members intent Discord only sends the bot's own member
+    members = [member(BOT_ID)]
+    if intents.members:
+        members += [member(m) for m in member_ids]
+    presences = []
+    if intents.presences:
+        presences = [{"user": {"id": str(m)}, "status": "online", "activities": [], "client_status": {"desktop": "online"}}
+                     for m in member_ids[:int(len(member_ids) * args.online)]]
+    return {
+        "id": str(guild_id), "name": f"guild {guild_id}", "icon": None, "owner_id": str(member_ids[0]),
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False, "flags": 0}],
+        "emojis": [], "stickers": [], "features": [], "member_count": args.members + 1, "large": args.members > 250,
+        "channels": [{"id": str(base + 900_000 + c), "type": 0, "name": f"channel-{c}", "position": c,
+                      "permission_overwrites": [], "guild_id": str(guild_id)} for c in range(args.channels)],
+        "members": members, "presences": presences, "voice_states": [], "threads": [],
+        "stage_instances": [], "guild_scheduled_events": [], "soundboard_sounds": [],
+        "joined_at": "2024-01-01T00:00:00+00:00", "unavailable": False,
+    }
+
+def message_payload(guild_id: int, n: int, args) -> dict:
+    base = guild_id * 1_000_000
+    author = base + 1 + n % args.members
+    return {
+        "id": str(base + 500_000 + n), "channel_id": str(base + 900_000 + n % args.channels), "guild_id": str(guild_id),
+        "author": user(author), "member": {k: v for k, v in member(author).items() if k != "user"},
+        "content": "what is the answer to question " + str(n) * 8, "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+        "attachments": [], "embeds": [], "pinned": False, "type": 0,
+    }
+
+def rss() -> int:
+    gc.collect()
+    return psutil.Process().memory_info().rss
+
+def measure(args) -> dict:
+    os.environ.update({"LOW_MEMORY": MODES[args.mode], "BOT_PREFIX": "!", "BOT_OWNER_IDS": "[]", "METRICS_PORT": "0"})
+    from discord import ClientUser
+    from main import PPBdpy
+    bot = PPBdpy()
+    state = bot._connection
+    state.user = ClientUser(state=state, data=user(BOT_ID) | {"bot": True})
+    state.dispatch = lambda *args, **kwargs: None  # only the caches are of interest
+    baseline = rss()
+    started = time.perf_counter()
+    for g in range(1, args.guilds + 1):
+        state.parse_guild_create(guild_payload(g, args, state._intents))
+        if state._intents.guild_messages:
+            for n in range(args.messages):
+                state.parse_message_create(message_payload(g, n, args))
+    elapsed = time.perf_counter() - started
+    snapshot = bot.snapshot()
+    return {
+        "mode": args.mode,
+        "intents": state._intents.value,
+        "rss_growth_mb": (rss() - baseline) / 1024**2,
+        "load_seconds": elapsed,
+        "guilds": snapshot["guilds"],
+        "cached_members": snapshot["cached_members"],
+        "cached_messages": snapshot["cached_messages"],
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.mode:
+        print(json.dumps(measure(args)))
+        return
+    results = {}
+    child_args = [a for a in (argv if argv is not None else sys.argv[1:])]
+    for mode in MODES:
+        out = subprocess.run([sys.executable, "-m", "bench.guilds", *child_args, "--mode", mode],
+                             capture_output=True, text=True, check=True).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+        r = results[mode]
+        print(f"{mode:<5} RSS +{r['rss_growth_mb']:7.1f} MB  {r['guilds']} guilds  {r['cached_members']:>8} members  "
+              f"{r['cached_messages']:>5} messages  ({r['load_seconds']:.1f}s to load)")
+    full, lean = results["full"]["rss_growth_mb"], results["lean"]["rss_growth_mb"]
+    if full > 0:
+        print(f"LOW_MEMORY saves {full - lean:.1f} MB ({(full - lean) / full * 100:.0f}%) on this load")
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", time.strftime("guilds-%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "modes": results}, f, indent=2)
+    print(f"Saved results to {output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
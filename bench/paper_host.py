@@ -0,0 +1,79 @@
+"""Local aiohttp stand-in for the paper host, with configurable latency, body size and error rates."""
+import asyncio
+import hashlib
+import random
+
+from aiohttp import web
+
+class PaperHost:
+    """Serves `/{subject}/{filename}` with a deterministic fake PDF body.
+
+    `latency` is the mean of an exponentially distributed delay added to every response. `error_rate` is the
+    share of 503s, `missing_rate` the share of papers that always 404 (chosen per filename, so it is stable)."""
+    def __init__(self, latency: float = 0.15, size: int = 1024**2, error_rate: float = 0.0, missing_rate: float = 0.0,
+                 bytes_per_second: float = 0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.size = size
+        self.error_rate = error_rate
+        self.missing_rate = missing_rate
+        self.bytes_per_second = bytes_per_second
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._runner = None
+        self._body = b"%PDF-1.4\n" + bytes(random.Random(0).getrandbits(8) for _ in range(4096))
+
+    @property
+    def template(self) -> str:
+        return f"http://{self.host}:{self.port}/{{subject}}/{{filename}}"
+
+    def _missing(self, filename: str) -> bool:
+        digest = int.from_bytes(hashlib.blake2b(filename.encode(), digest_size=4).digest(), "big")
+        return digest / 2**32 < self.missing_rate
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+        filename = request.match_info["filename"]
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+        if self._missing(filename):
+            return web.Response(status=404)
+        etag = f'"{hashlib.blake2b(filename.encode(), digest_size=8).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        headers = {"Content-Type": "application/pdf", "ETag": etag, "Content-Length": str(self.size)}
+        if request.method == "HEAD":
+            return web.Response(headers=headers)
+        response = web.StreamResponse(headers=headers)
+        sent = 0
+        try:
+            await response.prepare(request)
+            while sent < self.size:
+                chunk = self._body[:min(len(self._body), self.size - sent)]
+                await response.write(chunk)
+                sent += len(chunk)
+                if self.bytes_per_second:
+                    await asyncio.sleep(len(chunk) / self.bytes_per_second)
+            await response.write_eof()
+        except ConnectionResetError:
+            pass  # the client gave up, e.g. the losing side of a hedged request
+        self.bytes_sent += sent
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{subject}/{filename}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
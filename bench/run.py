@@ -0,0 +1,281 @@
+"""Benchmark the paper and chat commands offline.
+
+Runs the real cog code paths (`PaperUtils.qp`, `PaperUtils.ms`, `GetMSfromQP.callback`, `AIchat.chatAI`) against
+fake interactions, a local stand-in for the paper host and a stub Gemini client, then reports latency percentiles,
+throughput and peak RSS. Results are saved as JSON so runs can be compared:
+
+    python -m bench.run --requests 300 --concurrency 16
+    python -m bench.run --compare bench/results/20260101-120000.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import psutil
+
+SCENARIOS = ("qp", "ms", "ms_button", "chat")
+SUBJECT_VALUES = {"9231": "further_math", "9709": "math", "9701": "chemistry", "9702": "physics"}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--papers", type=int, default=100, help="distinct papers requested (smaller means more cache hits)")
+    parser.add_argument("--prompts", type=int, default=20, help="distinct /chat prompts (smaller means more cache hits)")
+    parser.add_argument("--host-latency", type=float, default=0.15, help="mean paper host latency in seconds")
+    parser.add_argument("--host-size", type=int, default=1024**2, help="paper size in bytes")
+    parser.add_argument("--host-error-rate", type=float, default=0.0, help="share of paper host 503s")
+    parser.add_argument("--host-missing-rate", type=float, default=0.0, help="share of papers that 404")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="simulated Discord API latency in seconds")
+    parser.add_argument("--gemini-first-chunk", type=float, default=0.4, help="stub Gemini time to first chunk in seconds")
+    parser.add_argument("--gemini-chunks", type=int, default=30, help="chunks per stub Gemini response")
+    parser.add_argument("--gemini-quota-error-rate", type=float, default=0.0, help="share of stub Gemini 429s")
+    parser.add_argument("--reuse-attachments", action="store_true", help="let repeat requests link earlier uploads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="where to save results (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+def configure_env(args, workdir: str):
+    # Read by PPBdpy.load_constant; everything stays inside the temp dir and nothing listens publicly
+    os.environ.update({
+        "BOT_OWNER_IDS": "[]",
+        "PAPER_CACHE_DIR": os.path.join(workdir, "papers"),
+        "PAPER_INDEX_DIR": os.path.join(workdir, "index"),
+        "PAPER_REUSE_ATTACHMENTS": "true" if args.reuse_attachments else "false",
+        "UPSTREAM_RATE": os.environ.get("UPSTREAM_RATE", "1000"),
+        "UPSTREAM_BURST": os.environ.get("UPSTREAM_BURST", "1000"),
+        "METRICS_PORT": "0",
+    })
+
+class BenchBot:
+    """Just the attributes the cogs read from PPBdpy."""
+    def __init__(self):
+        from main import PPBdpy
+        from utils.metrics import Metrics
+        from bench.fakes import FakeMongo
+        PPBdpy.load_constant(self)
+        self.metrics = Metrics()
+        self.db = FakeMongo()
+        self.http_pool = None
+        self.gemini = None
+        self._cogs = {}
+
+    def get_cog(self, name: str):
+        return self._cogs.get(name)
+
+    async def wait_until_ready(self):
+        return
+
+class RSSSampler:
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak = self.process.memory_info().rss
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> int:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.peak
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+async def run_scenario(name: str, make_call, args, bot) -> dict:
+    from utils.metrics import Metrics
+    bot.metrics = Metrics()
+    latencies = []
+    errors = 0
+    remaining = iter(range(args.requests))
+    sampler = RSSSampler()
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        for i in remaining:
+            start = time.perf_counter()
+            try:
+                await make_call(worker_id, i)
+            except Exception as e:
+                errors += 1
+                logging.getLogger("bench").warning(f"{name} request {i} failed: {e.__class__.__name__}: {e}")
+            latencies.append(time.perf_counter() - start)
+
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    peak_rss = await sampler.stop()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else None,
+        "mean": statistics.fmean(latencies) if latencies else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss / 1024**2,
+        "metrics": bot.metrics.summary(),
+    }
+
+async def run(args) -> dict:
+    from utils.http import HTTPPool
+    from utils.providers import TemplateHTTPProvider
+    from bench.fakes import FakeDiscord, FakeGemini, FakeInteraction
+    from bench.paper_host import PaperHost
+    random.seed(args.seed)
+    host = PaperHost(latency=args.host_latency, size=args.host_size, error_rate=args.host_error_rate,
+                     missing_rate=args.host_missing_rate)
+    await host.start()
+    bot = BenchBot()
+    bot.http_pool = HTTPPool(limit=bot.const.HTTP_POOL_LIMIT, limit_per_host=bot.const.HTTP_POOL_LIMIT_PER_HOST)
+    await bot.http_pool.start()
+    bot.gemini = FakeGemini(first_chunk_latency=args.gemini_first_chunk, chunks=args.gemini_chunks,
+                            quota_error_rate=args.gemini_quota_error_rate)
+    discord = FakeDiscord(latency=args.discord_latency)
+
+    from cogs.single.paperutils import PaperUtils, GetMSfromQP, BestExamHelpIO
+    from cogs.single.ai_chat import AIchat
+    papers = PaperUtils(bot)
+    chat = AIchat(bot)
+    bot._cogs = {"PaperUtils": papers, "AIchat": chat}
+    for logger_name in ("main", "cogs.single.paperutils", "cogs.single.ai_chat"):
+        logging.getLogger(logger_name).setLevel(args.log_level)
+    # Point the fetch path at the local host instead of bestexamhelp.com
+    papers.router.providers[:] = [TemplateHTTPProvider("bench", bot.http_pool, host.template,
+                                                       BestExamHelpIO().full_subject_ids(), guards=papers.guards)]
+    await papers.disk_cache.load()
+    papers.prefetcher.start()
+    await chat.cache.setup()
+
+    catalog = BestExamHelpIO.catalog()
+    rng = random.Random(args.seed)
+    working_set = [catalog.decode(code) for code in rng.sample(list(catalog.codes), min(args.papers, len(catalog)))]
+    prompts = [f"explain topic number {i} from the syllabus" for i in range(args.prompts)]
+
+    def pick():
+        subj, year, season, paper_id = rng.choice(working_set)
+        season_name = next(name for name, code in subj.seasons.items() if code == season)
+        return subj, year, season, season_name, paper_id
+
+    async def call_qp(worker_id, i):
+        subj, year, _, season_name, paper_id = pick()
+        interaction = FakeInteraction(bot, discord, "qp", worker_id)
+        await papers.qp.callback(papers, interaction, subject=SUBJECT_VALUES[subj.short_subjectID],
+                                 year=year, season=season_name, paper_id=paper_id)
+
+    async def call_ms(worker_id, i):
+        subj, year, _, season_name, paper_id = pick()
+        interaction = FakeInteraction(bot, discord, "ms", worker_id)
+        await papers.ms.callback(papers, interaction, subject=SUBJECT_VALUES[subj.short_subjectID],
+                                 year=year, season=season_name, paper_id=paper_id)
+
+    async def call_ms_button(worker_id, i):
+        subj, year, season, _, paper_id = pick()
+        interaction = FakeInteraction(bot, discord, None, worker_id)
+        await GetMSfromQP(subj, year, season, paper_id).callback(interaction)
+
+    async def call_chat(worker_id, i):
+        interaction = FakeInteraction(bot, discord, "chat", worker_id)
+        await chat.chatAI.callback(chat, interaction, prompt=rng.choice(prompts), fresh=False)
+
+    calls = {"qp": call_qp, "ms": call_ms, "ms_button": call_ms_button, "chat": call_chat}
+    results = {}
+    try:
+        for name in args.scenarios.split(","):
+            name = name.strip()
+            if name not in calls:
+                raise SystemExit(f"Unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+            results[name] = await run_scenario(name, calls[name], args, bot)
+            print(format_row(name, results[name]), flush=True)
+    finally:
+        await papers.prefetcher.stop()
+        papers.text_index.close()
+        await bot.http_pool.close()
+        await host.stop()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "args": vars(args),
+            "paper_host": {"requests": host.requests, "errors": host.errors, "bytes_sent": host.bytes_sent},
+            "discord": {"calls": discord.calls, "uploaded_bytes": discord.uploaded_bytes},
+            "gemini_calls": bot.gemini.calls,
+        },
+        "scenarios": results,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+def format_row(name: str, r: dict) -> str:
+    return (f"{name:<10} {r['requests']:>6} req {r['errors']:>4} err {r['rps']:>8.1f} req/s  "
+            f"p50 {ms(r['p50']):>8} ms  p95 {ms(r['p95']):>8} ms  p99 {ms(r['p99']):>8} ms  peak RSS {r['peak_rss_mb']:.0f} MB")
+
+def compare(current: dict, previous: dict):
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')}):")
+    for name, r in current["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if old is None:
+            continue
+        deltas = []
+        for field in ("rps", "p50", "p95", "p99", "peak_rss_mb"):
+            if r.get(field) and old.get(field):
+                deltas.append(f"{field} {(r[field] - old[field]) / old[field] * 100:+.1f}%")
+        print(f"{name:<10} " + "  ".join(deltas))
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(levelname)s %(name)s: %(message)s")
+    with tempfile.TemporaryDirectory(prefix="ppb-bench-") as workdir:
+        configure_env(args, workdir)
+        results = asyncio.run(run(args))
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Saved results to {output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,7 +6,7 @@ from discord.ext.commands import GroupCog, Bot
 from discord.app_commands import command, describe, autocomplete, check, checks
 # from discord.app_commands import Choice
 
-import logging; from logger import create_console_handler, create_file_handler
+import logging; from logger import setup_logger
 # import asyncio, aiohttp
 # import time
 # import json
@@ -17,10 +17,7 @@ class _ExampleGroup(GroupCog, group_name='examplegroup'):
         self.setup_log()
         
     def setup_log(self):
-        example_logger = logging.getLogger("cogs.group._example")
-        example_logger.setLevel(logging.DEBUG)
-        example_logger.addHandler(create_console_handler(logging.INFO))
-        example_logger.addHandler(create_file_handler("./logs/cogs/group/_example", "_example"))
+        example_logger = setup_logger("cogs.group._example", console_level=logging.INFO, log_dir="./logs/cogs/group/_example", file_name="_example")
         self.logger = example_logger
         
     @GroupCog.listener()
@@ -5,7 +5,7 @@ from discord.ext.commands import Cog
 from discord.app_commands import command, describe, autocomplete
 # from discord.app_commands import Choice
 
-import logging; from logger import create_console_handler, create_file_handler
+import logging; from logger import setup_logger
 from main import PPBdpy
 # import asyncio, aiohttp
 # import time
@@ -15,10 +15,7 @@ class ExampleCog(Cog):
         self.bot = bot
         self.setup_log()
     def setup_log(self):
-        example_logger = logging.getLogger("cogs.single._example")
-        example_logger.setLevel(logging.DEBUG)
-        example_logger.addHandler(create_console_handler(logging.INFO))
-        example_logger.addHandler(create_file_handler("./logs/cogs/single/_example", "_example"))
+        example_logger = setup_logger("cogs.single._example", console_level=logging.INFO, log_dir="./logs/cogs/single/_example", file_name="_example")
         self.logger = example_logger
     @Cog.listener()
     async def on_ready(self):
@@ -1,38 +1,426 @@
-from typing import List
+from typing import List, Optional, Tuple
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+import hashlib
+import re
+import unicodedata
 
 from discord.ext.commands import Cog
-from discord import Interaction
+from discord import HTTPException, Interaction
 from discord.app_commands import command, describe, autocomplete
 # from discord.app_commands import Choice
 
-import logging; from logger import create_console_handler, create_file_handler
+import logging; from logger import setup_logger
 from main import PPBdpy
+from utils.background import BackgroundTasks
+from utils.metrics import observe_interaction
+from utils.mongo import LazyCollection
 import asyncio
-# import time
+import time
+
+MODEL = 'gemini-2.0-flash-001'
+
+def normalise_prompt(prompt: str) -> str:
+    """Fold case, compatibility characters and whitespace so trivially different prompts share a cache entry."""
+    prompt = unicodedata.normalize("NFKC", prompt).casefold()
+    return re.sub(r"\s+", " ", prompt).strip().rstrip("?!. ")
+
+class ResponseCacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+    def to_dict(self) -> dict:
+        data = dict(self.__dict__)
+        lookups = self.memory_hits + self.db_hits + self.misses
+        data["hit_rate"] = (self.memory_hits + self.db_hits) / lookups if lookups else 0.0
+        return data
+
+class ResponseCache:
+    """Cache of AI responses keyed on the model and the normalised prompt.
+
+    An in-memory LRU sits in front of a MongoDB collection whose TTL index expires old entries.
+    MongoDB lookups are bounded by `lookup_timeout` and stores are written in the background,
+    so a slow database never delays a reply for long."""
+    def __init__(self, collection=None, max_entries: int = 1024, ttl: float = 7 * 86400, lookup_timeout: float = 1.0):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lookup_timeout = lookup_timeout
+        self.stats = ResponseCacheStats()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (response, created_at)
+        self.writes = BackgroundTasks("chat cache")
+        self.logger = logging.getLogger("cogs.single.ai_chat")
+
+    @staticmethod
+    def key_for(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalise_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    async def setup(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index("created_at", expireAfterSeconds=int(self.ttl))
+        except Exception as e:
+            self.logger.warning(f"Could not create the TTL index for the chat cache: {e.__class__.__name__}: {e}")
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._entries[key] = (response, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, model: str, prompt: str) -> Optional[str]:
+        key = self.key_for(model, prompt)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.time() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats.memory_hits += 1
+                return entry[0]
+            del self._entries[key]
+        if self.collection is not None:
+            try:
+                doc = await asyncio.wait_for(self.collection.find_one({"_id": key}), self.lookup_timeout)
+            except Exception as e:
+                self.logger.debug("Chat cache lookup failed: %s", e.__class__.__name__)
+                doc = None
+            # The TTL monitor only runs every minute or so, so check the age here as well
+            created_at = doc["created_at"].replace(tzinfo=timezone.utc).timestamp() if doc is not None else 0
+            if time.time() - created_at < self.ttl:
+                self._remember(key, doc["response"], created_at)
+                self.stats.db_hits += 1
+                return doc["response"]
+        self.stats.misses += 1
+        return None
+
+    def put(self, model: str, prompt: str, response: str):
+        key = self.key_for(model, prompt)
+        now = time.time()
+        self._remember(key, response, now)
+        self.stats.stores += 1
+        if self.collection is not None:
+            self.writes.spawn(self._persist(key, model, prompt, response, now))
+
+    async def _persist(self, key: str, model: str, prompt: str, response: str, now: float):
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {"model": model, "prompt": normalise_prompt(prompt), "response": response,
+                 "created_at": datetime.fromtimestamp(now, timezone.utc)},
+                upsert=True,
+            )
+        except Exception as e:
+            self.logger.warning("Could not persist chat cache entry: %s", e.__class__.__name__)
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["entries"] = len(self._entries)
+        data["pending_writes"] = self.writes.pending
+        return data
+
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$", re.M)
+
+def open_fence(text: str) -> Optional[str]:
+    """The opening line of a code fence left unclosed at the end of `text` (e.g. "```python"), or None."""
+    opening = None
+    for match in FENCE_RE.finditer(text):
+        marker = match.group(1)
+        if opening is None:
+            opening = (marker, match.group(0).strip())
+        elif marker[0] == opening[0][0] and len(marker) >= len(opening[0]) and not match.group(2).strip():
+            opening = None
+    return opening[1] if opening else None
+
+def close_fence(text: str) -> str:
+    """`text` with any unclosed code fence closed, so a partial message still renders as code."""
+    opening = open_fence(text)
+    if opening is None:
+        return text
+    return f"{text}\n{opening[:len(opening) - len(opening.lstrip(opening[0]))]}"
+
+def _cut(text: str, budget: int) -> int:
+    """Where to end a chunk of at most `budget` characters: the last paragraph break, else line break, else space."""
+    window = text[:budget]
+    for sep in ("\n\n", "\n", " "):
+        i = window.rfind(sep)
+        while i > budget // 4 and window.count("$$", 0, i) % 2:
+            i = window.rfind(sep, 0, i)
+        if i > budget // 4:
+            return i + len(sep)
+    return budget
+
+def split_markdown(text: str, limit: int = 2000) -> Tuple[str, str]:
+    """Split `text` into a first chunk of at most `limit` characters and the rest.
+
+    Cuts at the last paragraph break, else line break, else space, avoiding the inside of `$$` blocks.
+    A code fence open at the cut is closed at the end of the chunk and reopened at the start of the rest;
+    the limit includes that closing fence."""
+    if len(close_fence(text)) <= limit:
+        return text, ""
+    # Leave room for closing a fence such as "\n````", and shrink further if the fence is longer
+    budget = limit - 8
+    while True:
+        cut = _cut(text, budget)
+        head, rest = text[:cut], text[cut:]
+        opening = open_fence(head)
+        if opening is not None:
+            head = close_fence(head.rstrip("\n"))
+            rest = f"{opening}\n{rest}"
+        if len(head) <= limit or budget <= 1:
+            return head, rest
+        budget -= len(head) - limit
+
+class StreamingReply:
+    """Posts a streamed response while it is generated.
+
+    The first text is sent as soon as it arrives; later text is coalesced into at most one edit per `edit_interval` seconds,
+    and a new message is started whenever the current one reaches Discord's `limit` characters.
+    There is no fixed delay between messages: discord.py already waits on the per-route rate-limit headers."""
+    def __init__(self, interaction: Interaction, edit_interval: float = 1.5, limit: int = 2000):
+        self.interaction = interaction
+        self.edit_interval = edit_interval
+        self.limit = limit
+        self.text = ""  # text belonging to the current message
+        self.shown = ""  # what the current message displays right now
+        self.message = None
+        self.messages = 0
+        self.chars = 0
+        self.last_edit = 0.0
+
+    async def feed(self, chunk: str):
+        self.text += chunk
+        self.chars += len(chunk)
+        while len(close_fence(self.text)) > self.limit:
+            # The current message is full: show it completely and carry the rest over to a new one
+            full, self.text = split_markdown(self.text, self.limit)
+            await self._show(full)
+            self.message = None
+            self.shown = ""
+        if time.monotonic() - self.last_edit >= self.edit_interval:
+            await self._show(close_fence(self.text))
+
+    async def finish(self, fallback: str = "No response."):
+        if self.messages == 0 and not self.text:
+            self.text = fallback
+        await self._show(close_fence(self.text))
+
+    async def _show(self, content: str):
+        if not content or content == self.shown:
+            return
+        if self.message is None:
+            self.message = await self.interaction.followup.send(content=content, wait=True)
+            self.messages += 1
+        else:
+            await self.message.edit(content=content)
+        self.shown = content
+        self.last_edit = time.monotonic()
+
+class SchedulerFull(Exception):
+    """Raised when a request cannot be queued because the user's or the global queue is full."""
+
+def is_quota_error(e: Exception) -> bool:
+    return getattr(e, "code", None) == 429
+
+class SchedulerStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.quota_errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    def to_dict(self) -> dict:
+        data = dict(self.__dict__)
+        data["wait_avg"] = self.wait_total / self.admitted if self.admitted else 0.0
+        return data
+
+class FairScheduler:
+    """Admits AI calls under a global in-flight cap, serving each user's queue in turn.
+
+    The cap adapts: it is halved when the API reports quota exhaustion (429) and grows by one again
+    after `limit` consecutive successes, up to `max_limit`. Requests are refused outright once the
+    user already has `max_per_user` waiting, or `max_queue` requests are waiting overall."""
+    def __init__(self, max_limit: int = 4, max_queue: int = 50, max_per_user: int = 2):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.in_flight = 0
+        self.depth = 0
+        self.stats = SchedulerStats()
+        self._queues: dict = {}  # user id -> deque of futures
+        self._turns = deque()  # user ids with waiting requests, in round-robin order
+        self._successes = 0
+
+    async def acquire(self, user_id: int):
+        queue = self._queues.get(user_id)
+        if self.depth >= self.max_queue or (queue is not None and len(queue) >= self.max_per_user):
+            self.stats.rejected += 1
+            raise SchedulerFull()
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._turns.append(user_id)
+        queue.append(future)
+        self.depth += 1
+        started = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller gave up
+                self.release()
+            elif future in queue:
+                queue.remove(future)
+                self.depth -= 1
+                if not queue:
+                    del self._queues[user_id]
+                    self._turns.remove(user_id)
+            raise
+        waited = time.monotonic() - started
+        self.stats.admitted += 1
+        self.stats.wait_total += waited
+        self.stats.wait_max = max(self.stats.wait_max, waited)
+
+    def release(self, quota_exceeded: bool = False):
+        self.in_flight -= 1
+        if quota_exceeded:
+            self.stats.quota_errors += 1
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+        else:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_flight < self.limit and self._turns:
+            user_id = self._turns.popleft()
+            queue = self._queues[user_id]
+            future = queue.popleft()
+            self.depth -= 1
+            if queue:
+                self._turns.append(user_id)
+            else:
+                del self._queues[user_id]
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data.update(in_flight=self.in_flight, limit=self.limit, depth=self.depth, waiting_users=len(self._queues))
+        return data
 
 class AIchat(Cog):
     def __init__(self, bot: PPBdpy):
         self.bot = bot
         self.setup_log()
+        self.cache = ResponseCache(LazyCollection(bot, "chat_cache"),
+                                   max_entries=bot.const.CHAT_CACHE_MAX_ENTRIES,
+                                   ttl=bot.const.CHAT_CACHE_TTL)
+        self.scheduler = FairScheduler(max_limit=bot.const.CHAT_MAX_CONCURRENCY,
+                                       max_queue=bot.const.CHAT_MAX_QUEUE,
+                                       max_per_user=bot.const.CHAT_MAX_QUEUE_PER_USER)
+    async def cog_load(self):
+        # Creating the TTL index waits for the database (up to the server selection timeout); don't hold up startup
+        self.cache.writes.spawn(self.cache.setup())
+        self.bot.metrics.add_collector("chat", lambda: {"cache": self.cache.snapshot(), "scheduler": self.scheduler.snapshot()})
+    async def cog_unload(self):
+        self.bot.metrics.remove_collector("chat")
+        await self.cache.writes.drain()
     def setup_log(self):
-        ai_chat = logging.getLogger("cogs.single.ai_chat")
-        ai_chat.setLevel(logging.DEBUG)
-        ai_chat.addHandler(create_console_handler(logging.INFO))
-        ai_chat.addHandler(create_file_handler("./logs/cogs/single/ai_chat", "ai_chat"))
+        ai_chat = setup_logger("cogs.single.ai_chat", console_level=logging.INFO, log_dir="./logs/cogs/single/ai_chat", file_name="ai_chat")
         self.logger = ai_chat
     @Cog.listener()
     async def on_ready(self):
         return
     @command(name="chat", description="Chat with AI.")
-    async def chatAI(self, interaction: Interaction, prompt: str):
-        await interaction.response.defer(ephemeral=False)
-        _ai_response = await self.bot.gemini.models.generate_content(model='gemini-2.0-flash-001', contents=prompt)
-        ai_response = _ai_response.text
-        # Split the response into chunks of 1999 characters
-        chunks = [ai_response[i:i+1999] for i in range(0, len(ai_response), 1999)]
-        for idx, chunk in enumerate(chunks):
-            await asyncio.sleep(0.1)
-            await interaction.followup.send(content=chunk)
+    @describe(prompt="What you want to ask the AI.",
+              fresh="Ask the AI again instead of reusing a saved answer to the same question.")
+    async def chatAI(self, interaction: Interaction, prompt: str, fresh: bool = False):
+        with self.bot.metrics.timer("command_phase_seconds", command="chat", phase="defer"):
+            await interaction.response.defer(ephemeral=False)
+        reply = StreamingReply(interaction, edit_interval=self.bot.const.CHAT_STREAM_EDIT_INTERVAL)
+        cached = None
+        if fresh:
+            self.cache.stats.bypassed += 1
+        else:
+            cached = await self.cache.get(MODEL, prompt)
+        if cached is not None:
+            try:
+                await reply.feed(cached)
+                await reply.finish()
+            except HTTPException as e:
+                return self.logger.warning("Could not deliver the cached chat response to %s: %s", interaction.user, e.__class__.__name__)
+            observe_interaction(self.bot.metrics, interaction, "chat")
+            return self.logger.info("Finished request for %s with chat (Result: cached, %s chars)", interaction.user, reply.chars)
+        try:
+            with self.bot.metrics.timer("command_phase_seconds", command="chat", phase="queue"):
+                await self.scheduler.acquire(interaction.user.id)
+        except SchedulerFull:
+            await interaction.followup.send("The AI is busy right now (or you already have requests waiting). Please try again in a moment.")
+            return self.logger.info("Rejected chat request from %s: %s", interaction.user, self.scheduler.snapshot())
+        parts = []
+        complete = False
+        quota_exceeded = False
+        notice = None
+        delivery_error = None
+        chunks = self.generate(prompt)
+        try:
+            while True:
+                # Only the Gemini stream is handled as an AI error; Discord errors while posting are handled below
+                try:
+                    text = await anext(chunks)
+                except StopAsyncIteration:
+                    complete = True
+                    break
+                except Exception as e:
+                    quota_exceeded = is_quota_error(e)
+                    self.logger.error("Error streaming AI response: %s", e.__class__.__name__, exc_info=not quota_exceeded)
+                    if quota_exceeded:
+                        notice = "\n\n*The AI is over its usage quota right now, please try again later.*"
+                    else:
+                        notice = f"\n\n*An error occurred while generating the response: {e.__class__.__name__}*"
+                    break
+                parts.append(text)
+                await reply.feed(text)
+        except HTTPException as e:
+            delivery_error = e
+        finally:
+            await chunks.aclose()
+            self.scheduler.release(quota_exceeded)
+        if delivery_error is None:
+            try:
+                if notice is not None:
+                    await reply.feed(notice)
+                await reply.finish()
+            except HTTPException as e:
+                delivery_error = e
+        if complete and parts:
+            self.cache.put(MODEL, prompt, "".join(parts))
+        if delivery_error is not None:
+            return self.logger.warning("Could not deliver the chat response to %s: %s", interaction.user, delivery_error.__class__.__name__)
+        observe_interaction(self.bot.metrics, interaction, "chat")
+        self.logger.info("Finished request for %s with chat (Result: %s chars in %s message(s))", interaction.user, reply.chars, reply.messages)
+
+    async def generate(self, prompt: str):
+        """Yield the text of each streamed Gemini chunk, recording the time to the first chunk and in total."""
+        started = time.perf_counter()
+        first_chunk = True
+        async for chunk in await self.bot.gemini.models.generate_content_stream(model=MODEL, contents=prompt):
+            if first_chunk:
+                self.bot.metrics.observe("gemini_seconds", time.perf_counter() - started, stage="first_chunk")
+                first_chunk = False
+            if chunk.text:
+                yield chunk.text
+        self.bot.metrics.observe("gemini_seconds", time.perf_counter() - started, stage="total")
 
 async def setup(bot: PPBdpy):
     await bot.add_cog(AIchat(bot))
@@ -0,0 +1,49 @@
+import io
+import json
+
+from discord.ext.commands import Cog, Context, command, is_owner
+from discord import File as dFile
+
+import logging; from logger import setup_logger
+from main import PPBdpy
+from utils.metrics import LoopLagMonitor, MetricsServer
+
+class Metrics(Cog):
+    def __init__(self, bot: PPBdpy):
+        self.bot = bot
+        self.setup_log()
+        self.lag_monitor = LoopLagMonitor(bot.metrics)
+        self.server = None
+        if bot.const.METRICS_PORT:
+            self.server = MetricsServer(bot.metrics, bot.const.METRICS_HOST, bot.const.METRICS_PORT)
+    def setup_log(self):
+        metrics_logger = setup_logger("cogs.single.metrics", console_level=logging.INFO, log_dir="./logs/cogs/single/metrics", file_name="metrics")
+        self.logger = metrics_logger
+    async def cog_load(self):
+        self.lag_monitor.start()
+        if self.server is not None:
+            try:
+                await self.server.start()
+            except OSError as e:
+                self.logger.error(f"Could not start the metrics endpoint on {self.server.host}:{self.server.port}: {e}")
+                self.server = None
+    async def cog_unload(self):
+        await self.lag_monitor.stop()
+        if self.server is not None:
+            await self.server.stop()
+    @command(name="metrics", hidden=True)
+    @is_owner()
+    async def metrics(self, ctx: Context, fmt: str = "summary"):
+        """Show the bot's metrics. `fmt` is "summary" (default) or "prometheus"."""
+        if fmt == "prometheus":
+            text = self.bot.metrics.render()
+        else:
+            text = json.dumps(self.bot.metrics.summary(), indent=1, default=str)
+        if len(text) <= 1900:
+            await ctx.send(f"```\n{text}\n```")
+        else:
+            await ctx.send(file=dFile(io.BytesIO(text.encode("utf-8")), filename="metrics.txt"))
+        self.logger.info(f"Finished request for {ctx.author} with metrics {fmt}")
+
+async def setup(bot: PPBdpy):
+    await bot.add_cog(Metrics(bot))
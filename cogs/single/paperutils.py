@@ -1,17 +1,35 @@
-from typing import List, Literal
-import io  # Added for BytesIO
+from typing import List, Literal, Optional, Tuple
+from array import array
+from bisect import bisect_left
 import re
+import time
+import asyncio
+import tempfile
+import zipfile
 
 from discord.ext.commands import Cog
+from discord.ext import tasks
 from discord import Interaction, File as dFile, ButtonStyle
 from discord.ui import Button, View, DynamicItem
 from discord.app_commands import command, describe, autocomplete, choices, Choice
+from discord.utils import DEFAULT_FILE_SIZE_LIMIT_BYTES
 # from discord.app_commands import Choice
 
-import logging; from logger import create_console_handler, create_file_handler
+import logging; from logger import setup_logger
 from main import PPBdpy
-import random, aiohttp
-from io import BytesIO  
+from utils.papercache import PaperKey, DiskPaperCache
+from utils.memcache import HotBytesCache
+from utils.fetcher import PaperFetcher, FetchResult
+from utils.existence import ExistenceIndex
+from utils.prefetch import Prefetcher
+from utils.attachments import AttachmentRegistry
+from utils.mongo import LazyCollection
+from utils.textindex import TextIndex
+from utils.metrics import observe_interaction
+from utils.warming import PopularityTracker, CacheWarmer
+from utils.resilience import UpstreamGuards
+from utils.providers import PaperProvider, HTTPProvider, TemplateHTTPProvider, LocalDirectoryProvider, ProviderRouter
+import random
 # import asyncio, 
 # import time
 
@@ -26,6 +44,148 @@ class Subject:
         self.rand_years = rand_years
         self.papers = papers
         self.season_specific_papers = season_specific_papers or {}
+    def papers_for(self, year: int, season: str) -> List[int]:
+        """Valid paper IDs for a year and season code.
+
+        Season-specific papers replace the general list for that season; a season with specific papers
+        but no range covering the year had no session that year."""
+        if year not in self.years:
+            return []
+        ranges = self.season_specific_papers.get(season, self.papers)
+        for cond, pps in ranges:
+            if year in cond:
+                return list(pps)
+        return []
+
+class PaperCatalog:
+    """Precomputed index of every valid (subject, year, season, paper) tuple.
+
+    Each tuple is packed into one integer (subject | year | season | paper, most significant first).
+    Codes are kept sorted in an `array` for enumeration and uniform sampling, plus a bitmap for O(1) membership."""
+    SEASON_CODES = "msw"
+    YEAR_BASE = 2000
+    YEAR_BITS, SEASON_BITS, PAPER_BITS = 7, 2, 7
+
+    def __init__(self, subjects: List[Subject]):
+        self.subjects = list(subjects)
+        self._subject_idx = {s.short_subjectID: i for i, s in enumerate(self.subjects)}
+        codes = array('I')
+        for si, subj in enumerate(self.subjects):
+            for year in subj.years:
+                for season in sorted(set(subj.seasons.values()), key=self.SEASON_CODES.index):
+                    for paper_id in sorted(set(subj.papers_for(year, season))):
+                        codes.append(self._encode(si, year, season, paper_id))
+        self.codes = array('I', sorted(codes))
+        self.bitmap = bytearray((len(self.subjects) << (self.YEAR_BITS + self.SEASON_BITS + self.PAPER_BITS)) // 8 + 1)
+        for code in self.codes:
+            self.bitmap[code >> 3] |= 1 << (code & 7)
+        # Facets for autocomplete: every (subject, year|None, season|None, paper|None) filter -> sorted values per field
+        facets = {}
+        for code in self.codes:
+            subj, year, season, paper_id = self.decode(code)
+            sid = subj.short_subjectID
+            for y in (year, None):
+                for se in (season, None):
+                    for p in (paper_id, None):
+                        facet = facets.setdefault((sid, y, se, p), (set(), set(), set()))
+                        facet[0].add(year); facet[1].add(season); facet[2].add(paper_id)
+        self._facets = {
+            key: (tuple(sorted(ys)), tuple(sorted(ss, key=self.SEASON_CODES.index)), tuple(sorted(ps)))
+            for key, (ys, ss, ps) in facets.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _encode(self, subject_idx: int, year: int, season: str, paper_id: int) -> int:
+        code = subject_idx
+        code = (code << self.YEAR_BITS) | (year - self.YEAR_BASE)
+        code = (code << self.SEASON_BITS) | self.SEASON_CODES.index(season)
+        return (code << self.PAPER_BITS) | paper_id
+
+    def encode(self, subject: Subject, year: int, season: str, paper_id: int) -> Optional[int]:
+        si = self._subject_idx.get(subject.short_subjectID)
+        if si is None or season not in self.SEASON_CODES or not 0 <= year - self.YEAR_BASE < (1 << self.YEAR_BITS) \
+                or not 0 <= paper_id < (1 << self.PAPER_BITS):
+            return None
+        return self._encode(si, year, season, paper_id)
+
+    def decode(self, code: int) -> Tuple[Subject, int, str, int]:
+        paper_id = code & ((1 << self.PAPER_BITS) - 1)
+        code >>= self.PAPER_BITS
+        season = self.SEASON_CODES[code & ((1 << self.SEASON_BITS) - 1)]
+        code >>= self.SEASON_BITS
+        year = (code & ((1 << self.YEAR_BITS) - 1)) + self.YEAR_BASE
+        return self.subjects[code >> self.YEAR_BITS], year, season, paper_id
+
+    def contains(self, subject: Subject, year: int, season: str, paper_id: int) -> bool:
+        code = self.encode(subject, year, season, paper_id)
+        return code is not None and bool(self.bitmap[code >> 3] & (1 << (code & 7)))
+
+    def _prefix_slice(self, subject: Subject, year: Optional[int], season: Optional[str]) -> Tuple[int, int]:
+        # Codes are sorted most-significant first, so a (subject[, year[, season]]) prefix is one contiguous run
+        si = self._subject_idx[subject.short_subjectID]
+        shift = self.YEAR_BITS + self.SEASON_BITS + self.PAPER_BITS
+        prefix = si
+        if year is not None:
+            prefix = (prefix << self.YEAR_BITS) | (year - self.YEAR_BASE)
+            shift -= self.YEAR_BITS
+            if season is not None:
+                prefix = (prefix << self.SEASON_BITS) | self.SEASON_CODES.index(season)
+                shift -= self.SEASON_BITS
+        lo = bisect_left(self.codes, prefix << shift)
+        hi = bisect_left(self.codes, (prefix + 1) << shift)
+        return lo, hi
+
+    def candidates(self, subject: Subject, year: Optional[int] = None, season: Optional[str] = None,
+                   paper_id: Optional[int] = None, years: Optional[range] = None) -> List[int]:
+        """Codes matching the given filters. `years` limits the year range (e.g. `Subject.rand_years`)."""
+        if subject.short_subjectID not in self._subject_idx:
+            return []
+        if year is not None and not 0 <= year - self.YEAR_BASE < (1 << self.YEAR_BITS):
+            return []
+        if season is not None and season not in self.SEASON_CODES:
+            return []
+        lo, hi = self._prefix_slice(subject, year, season)
+        if year is None and years is not None and years.step == 1:
+            # Years come right after the subject in a code, so a year range is one contiguous run as well
+            first = max(years.start, self.YEAR_BASE)
+            stop = min(years.stop, self.YEAR_BASE + (1 << self.YEAR_BITS))
+            if first >= stop:
+                return []
+            lo = max(lo, self._prefix_slice(subject, first, None)[0])
+            if stop < self.YEAR_BASE + (1 << self.YEAR_BITS):
+                hi = min(hi, self._prefix_slice(subject, stop, None)[0])
+            years = None
+        # The slice is exact unless a season is given without a year, or paper/year-range filters apply
+        exact = season is None or year is not None
+        if exact and paper_id is None and years is None:
+            return list(self.codes[lo:hi])
+        result = []
+        for code in self.codes[lo:hi]:
+            _, y, s, p = self.decode(code)
+            if season is not None and s != season: continue
+            if paper_id is not None and p != paper_id: continue
+            if years is not None and y not in years: continue
+            result.append(code)
+        return result
+
+    def sample(self, subject: Subject, **filters) -> Optional[Tuple[Subject, int, str, int]]:
+        """Uniformly pick one valid tuple matching the filters, or None if nothing matches."""
+        codes = self.candidates(subject, **filters)
+        if not codes:
+            return None
+        return self.decode(random.choice(codes))
+
+    def facet(self, subject: Subject, year: Optional[int] = None, season: Optional[str] = None,
+              paper_id: Optional[int] = None) -> Tuple[tuple, tuple, tuple]:
+        """Valid (years, season codes, paper IDs) given the fields already chosen. Precomputed, so O(1)."""
+        return self._facets.get((subject.short_subjectID, year, season, paper_id), ((), (), ()))
+
+    def enumerate(self, subject: Optional[Subject] = None, **filters):
+        if subject is None:
+            return (self.decode(code) for code in self.codes)
+        return (self.decode(code) for code in self.candidates(subject, **filters))
 
 class BestExamHelpIO:
     """Data structure for storing past paper.
@@ -106,6 +266,13 @@ class BestExamHelpIO:
             ]
         }
     )
+    _catalog: PaperCatalog = None
+    @classmethod
+    def catalog(cls) -> PaperCatalog:
+        """Catalog of every valid paper, built once on first use."""
+        if cls._catalog is None:
+            cls._catalog = PaperCatalog([cls.FURTHER_MATH, cls.MATH, cls.CHEMISTRY, cls.PHYSICS])
+        return cls._catalog
     def get_subject(self, subject: str):
         subjects = {
             "further_math": self.FURTHER_MATH,
@@ -122,11 +289,33 @@ class BestExamHelpIO:
             "9702": self.PHYSICS,
         }
         return subjects.get(short_subjectID, None)
+    def provider(self, http_pool, guards: UpstreamGuards = None) -> HTTPProvider:
+        """This site as a paper provider for the fetch path."""
+        return HTTPProvider("bestexamhelp", http_pool, link_for=self.link_for_key, guards=guards)
+    def full_subject_ids(self) -> dict:
+        return {s.short_subjectID: s.full_subjectID for s in self.catalog().subjects}
+    def link_for_key(self, key: PaperKey) -> Optional[str]:
+        subject = self.get_subject_by_short_id(key.subject)
+        if subject is None:
+            return None
+        return self.construct_link(subject, key.year, key.season, key.doctype, key.paper_id)
+    def paper_key(self, subject: Subject, year: int, season: str, documenttype: Literal["qp", "ms"], paper_id: int) -> PaperKey:
+        return PaperKey(subject.short_subjectID, year, season, documenttype, paper_id)
     # https://bestexamhelp.com/exam/cambridge-international-a-level/{full_subjectid}/{year}/{short_subjectid}_{season}{shortyear}_{documenttype}.pdf
     def construct_link(self, subject: Subject, year: int, season: str, documenttype: Literal["qp", "ms"], paper_id: int) -> str:
         short_year = str(year)[-2:]
         return f"https://bestexamhelp.com/exam/cambridge-international-a-level/{subject.full_subjectID}/{year}/{subject.short_subjectID}_{season}{short_year}_{documenttype}_{paper_id}.pdf"
 
+def upload_limit(interaction: Interaction) -> int:
+    """Largest attachment the bot may upload in the interaction's guild (or DM)."""
+    if interaction.guild is not None:
+        return interaction.guild.filesize_limit
+    return DEFAULT_FILE_SIZE_LIMIT_BYTES
+
+def too_large_response(result, link: str, what: str) -> str:
+    return (f"This {what} is too large to upload here (over {result.size / 1024**2:.1f} MB). "
+            f"Download it directly: {link}")
+
 class GetMSfromQP(DynamicItem[Button], template=r'ms_(?P<season>[a-z])(?P<year>\d{2})_(?P<subject_id>\d{4})_(?P<paper_id>\d+)'):
     def __init__(self, subject: Subject, year: int, season: str, paper_id: int):
         
@@ -159,52 +348,297 @@ class GetMSfromQP(DynamicItem[Button], template=r'ms_(?P<season>[a-z])(?P<year>\
         return cls(subject_obj, year, season, paper_id)
 
     async def callback(self, interaction: Interaction):
-        await interaction.response.defer(ephemeral=False)
+        with interaction.client.metrics.timer("command_phase_seconds", command="ms_button", phase="defer"):
+            await interaction.response.defer(ephemeral=False)
         link = BestExamHelpIO().construct_link(self.subject, self.year, self.season, "ms", self.paper_id)
+        key = BestExamHelpIO().paper_key(self.subject, self.year, self.season, "ms", self.paper_id)
         failed = False
         ms_file = None
         text_response = ""
         self.logger = logging.getLogger("cogs.single.paperutils")
-        async with aiohttp.ClientSession() as session:
-            try:
-                headers = {
-                    'User-Agent': 'PastPaperBot/1.0',
-                    'Accept': 'application/pdf'
-                }
-                async with session.get(link, headers=headers) as response:
-                    if response.status == 304 or response.status in range(200, 300):
-                        file_content = await response.read()
-                        file_bytes = BytesIO(file_content)
-                        ms_file = dFile(file_bytes, filename=link.split('/')[-1])
-                        text_response = f"Here's your mark scheme: (**{ms_file.filename}**)"
-                        self.logger.debug(f"Successfully fetched mark scheme from {link} with status {response.status}")
-                    else:
-                        text_response = f"Failed to fetch the mark scheme. Status code: {response.status}"
-                        failed = True
-            except Exception as e:
-                self.logger.error(f"Error fetching mark scheme: {e.__class__.__name__}", exc_info=True)
-                text_response = f"An error occurred while fetching the mark scheme: {str(e)}"
+        cog: PaperUtils = interaction.client.get_cog("PaperUtils")
+        cog.popularity.record(key)
+        try:
+            with cog.bot.metrics.timer("command_phase_seconds", command="ms_button", phase="fetch"):
+                result = await cog.fetch_document(interaction, key, link)
+            cog.prefetcher.record_request(key, result)
+            if result.ok:
+                ms_file = result
+                text_response = f"Here's your mark scheme: (**{result.filename}**)"
+                self.logger.debug("Successfully fetched mark scheme from %s with status %s (source: %s)", link, result.status, result.source)
+            elif result.too_large:
+                text_response = too_large_response(result, link, "mark scheme")
+            else:
+                text_response = f"Failed to fetch the mark scheme. Status code: {result.status}"
                 failed = True
+        except Exception as e:
+            self.logger.error("Error fetching mark scheme: %s", e.__class__.__name__, exc_info=True)
+            text_response = f"An error occurred while fetching the mark scheme: {str(e)}"
+            failed = True
 
         if failed:
             await interaction.followup.send(content=text_response)
         elif ms_file is None:
             await interaction.followup.send(content=text_response)
         else:
-            await interaction.followup.send(content=text_response, ephemeral=False, file=ms_file)
+            with cog.bot.metrics.timer("command_phase_seconds", command="ms_button", phase="upload"):
+                await cog.send_document(interaction, ms_file, content=text_response)
         # finished request
-        self.logger.info(f"Finished request for {interaction.user} with {self.subject.short_subjectID} {self.year} {self.season} {self.paper_id} (Result: {'Success' if ms_file else 'Failed'})")
+        observe_interaction(interaction.client.metrics, interaction, "ms_button")
+        self.logger.info("Finished request for %s with %s %s %s %s (Result: %s)", interaction.user, self.subject.short_subjectID,
+                         self.year, self.season, self.paper_id, 'Success' if ms_file else 'Failed')
+
+SEASON_NAMES = {
+    "jun": "May/June",
+    "nov": "October/November",
+    "march": "February/March",
+}
+
+def _autocomplete_filters(interaction: Interaction, exclude: str):
+    """Read the already-filled options of /qp or /ms, ignoring the one being typed and invalid values."""
+    ns = interaction.namespace
+    subj = BestExamHelpIO().get_subject(ns.subject) if ns.subject else None
+    if subj is None:
+        return None, {}
+    filters = {}
+    catalog = BestExamHelpIO.catalog()
+    if exclude != "year" and isinstance(ns.year, int) and ns.year in subj.years:
+        filters["year"] = ns.year
+    if exclude != "season" and isinstance(ns.season, str) and ns.season.lower() in subj.seasons:
+        filters["season"] = subj.seasons[ns.season.lower()]
+    if exclude != "paper_id" and isinstance(ns.paper_id, int) and ns.paper_id != -1:
+        filters["paper_id"] = ns.paper_id
+    # Drop filters that match nothing (e.g. a half-typed paper ID) rather than suggesting nothing
+    while filters and not any(catalog.facet(subj, **filters)):
+        filters.popitem()
+    return subj, filters
+
+async def year_autocomplete(interaction: Interaction, current: str) -> List[Choice[int]]:
+    subj, filters = _autocomplete_filters(interaction, "year")
+    if subj is None:
+        return []
+    years = BestExamHelpIO.catalog().facet(subj, **filters)[0]
+    choices_ = [Choice(name=str(y), value=y) for y in reversed(years) if str(y).startswith(current)]
+    if interaction.command.name == "qp" and not current:
+        choices_.insert(0, Choice(name="Random", value=-1))
+    return choices_[:25]
+
+async def season_autocomplete(interaction: Interaction, current: str) -> List[Choice[str]]:
+    subj, filters = _autocomplete_filters(interaction, "season")
+    if subj is None:
+        return []
+    codes = BestExamHelpIO.catalog().facet(subj, **filters)[1]
+    current = current.lower()
+    choices_ = [Choice(name=SEASON_NAMES.get(name, name), value=name)
+                for name, code in subj.seasons.items()
+                if code in codes and current in SEASON_NAMES.get(name, name).lower()]
+    if interaction.command.name == "qp" and not current:
+        choices_.insert(0, Choice(name="Random", value="random"))
+    return choices_[:25]
+
+async def paper_id_autocomplete(interaction: Interaction, current: str) -> List[Choice[int]]:
+    subj, filters = _autocomplete_filters(interaction, "paper_id")
+    if subj is None:
+        return []
+    papers = BestExamHelpIO.catalog().facet(subj, **filters)[2]
+    choices_ = [Choice(name=str(p), value=p) for p in papers if str(p).startswith(current)]
+    if interaction.command.name == "qp" and not current:
+        choices_.insert(0, Choice(name="Random", value=-1))
+    return choices_[:25]
 
 class PaperUtils(Cog):
+    RANDOM_DRAWS = 32
+
     def __init__(self, bot: PPBdpy):
         self.bot = bot
         self.setup_log()
-        
+        self.disk_cache = DiskPaperCache(bot.const.PAPER_CACHE_DIR, bot.const.PAPER_CACHE_MAX_BYTES)
+        self.hot_cache = HotBytesCache(bot.const.PAPER_MEMORY_CACHE_MAX_BYTES)
+        self.guards = UpstreamGuards(
+            rate=bot.const.UPSTREAM_RATE,
+            burst=bot.const.UPSTREAM_BURST,
+            max_concurrency=bot.const.UPSTREAM_MAX_CONCURRENCY,
+            retries=bot.const.UPSTREAM_RETRIES,
+            backoff_base=bot.const.UPSTREAM_BACKOFF_BASE,
+            backoff_max=bot.const.UPSTREAM_BACKOFF_MAX,
+            failure_threshold=bot.const.UPSTREAM_BREAKER_THRESHOLD,
+            reset_timeout=bot.const.UPSTREAM_BREAKER_RESET,
+        )
+        # Probes get their own limiter and breaker: the sweep must not starve live fetches or trip their circuit
+        self.probe_guards = UpstreamGuards(
+            rate=bot.const.PAPER_PROBE_RATE,
+            burst=1,
+            max_concurrency=bot.const.PAPER_PROBE_CONCURRENCY,
+            retries=0,
+            failure_threshold=bot.const.UPSTREAM_BREAKER_THRESHOLD,
+            reset_timeout=bot.const.UPSTREAM_BREAKER_RESET,
+        )
+        self.existence = ExistenceIndex(bot.http_pool, LazyCollection(bot, "paper_index"),
+                                        negative_ttl=bot.const.PAPER_NEGATIVE_TTL, guards=self.probe_guards)
+        self.router = ProviderRouter(self.build_providers(), hedge_delay=bot.const.PAPER_HEDGE_DELAY)
+        self.fetcher = PaperFetcher(bot.http_pool, self.disk_cache, self.hot_cache,
+                                    fresh_seconds=bot.const.PAPER_FRESH_SECONDS,
+                                    recent_fresh_seconds=bot.const.PAPER_RECENT_FRESH_SECONDS,
+                                    existence=self.existence,
+                                    max_bytes=bot.const.PAPER_MAX_DOWNLOAD_BYTES,
+                                    guards=self.guards,
+                                    router=self.router)
+        self.prefetcher = Prefetcher(self.fetcher, concurrency=bot.const.PAPER_PREFETCH_CONCURRENCY)
+        self.attachments = AttachmentRegistry(bot, bot.http_pool, LazyCollection(bot, "paper_attachments"))
+        self.popularity = PopularityTracker(half_life=bot.const.PAPER_POPULARITY_HALF_LIFE_HOURS * 3600,
+                                            collection=LazyCollection(bot, "paper_popularity"))
+        self.warmer = CacheWarmer(self.fetcher, self.popularity, BestExamHelpIO().link_for_key,
+                                  concurrency=bot.const.PAPER_WARM_CONCURRENCY,
+                                  bytes_per_second=bot.const.PAPER_WARM_BYTES_PER_SECOND)
+        self.text_index = TextIndex(bot.const.PAPER_INDEX_DIR, workers=bot.const.PAPER_INDEX_WORKERS)
+        self.probe_existence.change_interval(hours=bot.const.PAPER_PROBE_INTERVAL_HOURS)
+        self.index_papers.change_interval(minutes=bot.const.PAPER_INDEX_INTERVAL_MINUTES)
+        self.warm_caches.change_interval(minutes=bot.const.PAPER_WARM_INTERVAL_MINUTES)
+
+    def build_providers(self) -> List[PaperProvider]:
+        """bestexamhelp.com plus the mirrors (PAPER_MIRRORS, `name=url_template` pairs separated by commas) and local directory."""
+        providers = []
+        if self.bot.const.PAPER_LOCAL_DIR:
+            providers.append(LocalDirectoryProvider("local", self.bot.const.PAPER_LOCAL_DIR))
+        providers.append(BestExamHelpIO().provider(self.bot.http_pool, self.guards))
+        for entry in filter(None, (m.strip() for m in self.bot.const.PAPER_MIRRORS.split(","))):
+            name, _, template = entry.partition("=")
+            providers.append(TemplateHTTPProvider(name.strip(), self.bot.http_pool, template.strip(),
+                                                  BestExamHelpIO().full_subject_ids(), guards=self.guards))
+        self.logger.info(f"Paper providers: {', '.join(p.name for p in providers)}")
+        return providers
+
+    async def cog_load(self):
+        catalog = BestExamHelpIO.catalog()
+        self.logger.info(f"Paper catalog ready: {len(catalog)} papers")
+        await self.disk_cache.load()
+        await self.text_index.load()
+        if self.bot.const.PAPER_REUSE_ATTACHMENTS:
+            # Its own startup hook, not tied to any loop; the database is only touched once the bot is ready
+            self.attachments.writes.spawn(self.load_attachments())
+        self.probe_existence.start()
+        self.prefetcher.start()
+        self.warm_caches.start()
+        self.index_papers.start()
+        self.bot.metrics.add_collector("papers", self.snapshot)
+
+    async def cog_unload(self):
+        self.bot.metrics.remove_collector("papers")
+        self.probe_existence.cancel()
+        self.warm_caches.cancel()
+        self.index_papers.cancel()
+        await self.prefetcher.stop()
+        await self.popularity.save()
+        await self.existence.writes.drain()
+        await self.attachments.writes.drain()
+        self.text_index.close()
+
+    def snapshot(self) -> dict:
+        data = self.fetcher.snapshot()
+        data.update(
+            prefetch=self.prefetcher.snapshot(),
+            warming=self.warmer.snapshot(),
+            attachments=self.attachments.snapshot(),
+            probe_upstream=self.probe_guards.snapshot(),
+            text_index=self.text_index.snapshot(),
+        )
+        return data
+
+    def _probe_items(self):
+        """(key, link) for every QP and MS in the catalog, newest sessions first."""
+        papers = sorted(BestExamHelpIO.catalog().enumerate(), key=lambda p: p[1], reverse=True)
+        for subj, year, season, paper_id in papers:
+            for doctype in ("qp", "ms"):
+                yield (BestExamHelpIO().paper_key(subj, year, season, doctype, paper_id),
+                       BestExamHelpIO().construct_link(subj, year, season, doctype, paper_id))
+
+    @tasks.loop(hours=24)
+    async def probe_existence(self):
+        sent = await self.existence.probe_all(self._probe_items(), concurrency=self.bot.const.PAPER_PROBE_CONCURRENCY)
+        self.logger.info(f"Existence probe finished: {sent} probes sent, {self.existence.snapshot()}")
+
+    @probe_existence.before_loop
+    async def before_probe_existence(self):
+        await self.bot.wait_until_ready()
+        await self.existence.load()
+
+    @tasks.loop(minutes=60)
+    async def warm_caches(self):
+        # First iteration runs right after startup, so a restart does not leave the hottest papers cold
+        count = await self.warmer.warm(self.bot.const.PAPER_WARM_TOP_N)
+        await self.popularity.save()
+        self.logger.info(f"Cache warming finished: {count} documents considered, {self.warmer.snapshot()}")
+
+    @warm_caches.before_loop
+    async def before_warm_caches(self):
+        await self.bot.wait_until_ready()
+        await self.popularity.load()
+
+    @tasks.loop(minutes=15)
+    async def index_papers(self):
+        # Everything downloaded since the last run; the index keeps the text even after the PDF is evicted
+        pending = [key for key in self.disk_cache.keys() if key not in self.text_index]
+        if not pending or not self.text_index.available:
+            return
+        added = 0
+        batch_size = self.bot.const.PAPER_INDEX_BATCH
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
+            added += await self.text_index.add([(key, self.disk_cache.path_for(key)) for key in batch])
+        self.logger.info(f"Text indexing finished: {len(pending)} papers, {added} pages added, {self.text_index.snapshot()}")
+
+    @index_papers.before_loop
+    async def before_index_papers(self):
+        await self.bot.wait_until_ready()
+
+    async def load_attachments(self):
+        await self.bot.wait_until_ready()
+        await self.attachments.load()
+
+    async def fetch_document(self, interaction: Interaction, key: PaperKey, link: str) -> FetchResult:
+        """Link the earlier upload of this PDF if it is still available, otherwise fetch it for uploading."""
+        if self.bot.const.PAPER_REUSE_ATTACHMENTS:
+            url = await self.attachments.url_for(key)
+            if url is not None:
+                return FetchResult(key, 200, source="attachment", url=url)
+        return await self.fetcher.fetch(key, link, max_bytes=upload_limit(interaction))
+
+    async def send_document(self, interaction: Interaction, result: FetchResult, content: str, **kwargs):
+        """Send a successful fetch publicly, remembering the attachment of fresh uploads for later reuse."""
+        if result.url is not None:
+            return await interaction.followup.send(content=f"{content}\n[Download {result.filename}]({result.url})",
+                                                   ephemeral=False, **kwargs)
+        message = await interaction.followup.send(content=content, ephemeral=False, file=result.to_file(), **kwargs)
+        self.bot.metrics.inc("discord_upload_bytes_total", result.size or 0)
+        if self.bot.const.PAPER_REUSE_ATTACHMENTS:
+            self.attachments.remember(result.key, message)
+        return message
+
+    def pick_random(self, subj: Subject, **filters) -> Optional[Tuple[Subject, int, str, int]]:
+        """Uniformly pick a question paper, preferring ones confirmed to exist upstream and skipping known misses.
+
+        Rejection sampling: up to `RANDOM_DRAWS` uniform draws are checked against the existence index, so a request
+        costs a few lookups instead of one per candidate. Only if every draw is a known miss are all candidates scanned."""
+        catalog = BestExamHelpIO.catalog()
+        codes = catalog.candidates(subj, **filters)
+        if not codes:
+            return None
+        fallback = None
+        for _ in range(self.RANDOM_DRAWS):
+            picked = catalog.decode(random.choice(codes))
+            exists = self.existence.exists(BestExamHelpIO().paper_key(*picked[:3], "qp", picked[3]))
+            if exists is True:
+                return picked
+            if exists is None and fallback is None:
+                fallback = picked
+        if fallback is not None:
+            return fallback
+        pool = [p for p in map(catalog.decode, codes)
+                if self.existence.exists(BestExamHelpIO().paper_key(*p[:3], "qp", p[3])) is not False]
+        return random.choice(pool) if pool else None
+
     def setup_log(self):
-        paperutils_logger = logging.getLogger("cogs.single.paperutils")
-        paperutils_logger.setLevel(logging.DEBUG)
-        paperutils_logger.addHandler(create_console_handler(logging.INFO))
-        paperutils_logger.addHandler(create_file_handler("./logs/cogs/single/paperutils", "paperutils"))
+        paperutils_logger = setup_logger("cogs.single.paperutils", console_level=logging.INFO, log_dir="./logs/cogs/single/paperutils", file_name="paperutils")
         self.logger = paperutils_logger
     @Cog.listener()
     async def on_ready(self):
@@ -215,84 +649,75 @@ class PaperUtils(Cog):
                       Choice(name='🧮 | Mathematics 9709', value='math'),
                       Choice(name='🧪 | Chemistry 9701', value='chemistry'),
                       Choice(name='🔬 | Physics 9702', value='physics')])
-    @choices(season=[Choice(name='May/June', value='jun'), Choice(name='October/November', value='nov'), Choice(name='February/March', value='march')])
+    @autocomplete(year=year_autocomplete, season=season_autocomplete, paper_id=paper_id_autocomplete)
     @describe(subject="Subject you want to get the past paper for.",
                 year="Year of the past paper (e.g. 2020, leave blank for random year)",
                 season="Season of the past paper (e.g. May/June, October/November, February/March, leave blank for random season)",
                 paper_id="ID of the past paper (e.g. 11, -1 for random paper ID)")
     async def qp(self, interaction: Interaction, subject: str, year: int = -1, season: str = "random", paper_id: int = -1):
-        await interaction.response.defer(ephemeral=False)
-        self.logger.debug(f"Preparing to serve user {interaction.user} with paper {subject} {year} {season} {paper_id}")
+        with self.bot.metrics.timer("command_phase_seconds", command="qp", phase="defer"):
+            await interaction.response.defer(ephemeral=False)
+        self.logger.debug("Preparing to serve user %s with paper %s %s %s %s", interaction.user, subject, year, season, paper_id)
         is_randomized = False
         subj = BestExamHelpIO().get_subject(subject)
         if not isinstance(subj, Subject):
             await interaction.followup.send("Invalid subject selected. Please try again.", ephemeral=True)
             return
-        if year == -1: # Random year
-            year = random.choice(subj.rand_years)
-            is_randomized = True
-        elif year not in subj.years:
+        if year != -1 and year not in subj.years:
             await interaction.followup.send(f"Invalid year selected. Please choose a year between {subj.years.start} and {subj.years.stop - 1}.", ephemeral=True)
             return
-        if season == "random":
-            season = random.choice(list(subj.seasons.keys()))
-            season = subj.seasons[season]
-            is_randomized = True
-        else:
+        if season != "random":
             season = season.lower()
             season = subj.seasons.get(season)
             if not season:
                 await interaction.followup.send("Invalid season selected. Please choose from May/June, October/November, or February/March.", ephemeral=True)
                 return
-        if paper_id == -1:
-            for cond, pps in subj.papers:
-                if year not in cond: continue
-                spps = []
-                if hasattr(subj, 'season_specific_papers'):
-                    if season in subj.season_specific_papers:
-                        for cond_, spps_ in subj.season_specific_papers[season]:
-                            if year not in cond_: continue
-                            spps = spps_
-                paper_id = random.choice(pps + spps)
-                break
-        else:
-            for cond, pps in subj.papers:
-                if year not in cond: continue
-                if paper_id not in pps:
-                    await interaction.followup.send(f"Invalid paper ID selected for the year {year}. Please choose a valid paper ID.", ephemeral=True)
-                    return
-                break
+        catalog = BestExamHelpIO.catalog()
+        if year == -1 or season == "random" or paper_id == -1:
+            # Uniform over every valid paper matching the fields that were given
+            picked = self.pick_random(
+                subj,
+                year=None if year == -1 else year,
+                season=None if season == "random" else season,
+                paper_id=None if paper_id == -1 else paper_id,
+                years=subj.rand_years if year == -1 else None,
+            )
+            if picked is None:
+                await interaction.followup.send("No past paper matches the selected options. Please try different options.", ephemeral=True)
+                return
+            _, year, season, paper_id = picked
+            is_randomized = True
+        elif not catalog.contains(subj, year, season, paper_id):
+            await interaction.followup.send(f"Invalid paper ID selected for the year {year}. Please choose a valid paper ID.", ephemeral=True)
+            return
         link = BestExamHelpIO().construct_link(subj, year, season, "qp", paper_id)
+        key = BestExamHelpIO().paper_key(subj, year, season, "qp", paper_id)
+        self.popularity.record(key)
         msg = await interaction.followup.send("Attempting to fetch the past paper...", ephemeral=True)
         paper_file = None
         failed = False
         text_response = ""
-        async with aiohttp.ClientSession() as session:
-            try:
-                headers = {
-                    'User-Agent': 'PastPaperBot/1.0',
-                    'Accept': 'application/pdf'
-                }
-                self.logger.debug(f"Fetching past paper from {link}")
-                async with session.get(link, headers=headers) as response:
-                    filename = link.split('/')[-1]
-                    if response.status == 304 or response.status in range(200, 300):
-                        self.logger.debug(f"Successfully fetched past paper from {link} with status {response.status}")
-                        self.logger.debug(f"Attempting to create file content for {response.url}")
-                        file_content = await response.read()
-                        file_bytes = BytesIO(file_content)
-                        paper_file = dFile(file_bytes, filename=filename)
-                        self.logger.debug(f"Paper file created: {filename}, size: {len(file_content)} bytes")
-                        text_response = f"Here's your {'random ' if is_randomized else ''}past paper: (**{filename}**)"
-                    else:
-                        # Any other status code is an error
-                        self.logger.error(f"Failed to fetch past paper, status code: {response.status}")
-                        text_response = f"Failed to fetch the past paper. Status code: {response.status}"
-                        failed = True
-            except Exception as e:
-                self.logger.error(f"Error fetching past paper: {e.__class__.__name__}")
-                text_response = f"An error occurred while fetching the past paper: {str(e)}"
+        try:
+            self.logger.debug("Fetching past paper from %s", link)
+            with self.bot.metrics.timer("command_phase_seconds", command="qp", phase="fetch"):
+                result = await self.fetch_document(interaction, key, link)
+            filename = result.filename
+            if result.ok:
+                self.logger.debug("Successfully fetched past paper from %s with status %s (source: %s)", link, result.status, result.source)
+                paper_file = result
+                self.logger.debug("Paper file created: %s, size: %s bytes", filename, result.size)
+                text_response = f"Here's your {'random ' if is_randomized else ''}past paper: (**{filename}**)"
+            elif result.too_large:
+                text_response = too_large_response(result, link, "past paper")
+            else:
+                # Any other status code is an error
+                self.logger.error("Failed to fetch past paper, status code: %s", result.status)
+                text_response = f"Failed to fetch the past paper. Status code: {result.status}"
                 failed = True
+        except Exception as e:
+            self.logger.error("Error fetching past paper: %s", e.__class__.__name__)
+            text_response = f"An error occurred while fetching the past paper: {str(e)}"
+            failed = True
         if failed:
             await msg.edit(content=text_response)
         elif paper_file is None:
@@ -300,21 +725,30 @@ class PaperUtils(Cog):
         else:
             view = View()
             view.add_item(GetMSfromQP(subj, year, season, paper_id))
-            await interaction.followup.send(content=text_response, ephemeral=False, file=paper_file, view=view)
-        return self.logger.info(f"Finished request for {interaction.user} with {subject} {year} {season} {paper_id} (Result: {'Success' if paper_file else 'Failed'})")
+            with self.bot.metrics.timer("command_phase_seconds", command="qp", phase="upload"):
+                await self.send_document(interaction, paper_file, content=text_response, view=view)
+            # Many users press "Mark Scheme" next, so warm it while they read
+            ms_key = BestExamHelpIO().paper_key(subj, year, season, "ms", paper_id)
+            if ms_key not in self.attachments:
+                self.prefetcher.schedule(ms_key, BestExamHelpIO().construct_link(subj, year, season, "ms", paper_id),
+                                         max_bytes=upload_limit(interaction))
+        observe_interaction(self.bot.metrics, interaction, "qp")
+        return self.logger.info("Finished request for %s with %s %s %s %s (Result: %s)", interaction.user, subject, year, season, paper_id,
+                                'Success' if paper_file else 'Failed')
     @command(name="ms", description="Get a mark scheme of a specific paper.")
     @choices(subject=[Choice(name='🔢 | Further Mathematics 9231', value='further_math'), 
                       Choice(name='🧮 | Mathematics 9709', value='math'),
                       Choice(name='🧪 | Chemistry 9701', value='chemistry'),
                       Choice(name='🔬 | Physics 9702', value='physics')])
-    @choices(season=[Choice(name='May/June', value='jun'), Choice(name='October/November', value='nov'), Choice(name='February/March', value='march')])
+    @autocomplete(year=year_autocomplete, season=season_autocomplete, paper_id=paper_id_autocomplete)
     @describe(subject="Subject you want to get the mark scheme for.",
               year="Year of the past paper (e.g. 2020)",
               season="Season of the past paper (e.g. May/June)",
               paper_id="ID of the past paper (e.g. 11)")
     async def ms(self, interaction: Interaction, subject: str, year: int, season: str, paper_id: int):
-        await interaction.response.defer(ephemeral=False)
-        self.logger.debug(f"Preparing to serve user {interaction.user} with mark scheme {subject} {year} {season} {paper_id}")
+        with self.bot.metrics.timer("command_phase_seconds", command="ms", phase="defer"):
+            await interaction.response.defer(ephemeral=False)
+        self.logger.debug("Preparing to serve user %s with mark scheme %s %s %s %s", interaction.user, subject, year, season, paper_id)
         subj = BestExamHelpIO().get_subject(subject)
         if not isinstance(subj, Subject):
             await interaction.followup.send("Invalid subject selected. Please try again.", ephemeral=True)
@@ -327,42 +761,208 @@ class PaperUtils(Cog):
         if not season:
             await interaction.followup.send("Invalid season selected. Please choose from May/June, October/November, or February/March.", ephemeral=True)
             return
-        if paper_id not in [p for cond, pps in subj.papers for p in pps if year in cond]:
+        if not BestExamHelpIO.catalog().contains(subj, year, season, paper_id):
             await interaction.followup.send(f"Invalid paper ID selected for the year {year}. Please choose a valid paper ID.", ephemeral=True)
             return
         link = BestExamHelpIO().construct_link(subj, year, season, "ms", paper_id)
+        key = BestExamHelpIO().paper_key(subj, year, season, "ms", paper_id)
+        self.popularity.record(key)
         msg = await interaction.followup.send("Attempting to fetch the mark scheme...", ephemeral=True)
         ms_file = None
         failed = False
         text_response = ""
-        async with aiohttp.ClientSession() as session:
-            try:
-                headers = {
-                    'User-Agent': 'PastPaperBot/1.0',
-                    'Accept': 'application/pdf'
-                }
-                self.logger.debug(f"Fetching mark scheme from {link}")
-                async with session.get(link, headers=headers) as response:
-                    filename = link.split('/')[-1]
-                    if response.status == 304 or response.status in range(200, 300):
-                        self.logger.debug(f"Successfully fetched mark scheme from {link} with status {response.status}")
-                        self.logger.debug(f"Attempting to create file content for {response.url}")
-                        file_content = await response.read()
-                        file_bytes = BytesIO(file_content)
-                        ms_file = dFile(file_bytes, filename=filename)
-                        self.logger.debug(f"Mark scheme file created: {filename}, size: {len(file_content)} bytes")
-                        text_response = f"Here's your mark scheme: (**{filename}**)"
-            except Exception as e:
-                self.logger.error(f"Error fetching mark scheme: {e.__class__.__name__}")
-                text_response = f"An error occurred while fetching the mark scheme: {str(e)}"
+        try:
+            self.logger.debug("Fetching mark scheme from %s", link)
+            with self.bot.metrics.timer("command_phase_seconds", command="ms", phase="fetch"):
+                result = await self.fetch_document(interaction, key, link)
+            self.prefetcher.record_request(key, result)
+            filename = result.filename
+            if result.ok:
+                self.logger.debug("Successfully fetched mark scheme from %s with status %s (source: %s)", link, result.status, result.source)
+                ms_file = result
+                self.logger.debug("Mark scheme file created: %s, size: %s bytes", filename, result.size)
+                text_response = f"Here's your mark scheme: (**{filename}**)"
+            elif result.too_large:
+                text_response = too_large_response(result, link, "mark scheme")
+            else:
+                self.logger.error("Failed to fetch mark scheme, status code: %s", result.status)
+                text_response = f"Failed to fetch the mark scheme. Status code: {result.status}"
                 failed = True
+        except Exception as e:
+            self.logger.error("Error fetching mark scheme: %s", e.__class__.__name__)
+            text_response = f"An error occurred while fetching the mark scheme: {str(e)}"
+            failed = True
         if failed:
             await msg.edit(content=text_response)
         elif ms_file is None:
             await interaction.followup.send(content=text_response, ephemeral=False)
         else:
-            await interaction.followup.send(content=text_response, ephemeral=False, file=ms_file)
-        return self.logger.info(f"Finished request for {interaction.user} with {subject} {year} {season} {paper_id} (Result: {'Success' if ms_file else 'Failed'})")
+            with self.bot.metrics.timer("command_phase_seconds", command="ms", phase="upload"):
+                await self.send_document(interaction, ms_file, content=text_response)
+        observe_interaction(self.bot.metrics, interaction, "ms")
+        return self.logger.info("Finished request for %s with %s %s %s %s (Result: %s)", interaction.user, subject, year, season, paper_id,
+                                'Success' if ms_file else 'Failed')
+    @command(name="pack", description="Get many past papers (and mark schemes) at once as a ZIP archive.")
+    @choices(subject=[Choice(name='🔢 | Further Mathematics 9231', value='further_math'), 
+                      Choice(name='🧮 | Mathematics 9709', value='math'),
+                      Choice(name='🧪 | Chemistry 9701', value='chemistry'),
+                      Choice(name='🔬 | Physics 9702', value='physics')])
+    @autocomplete(season=season_autocomplete)
+    @describe(subject="Subject you want the papers for.",
+              year_from="First year to include (e.g. 2019, leave blank for the earliest)",
+              year_to="Last year to include (e.g. 2023, leave blank for the latest)",
+              season="Only include this season (leave blank for all seasons)",
+              component="Only include this paper component (e.g. 3 for Paper 3, leave blank for all)",
+              mark_schemes="Also include the mark schemes (default: yes)")
+    async def pack(self, interaction: Interaction, subject: str, year_from: int = -1, year_to: int = -1,
+                   season: str = "all", component: int = -1, mark_schemes: bool = True):
+        with self.bot.metrics.timer("command_phase_seconds", command="pack", phase="defer"):
+            await interaction.response.defer(ephemeral=False)
+        self.logger.debug("Preparing to serve user %s with pack %s %s-%s %s P%s", interaction.user, subject, year_from, year_to, season, component)
+        subj = BestExamHelpIO().get_subject(subject)
+        if not isinstance(subj, Subject):
+            await interaction.followup.send("Invalid subject selected. Please try again.", ephemeral=True)
+            return
+        first = subj.years.start if year_from == -1 else year_from
+        last = subj.years.stop - 1 if year_to == -1 else year_to
+        season_code = None
+        if season != "all":
+            season_code = subj.seasons.get(season.lower())
+            if not season_code:
+                await interaction.followup.send("Invalid season selected. Please choose from May/June, October/November, or February/March.", ephemeral=True)
+                return
+        papers = [
+            p for p in BestExamHelpIO.catalog().enumerate(subj, season=season_code, years=range(first, last + 1))
+            if component == -1 or p[3] // 10 == component
+        ]
+        # Confirmed misses would only produce errors
+        papers = [p for p in papers if self.existence.exists(BestExamHelpIO().paper_key(p[0], p[1], p[2], "qp", p[3])) is not False]
+        if not papers:
+            await interaction.followup.send("No past papers match the selected options. Please try different options.", ephemeral=True)
+            return
+        max_papers = self.bot.const.PAPER_PACK_MAX_PAPERS
+        if len(papers) > max_papers:
+            await interaction.followup.send(f"That matches {len(papers)} papers; please narrow it down to at most {max_papers} (e.g. fewer years or a single component).", ephemeral=True)
+            return
+        doctypes = ("qp", "ms") if mark_schemes else ("qp",)
+        docs = [(BestExamHelpIO().paper_key(s_, y, se, d, p), BestExamHelpIO().construct_link(s_, y, se, d, p))
+                for s_, y, se, p in papers for d in doctypes]
+        msg = await interaction.followup.send(f"Fetching {len(docs)} documents...", ephemeral=True)
+        limit = upload_limit(interaction)
+        with self.bot.metrics.timer("command_phase_seconds", command="pack", phase="build"):
+            parts, skipped = await self._build_pack(interaction, msg, subj, docs, limit)
+        summary = f"Done: {len(docs) - len(skipped)}/{len(docs)} documents in {parts} archive(s)."
+        if skipped:
+            summary += "\nCould not include: " + ", ".join(skipped[:20]) + (" ..." if len(skipped) > 20 else "")
+        await msg.edit(content=summary)
+        observe_interaction(self.bot.metrics, interaction, "pack")
+        return self.logger.info("Finished request for %s with pack %s %s-%s %s P%s (Result: %s parts, %s skipped)", interaction.user,
+                                subject, first, last, season, component, parts, len(skipped))
+
+    async def _build_pack(self, interaction: Interaction, msg, subj: Subject, docs: list, limit: int) -> Tuple[int, List[str]]:
+        """Fetch `docs` concurrently and stream them into ZIP archives no larger than `limit`, uploading each part when full.
+
+        A slot is held from the start of a fetch until its PDF is written, so at most `concurrency` PDFs wait in memory."""
+        # Local-file-header + central-directory overhead per entry, with room for long names
+        entry_overhead = 256
+        slots = asyncio.Semaphore(self.bot.const.PAPER_PACK_CONCURRENCY)
+        async def fetch(key: PaperKey, link: str):
+            await slots.acquire()
+            try:
+                return key, await self.fetcher.fetch(key, link, max_bytes=limit - entry_overhead * 2)
+            except Exception as e:
+                self.logger.error("Error fetching %s for pack: %s", key.filename, e.__class__.__name__)
+                return key, None
+        tasks_ = [asyncio.create_task(fetch(key, link)) for key, link in docs]
+        skipped = []
+        parts = 0
+        archive = None
+        done = 0
+        last_progress = time.monotonic()
+
+        async def flush():
+            nonlocal archive, parts
+            fp, zf = archive
+            archive = None
+            await asyncio.to_thread(zf.close)
+            fp.seek(0)
+            parts += 1
+            await interaction.followup.send(content=f"Pack part {parts}", file=dFile(fp, filename=f"{subj.short_subjectID}_pack_{parts}.zip"))
+            fp.close()
+
+        try:
+            for next_done in asyncio.as_completed(tasks_):
+                key, result = await next_done
+                try:
+                    if result is None or not result.ok:
+                        skipped.append(key.filename)
+                        continue
+                    size = result.size or 0
+                    if archive is not None and archive[0].tell() + size + entry_overhead * 2 > limit:
+                        await flush()
+                    if archive is None:
+                        fp = tempfile.SpooledTemporaryFile(max_size=8 * 1024**2)
+                        archive = (fp, zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_STORED))
+                    # PDFs are already compressed, so entries are stored as-is
+                    try:
+                        await asyncio.to_thread(self._zip_add, archive[1], result)
+                    except (OSError, ValueError, zipfile.BadZipFile) as e:
+                        # e.g. the cached file was evicted between the fetch and now: skip it like a failed fetch
+                        self.logger.error("Error adding %s to pack: %s: %s", key.filename, e.__class__.__name__, e)
+                        skipped.append(key.filename)
+                finally:
+                    slots.release()
+                    done += 1
+                    del result
+                if time.monotonic() - last_progress > 2:
+                    last_progress = time.monotonic()
+                    await msg.edit(content=f"Fetched {done}/{len(docs)} documents, {parts} archive(s) sent so far...")
+            if archive is not None:
+                await flush()
+        finally:
+            for task in tasks_:
+                task.cancel()
+            if archive is not None:
+                archive[1].close()
+                archive[0].close()
+        return parts, skipped
+
+    @staticmethod
+    def _zip_add(zf: zipfile.ZipFile, result: FetchResult):
+        if result.path is not None:
+            zf.write(result.path, arcname=result.filename)
+        else:
+            zf.writestr(result.filename, result.data)
+
+    @command(name="search", description="Search the text of past papers and mark schemes.")
+    @choices(subject=[Choice(name='🔢 | Further Mathematics 9231', value='further_math'), 
+                      Choice(name='🧮 | Mathematics 9709', value='math'),
+                      Choice(name='🧪 | Chemistry 9701', value='chemistry'),
+                      Choice(name='🔬 | Physics 9702', value='physics')],
+             doctype=[Choice(name='Question papers', value='qp'),
+                      Choice(name='Mark schemes', value='ms')])
+    @describe(query="Words or a phrase to look for (e.g. moment of inertia)",
+              subject="Only search this subject (leave blank for all subjects)",
+              doctype="Only search question papers or mark schemes (leave blank for both)")
+    async def search(self, interaction: Interaction, query: str, subject: str = None, doctype: str = None):
+        with self.bot.metrics.timer("command_phase_seconds", command="search", phase="defer"):
+            await interaction.response.defer(ephemeral=False)
+        self.logger.debug("Preparing to serve user %s with search %r %s %s", interaction.user, query, subject, doctype)
+        subj = BestExamHelpIO().get_subject(subject) if subject else None
+        if subject and not isinstance(subj, Subject):
+            await interaction.followup.send("Invalid subject selected. Please try again.", ephemeral=True)
+            return
+        with self.bot.metrics.timer("command_phase_seconds", command="search", phase="query"):
+            hits = await self.text_index.search(query, limit=10, subject=subj.short_subjectID if subj else None, doctype=doctype)
+        if not hits:
+            text_response = f"No past papers mention **{query}** yet. Only papers the bot has already served are searchable."
+        else:
+            lines = [f"{i}. **{hit.key.filename}**, page {hit.page}" for i, hit in enumerate(hits, start=1)]
+            text_response = f"Results for **{query}**:\n" + "\n".join(lines)
+        await interaction.followup.send(content=text_response[:2000])
+        observe_interaction(self.bot.metrics, interaction, "search")
+        return self.logger.info("Finished request for %s with search %r (Result: %s hits)", interaction.user, query, len(hits))
+
 async def setup(bot: PPBdpy):
     # Register the dynamic button for persistence between restarts
     bot.add_dynamic_items(GetMSfromQP)
@@ -1,8 +1,13 @@
+import atexit
+import copy
 import logging
 import os
+import queue
+import threading
 from logging import Formatter
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
+from typing import Dict, List, Optional
 class CustomFormatter(logging.Formatter):
 
     LEVEL_COLOURS = [
@@ -48,9 +53,8 @@ class CustomFormatter(logging.Formatter):
 class FileFormatter(Formatter):
     log_format = "[%(asctime)s] [%(name)s] [%(levelname)s] [%(module)s:%(funcName)s:%(lineno)d] %(message)s"
 
-    def format(self, record):
-        formatter = Formatter(fmt=self.log_format, datefmt='%Y-%m-%d %H:%M:%S')
-        return formatter.format(record)
+    def __init__(self):
+        super().__init__(fmt=self.log_format, datefmt='%Y-%m-%d %H:%M:%S')
 
 
 
@@ -71,18 +75,72 @@ def create_console_handler(level=logging.DEBUG):
     return console_handler
 
 
+# --- Queue-based setup ---
+# Loggers only enqueue records; one listener thread formats them and does the console/file I/O,
+# so logging never blocks the event loop. Each logger's handlers are kept in `_routes`.
+
+_queue = queue.SimpleQueue()
+_routes: Dict[str, List[logging.Handler]] = {}
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+class RoutedQueueHandler(QueueHandler):
+    def __init__(self, log_queue, route: str):
+        super().__init__(log_queue)
+        self.route = route
+
+    def prepare(self, record):
+        # Merge the arguments now, as they may change later; formatting and tracebacks are left to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.route = self.route
+        return record
+
+class RouteDispatcher(logging.Handler):
+    """Runs on the listener thread and passes each record to the handlers of the logger that queued it."""
+    def handle(self, record):
+        for handler in _routes.get(record.route, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+def setup_logger(name, level=logging.DEBUG, console_level=logging.DEBUG, log_dir="./logs", file_name=None):
+    """Give logger `name` a console handler and a daily file handler, fed through the background listener.
+
+    Idempotent: calling it again for the same name (e.g. when a cog is reloaded) adds no handlers."""
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    global _listener
+    with _lock:
+        if name in _routes:
+            return logger
+        _routes[name] = [create_console_handler(console_level), create_file_handler(log_dir, file_name or name)]
+        logger.addHandler(RoutedQueueHandler(_queue, name))
+        if _listener is None:
+            _listener = QueueListener(_queue, RouteDispatcher())
+            _listener.start()
+            atexit.register(stop_logging)
+    return logger
+
+def stop_logging():
+    """Write out everything still queued and stop the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+    for handlers in _routes.values():
+        for handler in handlers:
+            handler.flush()
+
 if __name__ == "__main__":
     
-    bot_logger = logging.getLogger("bot")
-    bot_logger.setLevel(logging.DEBUG)
-    bot_logger.addHandler(create_console_handler())  
-    bot_logger.addHandler(create_file_handler("./logs", "internal"))  
+    bot_logger = setup_logger("bot", log_dir="./logs", file_name="internal")
 
     
-    pull_logger = logging.getLogger("pull")
-    pull_logger.setLevel(logging.DEBUG)
-    pull_logger.addHandler(create_console_handler(logging.INFO))  
-    pull_logger.addHandler(create_file_handler("./logs/cogs/single/pull", "pull"))  
+    pull_logger = setup_logger("pull", console_level=logging.INFO, log_dir="./logs/cogs/single/pull", file_name="pull")
 
     bot_logger.debug("This is a DEBUG message from bot.")
     bot_logger.info("This is an INFO message from bot.")
@@ -1,17 +1,20 @@
 """
 ENTRYPOINT FILE
 """
-
-from discord.ext.commands import Bot
+import time; _started = time.perf_counter()
+from discord.ext.commands import Bot, AutoShardedBot
 from discord.ext.commands import when_mentioned_or
 from discord.app_commands import CommandTree
-from discord import Intents
-import os, json
+from discord import Intents, MemberCacheFlags
+import os, sys, json, asyncio
+import psutil
 from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient
 # File imports
-import logging; from logger import create_console_handler, create_file_handler
-from google import genai
+import logging; from logger import setup_logger
+from utils.http import HTTPPool
+from utils.metrics import metrics
+from utils.startup import StartupProfile, CommandSync, discover_extensions
+# motor and google.genai are slow to import; they are imported when the clients are first used
 
 class Constants:
     BOT_TOKEN: str
@@ -20,7 +23,74 @@ class Constants:
     #CLIENT_ID: str
     #CLIENT_SECRET: str
     MONGO_URI: str
+    MONGO_DB_NAME: str
     GEMINI_API_KEY: str
+    # HTTP pool
+    HTTP_POOL_LIMIT: int
+    HTTP_POOL_LIMIT_PER_HOST: int
+    HTTP_DNS_TTL: int
+    HTTP_KEEPALIVE_TIMEOUT: float
+    HTTP_TOTAL_TIMEOUT: float
+    HTTP_CONNECT_TIMEOUT: float
+    HTTP_READ_TIMEOUT: float
+    # Paper providers
+    PAPER_MIRRORS: str
+    PAPER_LOCAL_DIR: str
+    PAPER_HEDGE_DELAY: float
+    # Upstream guard
+    UPSTREAM_RATE: float
+    UPSTREAM_BURST: int
+    UPSTREAM_MAX_CONCURRENCY: int
+    UPSTREAM_RETRIES: int
+    UPSTREAM_BACKOFF_BASE: float
+    UPSTREAM_BACKOFF_MAX: float
+    UPSTREAM_BREAKER_THRESHOLD: int
+    UPSTREAM_BREAKER_RESET: float
+    # Paper cache
+    PAPER_CACHE_DIR: str
+    PAPER_CACHE_MAX_BYTES: int
+    PAPER_MEMORY_CACHE_MAX_BYTES: int
+    PAPER_MAX_DOWNLOAD_BYTES: int
+    PAPER_FRESH_SECONDS: float
+    PAPER_RECENT_FRESH_SECONDS: float
+    PAPER_PREFETCH_CONCURRENCY: int
+    PAPER_REUSE_ATTACHMENTS: bool
+    PAPER_PACK_MAX_PAPERS: int
+    PAPER_PACK_CONCURRENCY: int
+    # Text index
+    PAPER_INDEX_DIR: str
+    PAPER_INDEX_WORKERS: int
+    PAPER_INDEX_BATCH: int
+    PAPER_INDEX_INTERVAL_MINUTES: float
+    # Cache warming
+    PAPER_WARM_INTERVAL_MINUTES: float
+    PAPER_WARM_TOP_N: int
+    PAPER_WARM_CONCURRENCY: int
+    PAPER_WARM_BYTES_PER_SECOND: float
+    PAPER_POPULARITY_HALF_LIFE_HOURS: float
+    # AI chat
+    CHAT_STREAM_EDIT_INTERVAL: float
+    CHAT_CACHE_MAX_ENTRIES: int
+    CHAT_CACHE_TTL: float
+    CHAT_MAX_CONCURRENCY: int
+    CHAT_MAX_QUEUE: int
+    CHAT_MAX_QUEUE_PER_USER: int
+    # Existence index
+    PAPER_NEGATIVE_TTL: float
+    PAPER_PROBE_INTERVAL_HOURS: float
+    PAPER_PROBE_CONCURRENCY: int
+    PAPER_PROBE_RATE: float
+    # Metrics
+    METRICS_HOST: str
+    METRICS_PORT: int
+    # Gateway
+    LOW_MEMORY: bool
+    MAX_MESSAGES: int
+    SHARD_COUNT: int
+    # Startup
+    COMMAND_SYNC: str
+    COMMAND_SYNC_HASH_FILE: str
+    STARTUP_PROFILE: bool
 
 class ExampleCommandTree(CommandTree):
     async def interaction_check(self, interaction):
@@ -30,12 +100,18 @@ class PPBdpy(Bot):
     def __init__(self):
         self.load_constant()
         super().__init__(
-            intents=Intents.all(),
             command_prefix=when_mentioned_or(self.const.BOT_PREFIX),
             owner_ids=json.loads(self.const.BOT_OWNER_IDS),
-            tree_cls=ExampleCommandTree
+            tree_cls=ExampleCommandTree,
+            **self.client_options()
         )
         self.setup_log()
+        self.metrics = metrics
+        self.metrics.add_collector("bot", self.snapshot)
+        self.profile = StartupProfile(_started)
+        self.profile.mark("imports", time.perf_counter() - _started)
+        self._db = None
+        self._gemini = None
     def load_constant(self):
         self.const = Constants()
         # Bot Constants
@@ -46,43 +122,178 @@ class PPBdpy(Bot):
         #self.const.CLIENT_SECRET = os.getenv('CLIENT_SECRET')
         # API Constants
         self.const.MONGO_URI = os.getenv('MONGO_URI')
+        self.const.MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'pastpaperbot')
         self.const.GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+        # HTTP Pool Constants
+        self.const.HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+        self.const.HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 10))
+        self.const.HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', 300))
+        self.const.HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+        self.const.HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', 60))
+        self.const.HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+        self.const.HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+        # Paper Provider Constants
+        self.const.PAPER_MIRRORS = os.getenv('PAPER_MIRRORS', '')
+        self.const.PAPER_LOCAL_DIR = os.getenv('PAPER_LOCAL_DIR', '')
+        self.const.PAPER_HEDGE_DELAY = float(os.getenv('PAPER_HEDGE_DELAY', 0.75))
+        # Upstream Guard Constants
+        self.const.UPSTREAM_RATE = float(os.getenv('UPSTREAM_RATE', 5))
+        self.const.UPSTREAM_BURST = int(os.getenv('UPSTREAM_BURST', 10))
+        self.const.UPSTREAM_MAX_CONCURRENCY = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', 8))
+        self.const.UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', 2))
+        self.const.UPSTREAM_BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', 0.5))
+        self.const.UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', 5))
+        self.const.UPSTREAM_BREAKER_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', 5))
+        self.const.UPSTREAM_BREAKER_RESET = float(os.getenv('UPSTREAM_BREAKER_RESET', 30))
+        # Paper Cache Constants
+        self.const.PAPER_CACHE_DIR = os.getenv('PAPER_CACHE_DIR', './cache/papers')
+        self.const.PAPER_CACHE_MAX_BYTES = int(os.getenv('PAPER_CACHE_MAX_BYTES', 2 * 1024**3))
+        self.const.PAPER_MEMORY_CACHE_MAX_BYTES = int(os.getenv('PAPER_MEMORY_CACHE_MAX_BYTES', 256 * 1024**2))
+        self.const.PAPER_MAX_DOWNLOAD_BYTES = int(os.getenv('PAPER_MAX_DOWNLOAD_BYTES', 50 * 1024**2))
+        self.const.PAPER_FRESH_SECONDS = float(os.getenv('PAPER_FRESH_SECONDS', 30 * 86400))
+        self.const.PAPER_RECENT_FRESH_SECONDS = float(os.getenv('PAPER_RECENT_FRESH_SECONDS', 86400))
+        self.const.PAPER_PREFETCH_CONCURRENCY = int(os.getenv('PAPER_PREFETCH_CONCURRENCY', 1))
+        self.const.PAPER_REUSE_ATTACHMENTS = os.getenv('PAPER_REUSE_ATTACHMENTS', 'true').lower() in ('1', 'true', 'yes')
+        self.const.PAPER_PACK_MAX_PAPERS = int(os.getenv('PAPER_PACK_MAX_PAPERS', 60))
+        self.const.PAPER_PACK_CONCURRENCY = int(os.getenv('PAPER_PACK_CONCURRENCY', 4))
+        # Text Index Constants
+        self.const.PAPER_INDEX_DIR = os.getenv('PAPER_INDEX_DIR', './cache/index')
+        self.const.PAPER_INDEX_WORKERS = int(os.getenv('PAPER_INDEX_WORKERS', 2))
+        self.const.PAPER_INDEX_BATCH = int(os.getenv('PAPER_INDEX_BATCH', 20))
+        self.const.PAPER_INDEX_INTERVAL_MINUTES = float(os.getenv('PAPER_INDEX_INTERVAL_MINUTES', 15))
+        # Cache Warming Constants
+        self.const.PAPER_WARM_INTERVAL_MINUTES = float(os.getenv('PAPER_WARM_INTERVAL_MINUTES', 60))
+        self.const.PAPER_WARM_TOP_N = int(os.getenv('PAPER_WARM_TOP_N', 50))
+        self.const.PAPER_WARM_CONCURRENCY = int(os.getenv('PAPER_WARM_CONCURRENCY', 2))
+        self.const.PAPER_WARM_BYTES_PER_SECOND = float(os.getenv('PAPER_WARM_BYTES_PER_SECOND', 2 * 1024**2))
+        self.const.PAPER_POPULARITY_HALF_LIFE_HOURS = float(os.getenv('PAPER_POPULARITY_HALF_LIFE_HOURS', 72))
+        # AI Chat Constants
+        self.const.CHAT_STREAM_EDIT_INTERVAL = float(os.getenv('CHAT_STREAM_EDIT_INTERVAL', 1.5))
+        self.const.CHAT_CACHE_MAX_ENTRIES = int(os.getenv('CHAT_CACHE_MAX_ENTRIES', 1024))
+        self.const.CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', 7 * 86400))
+        self.const.CHAT_MAX_CONCURRENCY = int(os.getenv('CHAT_MAX_CONCURRENCY', 4))
+        self.const.CHAT_MAX_QUEUE = int(os.getenv('CHAT_MAX_QUEUE', 50))
+        self.const.CHAT_MAX_QUEUE_PER_USER = int(os.getenv('CHAT_MAX_QUEUE_PER_USER', 2))
+        # Existence Index Constants
+        self.const.PAPER_NEGATIVE_TTL = float(os.getenv('PAPER_NEGATIVE_TTL', 6 * 3600))
+        self.const.PAPER_PROBE_INTERVAL_HOURS = float(os.getenv('PAPER_PROBE_INTERVAL_HOURS', 24))
+        self.const.PAPER_PROBE_CONCURRENCY = int(os.getenv('PAPER_PROBE_CONCURRENCY', 4))
+        self.const.PAPER_PROBE_RATE = float(os.getenv('PAPER_PROBE_RATE', 1))
+        # Metrics Constants
+        self.const.METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+        self.const.METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+        # Gateway Constants
+        self.const.LOW_MEMORY = os.getenv('LOW_MEMORY', 'false').lower() in ('1', 'true', 'yes')
+        self.const.MAX_MESSAGES = int(os.getenv('MAX_MESSAGES', 0 if self.const.LOW_MEMORY else 1000))
+        self.const.SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0))
+        # Startup Constants
+        self.const.COMMAND_SYNC = os.getenv('COMMAND_SYNC', 'auto').lower()
+        self.const.COMMAND_SYNC_HASH_FILE = os.getenv('COMMAND_SYNC_HASH_FILE', './cache/command_tree.hash')
+        self.const.STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', 'false').lower() in ('1', 'true', 'yes')
         
+    def client_options(self) -> dict:
+        """Intents and cache settings. LOW_MEMORY keeps only what slash commands, buttons and prefix commands need:
+        no members or presences (and so no chunking), and no message cache unless MAX_MESSAGES is set."""
+        if not self.const.LOW_MEMORY:
+            return dict(intents=Intents.all(), max_messages=self.const.MAX_MESSAGES or None)
+        # guilds: guild objects for upload limits; messages + content: prefix commands (jishaku, metrics)
+        intents = Intents(guilds=True, guild_messages=True, dm_messages=True, message_content=True)
+        return dict(
+            intents=intents,
+            member_cache_flags=MemberCacheFlags.from_intents(intents),
+            max_messages=self.const.MAX_MESSAGES or None,
+            chunk_guilds_at_startup=False,
+        )
+    def snapshot(self) -> dict:
+        return {
+            "guilds": len(self.guilds),
+            "cached_members": sum(len(guild.members) for guild in self.guilds),
+            "cached_messages": len(self.cached_messages),
+            "rss_bytes": psutil.Process().memory_info().rss,
+        }
     def run(self):
         super().run(self.const.BOT_TOKEN, log_handler=None)
     def setup_log(self):
-        discord_logger = logging.getLogger("discord")
-        discord_logger.setLevel(logging.INFO)
-        discord_logger.addHandler(create_console_handler())
-        discord_logger.addHandler(create_file_handler("./logs", "discord"))
+        setup_logger("discord", level=logging.INFO, log_dir="./logs", file_name="discord")
 
-        bot_logger = logging.getLogger("main")
-        bot_logger.setLevel(logging.DEBUG)
-        bot_logger.addHandler(create_console_handler()) 
-        bot_logger.addHandler(create_file_handler("./logs", "main"))
+        bot_logger = setup_logger("main", log_dir="./logs", file_name="main")
         self.logger = bot_logger
+    @property
+    def db(self):
+        if self._db is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            # Connects in the background on the first operation
+            self._db = AsyncIOMotorClient(self.const.MONGO_URI)
+        return self._db
+    @property
+    def gemini(self):
+        if self._gemini is None:
+            from google import genai
+            self.logger.info(f"Setting up Google AI... Using API key ...{self.const.GEMINI_API_KEY[-3:]}")
+            self._gemini = genai.Client(api_key=self.const.GEMINI_API_KEY).aio
+        return self._gemini
+    async def login(self, token):
+        with self.profile.phase("login"):
+            await super().login(token)
+    async def load_extensions(self, names):
+        """Load extensions concurrently: each one's awaited setup (cog_load) overlaps the others'."""
+        async def load(name):
+            start = time.perf_counter()
+            await self.load_extension(name)
+            self.profile.mark(name, time.perf_counter() - start, depth=1)
+        results = await asyncio.gather(*(load(name) for name in names), return_exceptions=True)
+        failed = [(name, e) for name, e in zip(names, results) if isinstance(e, BaseException)]
+        for name, e in failed:
+            self.logger.error(f"Failed to load extension {name}: {e.__class__.__name__}: {e}", exc_info=e)
+        if failed:
+            raise failed[0][1]
     async def setup_hook(self):
         # --- SETUP LOGGING ---
         self.logger.info("SETTING UP BOT...")
+        # --- SETUP HTTP POOL ---
+        self.logger.info("Starting HTTP pool...")
+        with self.profile.phase("http pool"):
+            self.http_pool = HTTPPool(
+                limit=self.const.HTTP_POOL_LIMIT,
+                limit_per_host=self.const.HTTP_POOL_LIMIT_PER_HOST,
+                dns_ttl=self.const.HTTP_DNS_TTL,
+                keepalive_timeout=self.const.HTTP_KEEPALIVE_TIMEOUT,
+                total_timeout=self.const.HTTP_TOTAL_TIMEOUT,
+                connect_timeout=self.const.HTTP_CONNECT_TIMEOUT,
+                read_timeout=self.const.HTTP_READ_TIMEOUT,
+            )
+            await self.http_pool.start()
         # --- LOAD COGS ---
+        # The database and Gemini clients are created on first use (see `db` and `gemini`)
         self.logger.info("Loading cogs...")
-        for fd in ['single', 'group']:
-            for fn in os.listdir(f"cogs/{fd}"):
-                if fn.endswith(".py") and not fn.startswith("_"):
-                    cog_name = f"cogs.single.{fn[:-3]}"
-                    await self.load_extension(cog_name)
+        with self.profile.phase("extensions"):
+            await self.load_extensions(discover_extensions() + ['jishaku'])
         #await self.load_extension('cogs.events')
-        await self.load_extension('jishaku')
-        # --- PRE-LOAD DATABASE ---
-        self.logger.info("Pre-loading database...")
-        self.db = AsyncIOMotorClient(self.const.MONGO_URI)
-        # --- SETUP API ---
-        self.logger.info("Setting up APIs...")
-        self.logger.info(f"Setting up Google AI... Using API key ...{self.const.GEMINI_API_KEY[-3:]}")
-        self.gemini = genai.Client(api_key=self.const.GEMINI_API_KEY).aio
+        # --- SYNC COMMANDS ---
+        with self.profile.phase("command sync"):
+            try:
+                await CommandSync(self.tree, self.const.COMMAND_SYNC_HASH_FILE, self.const.COMMAND_SYNC).run(self.application_id)
+            except Exception as e:
+                self.logger.error(f"Command sync failed: {e.__class__.__name__}: {e}")
+
+    async def close(self):
+        if hasattr(self, 'http_pool'):
+            await self.http_pool.close()
+        if self._db is not None:
+            self._db.close()
+        await super().close()
 
     async def on_ready(self):
         self.logger.info(f"Bot is ready. {self.user.name} Joined {len(self.guilds)} guilds.")
+        if self.profile.finished:
+            return  # on_ready also fires after reconnects
+        self.profile.finished = True
+        # Whatever is left since the last phase: connecting to the gateway and receiving the guilds
+        self.profile.mark("gateway", self.profile.elapsed() - sum(seconds for _, seconds in self.profile.top_level()))
+        for name, seconds in self.profile.top_level():
+            self.metrics.set("startup_phase_seconds", seconds, phase=name)
+        if self.const.STARTUP_PROFILE:
+            self.logger.info("Startup profile:\n" + self.profile.report())
 
     async def on_command_error(self, context, exception):
         return await super().on_command_error(context, exception)
@@ -91,7 +302,17 @@ class PPBdpy(Bot):
     # on_message
     
 
+class AutoShardedPPBdpy(PPBdpy, AutoShardedBot):
+    """PPBdpy over several gateway shards, for large guild counts. Uses Discord's recommended shard count unless SHARD_COUNT is set."""
+    def client_options(self) -> dict:
+        options = super().client_options()
+        if self.const.SHARD_COUNT:
+            options["shard_count"] = self.const.SHARD_COUNT
+        return options
+
 if __name__ == '__main__':
+    # Cogs import PPBdpy from `main`; point that at this module instead of executing the file a second time
+    sys.modules.setdefault('main', sys.modules[__name__])
     load_dotenv() # testing onli eheheh
-    bot = PPBdpy()
+    bot = AutoShardedPPBdpy() if os.getenv('AUTO_SHARD', 'false').lower() in ('1', 'true', 'yes') else PPBdpy()
     bot.run()
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""Fakes and sample data shared by the test modules."""
+import asyncio
+
+from utils.papercache import PaperKey
+
+KEY = PaperKey("9709", 2020, "s", "qp", 12)
+
+class FakeCollection:
+    """The subset of motor's collection API the components under test use, kept in a dict."""
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query):
+        return self.docs.get(query.get("_id"))
+
+    async def _iter(self):
+        for doc in list(self.docs.values()):
+            yield doc
+
+    def find(self, query=None):
+        return self._iter()
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        doc.update(update.get("$set", {}))
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = dict(doc, _id=query["_id"])
+
+    async def delete_one(self, query):
+        self.docs.pop(query.get("_id"), None)
+
+    async def create_index(self, *args, **kwargs):
+        return "test"
+
+class GatedCollection(FakeCollection):
+    """In-memory collection whose operations block until `release` is set.
+
+    Lets a test check that a caller returned without waiting for MongoDB, with no timing assumptions."""
+    def __init__(self, released: bool = False):
+        super().__init__()
+        self.release = asyncio.Event()
+        if released:
+            self.release.set()
+        self.started = 0
+
+    async def _gate(self):
+        self.started += 1
+        await self.release.wait()
+
+    async def update_one(self, query, update, upsert=False):
+        await self._gate()
+        await super().update_one(query, update, upsert)
+
+    async def replace_one(self, query, doc, upsert=False):
+        await self._gate()
+        await super().replace_one(query, doc, upsert)
+
+    async def delete_one(self, query):
+        await self._gate()
+        await super().delete_one(query)
+
+    async def create_index(self, *args, **kwargs):
+        await self._gate()
+        return await super().create_index(*args, **kwargs)
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from discord import HTTPException
+from discord.utils import utcnow
+
+from cogs.single.ai_chat import MODEL, AIchat, FairScheduler, ResponseCache, SchedulerFull, StreamingReply, close_fence, split_markdown
+from tests.helpers import GatedCollection
+from utils.metrics import Metrics
+
+def test_cache_put_persists_in_the_background():
+    async def main():
+        collection = GatedCollection()
+        cache = ResponseCache(collection)
+        cache.put("model", "What is 2+2?", "4")
+        pending = cache.writes.pending, len(collection.docs)
+        # Served from memory straight away, with a normalised prompt
+        hit = await cache.get("model", "what is 2+2")
+        collection.release.set()
+        await cache.writes.drain()
+        return pending, hit, list(collection.docs.values())
+    pending, hit, docs = asyncio.run(main())
+    assert pending == (1, 0)
+    assert hit == "4"
+    assert docs[0]["response"] == "4" and docs[0]["prompt"] == "what is 2+2"
+
+def test_split_short_text_is_left_alone():
+    assert split_markdown("hello world", 20) == ("hello world", "")
+
+def test_split_cuts_at_paragraph_break():
+    head, rest = split_markdown("first paragraph\n\nsecond paragraph that is long", 30)
+    assert head == "first paragraph\n\n"
+    assert rest == "second paragraph that is long"
+
+def test_split_counts_the_closing_fence_when_text_fits():
+    # Fits as is, but not once the open fence is closed
+    text = "```python\n" + "x = 1\n" * 331 + "y"
+    assert len(text) == 1997 and len(close_fence(text)) > 2000
+    head, rest = split_markdown(text, 2000)
+    assert len(head) <= 2000 and head.endswith("\n```")
+    assert rest.startswith("```python\n")
+    assert head[:-4].rstrip("\n") + "\n" + rest[len("```python\n"):] == text
+
+def test_split_reopens_fence_in_the_rest():
+    text = "intro\n\n```\n" + "line\n" * 30
+    head, rest = split_markdown(text, 60)
+    assert len(head) <= 60 and head.endswith("\n```")
+    assert rest.startswith("```\n")
+
+def test_split_makes_room_for_long_fences():
+    fence = "`" * 20
+    text = f"{fence}\n" + "word " * 100
+    head, rest = split_markdown(text, 100)
+    assert len(head) <= 100 and head.endswith(f"\n{fence}")
+    assert rest.startswith(f"{fence}\n")
+
+def test_split_avoids_the_inside_of_math_blocks():
+    text = "before\n$$\na\n\nb\n$$\n" + "after " * 10
+    head, _ = split_markdown(text, 40)
+    assert head.count("$$") % 2 == 0
+
+class FakeMessage:
+    def __init__(self, sent: list):
+        self.sent = sent
+
+    async def edit(self, content):
+        self.sent[-1] = content
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content, wait=False):
+        self.sent.append(content)
+        return FakeMessage(self.sent)
+
+def test_streaming_reply_never_exceeds_the_limit():
+    async def main():
+        interaction = SimpleNamespace(followup=FakeFollowup())
+        reply = StreamingReply(interaction, edit_interval=0, limit=100)
+        await reply.feed("```\n")
+        for _ in range(40):
+            await reply.feed("code line\n")
+        await reply.finish()
+        return interaction.followup.sent
+    sent = asyncio.run(main())
+    assert len(sent) > 1
+    assert all(len(message) <= 100 for message in sent)
+    assert all(message.startswith("```") and message.endswith("```") for message in sent)
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+def test_scheduler_serves_users_in_turn():
+    async def main():
+        scheduler = FairScheduler(max_limit=1, max_per_user=2)
+        order = []
+        async def call(user_id, tag):
+            await scheduler.acquire(user_id)
+            order.append(tag)
+        await call(0, "x")
+        # User 1 queues both requests before user 2 asks
+        tasks = [asyncio.create_task(call(user_id, tag)) for user_id, tag in ((1, "a1"), (1, "a2"), (2, "b1"), (2, "b2"))]
+        await settle()
+        for _ in tasks:
+            assert scheduler.in_flight == 1
+            scheduler.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        return order
+    assert asyncio.run(main()) == ["x", "a1", "b1", "a2", "b2"]
+
+def test_scheduler_rejects_at_the_per_user_limit():
+    async def main():
+        scheduler = FairScheduler(max_limit=1, max_per_user=2)
+        await scheduler.acquire(0)
+        waiting = [asyncio.create_task(scheduler.acquire(1)) for _ in range(2)]
+        await settle()
+        with pytest.raises(SchedulerFull):
+            await scheduler.acquire(1)
+        # Other users still get in
+        other = asyncio.create_task(scheduler.acquire(2))
+        await settle()
+        for task in waiting + [other]:
+            task.cancel()
+        await asyncio.gather(*waiting, other, return_exceptions=True)
+        return scheduler.stats.rejected
+    assert asyncio.run(main()) == 1
+
+def test_scheduler_rejects_at_the_global_limit():
+    async def main():
+        scheduler = FairScheduler(max_limit=1, max_queue=2, max_per_user=5)
+        await scheduler.acquire(0)
+        waiting = [asyncio.create_task(scheduler.acquire(user_id)) for user_id in (1, 2)]
+        await settle()
+        with pytest.raises(SchedulerFull):
+            await scheduler.acquire(3)
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        return scheduler.stats.rejected
+    assert asyncio.run(main()) == 1
+
+def test_scheduler_limit_halves_on_quota_errors_and_grows_back():
+    async def main():
+        scheduler = FairScheduler(max_limit=4)
+        async def call(quota_exceeded=False):
+            await scheduler.acquire(1)
+            scheduler.release(quota_exceeded)
+            return scheduler.limit
+        limits = [await call(True), await call(True), await call(True)]
+        # Grows by one after `limit` consecutive successes
+        limits += [await call() for _ in range(1 + 2 + 3 + 4)]
+        return limits, scheduler.stats.quota_errors
+    limits, quota_errors = asyncio.run(main())
+    assert limits == [2, 1, 1, 2, 2, 3, 3, 3, 4, 4, 4, 4, 4]
+    assert quota_errors == 3
+
+def test_cancelled_waiter_leaves_no_queue_behind():
+    async def main():
+        scheduler = FairScheduler(max_limit=1)
+        await scheduler.acquire(0)
+        waiter = asyncio.create_task(scheduler.acquire(1))
+        await settle()
+        queued = scheduler.depth
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release()
+        return queued, scheduler.snapshot()
+    queued, snapshot = asyncio.run(main())
+    assert queued == 1
+    assert (snapshot["depth"], snapshot["waiting_users"], snapshot["in_flight"]) == (0, 0, 0)
+
+def test_waiter_cancelled_as_it_is_granted_gives_the_slot_back():
+    async def main():
+        scheduler = FairScheduler(max_limit=1)
+        await scheduler.acquire(0)
+        waiter = asyncio.create_task(scheduler.acquire(1))
+        await settle()
+        # The slot is handed over before the waiter gets to run
+        scheduler.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return scheduler.snapshot()
+    snapshot = asyncio.run(main())
+    assert (snapshot["depth"], snapshot["waiting_users"], snapshot["in_flight"]) == (0, 0, 0)
+
+class QuotaError(Exception):
+    code = 429
+
+class FakeModels:
+    """`client.aio.models` whose stream yields the strings in `script` and raises any exception in it."""
+    def __init__(self, script):
+        self.script = script
+        self.calls = 0
+        self.closed = 0
+
+    async def generate_content_stream(self, model, contents):
+        self.calls += 1
+        return self._stream()
+
+    async def _stream(self):
+        try:
+            for item in self.script:
+                if isinstance(item, Exception):
+                    raise item
+                yield SimpleNamespace(text=item)
+        finally:
+            self.closed += 1
+
+class FailingFollowup(FakeFollowup):
+    async def send(self, content, wait=False):
+        self.sent.append(content)
+        raise HTTPException(SimpleNamespace(status=503, reason="Service Unavailable"), "upstream connect error")
+
+async def _defer(ephemeral=False):
+    return None
+
+def chat_cog(monkeypatch, script, max_concurrency=1):
+    # Plain logger: no listener thread or log files
+    monkeypatch.setattr("cogs.single.ai_chat.setup_logger", lambda name, **kwargs: logging.getLogger(name))
+    const = SimpleNamespace(CHAT_STREAM_EDIT_INTERVAL=0, CHAT_CACHE_MAX_ENTRIES=8, CHAT_CACHE_TTL=60,
+                            CHAT_MAX_CONCURRENCY=max_concurrency, CHAT_MAX_QUEUE=4, CHAT_MAX_QUEUE_PER_USER=1)
+    bot = SimpleNamespace(const=const, metrics=Metrics(), gemini=SimpleNamespace(models=FakeModels(script)))
+    cog = AIchat(bot)
+    cog.cache.collection = None
+    return cog
+
+def interaction(followup=None):
+    return SimpleNamespace(response=SimpleNamespace(defer=_defer), followup=followup or FakeFollowup(),
+                           user=SimpleNamespace(id=1), created_at=utcnow())
+
+def test_chat_streams_the_response_and_caches_it(monkeypatch):
+    cog = chat_cog(monkeypatch, ["Hello ", "world"])
+    first, second = interaction(), interaction()
+    async def main():
+        await cog.chatAI.callback(cog, first, prompt="Say hello")
+        await cog.chatAI.callback(cog, second, prompt="say hello")
+        return await cog.cache.get(MODEL, "Say hello")
+    assert asyncio.run(main()) == "Hello world"
+    assert first.followup.sent == ["Hello world"] and second.followup.sent == ["Hello world"]
+    # The second request was served from the cache
+    assert cog.bot.gemini.models.calls == 1
+    assert cog.scheduler.in_flight == 0
+
+def test_chat_reports_a_quota_error_and_halves_the_limit(monkeypatch):
+    cog = chat_cog(monkeypatch, ["Partial ", QuotaError()], max_concurrency=4)
+    chat = interaction()
+    asyncio.run(cog.chatAI.callback(cog, chat, prompt="Say hello"))
+    assert chat.followup.sent[-1].startswith("Partial") and "usage quota" in chat.followup.sent[-1]
+    assert cog.scheduler.limit == 2 and cog.scheduler.in_flight == 0
+    # A partial answer is not cached
+    assert asyncio.run(cog.cache.get(MODEL, "Say hello")) is None
+
+def test_chat_discord_error_is_not_reported_as_an_ai_error(monkeypatch):
+    cog = chat_cog(monkeypatch, ["Hello ", "world"])
+    chat = interaction(FailingFollowup())
+    asyncio.run(cog.chatAI.callback(cog, chat, prompt="Say hello"))
+    # One failed send, and no error notice sent down the same failing path
+    assert chat.followup.sent == ["Hello "]
+    models = cog.bot.gemini.models
+    assert models.closed == 1
+    assert cog.scheduler.in_flight == 0 and cog.scheduler.stats.quota_errors == 0
+    assert asyncio.run(cog.cache.get(MODEL, "Say hello")) is None
@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+from tests.helpers import KEY, GatedCollection
+from utils.attachments import AttachmentRegistry
+from utils.papercache import PaperKey
+
+def message(key: PaperKey, ephemeral: bool = False):
+    attachment = SimpleNamespace(filename=key.filename, url=f"https://cdn.example/{key.filename}?ex=7fffffff", size=1234)
+    return SimpleNamespace(attachments=[attachment], flags=SimpleNamespace(ephemeral=ephemeral),
+                           channel=SimpleNamespace(id=1), id=2)
+
+def test_remember_persists_in_the_background():
+    async def main():
+        collection = GatedCollection()
+        registry = AttachmentRegistry(None, None, collection)
+        registry.remember(KEY, message(KEY))
+        known = KEY in registry, registry.writes.pending, dict(collection.docs)
+        collection.release.set()
+        await registry.writes.drain()
+        return known, collection.docs
+    known, docs = asyncio.run(main())
+    assert known == (True, 1, {})
+    assert docs["9709_s20_qp_12"]["url"].endswith("?ex=7fffffff")
+
+def test_ephemeral_messages_are_not_remembered():
+    async def main():
+        registry = AttachmentRegistry(None, None, GatedCollection(released=True))
+        registry.remember(KEY, message(KEY, ephemeral=True))
+        return KEY in registry, registry.writes.pending
+    assert asyncio.run(main()) == (False, 0)
+
+def test_forget_drops_the_reference_immediately():
+    async def main():
+        collection = GatedCollection(released=True)
+        registry = AttachmentRegistry(None, None, collection)
+        registry.remember(KEY, message(KEY))
+        await registry.writes.drain()
+        registry.forget(KEY)
+        gone = KEY not in registry
+        await registry.writes.drain()
+        return gone, collection.docs
+    assert asyncio.run(main()) == (True, {})
@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+from cogs.single.paperutils import paper_id_autocomplete, season_autocomplete, year_autocomplete
+
+def interaction(command: str = "qp", subject="math", year=None, season=None, paper_id=None):
+    return SimpleNamespace(command=SimpleNamespace(name=command),
+                           namespace=SimpleNamespace(subject=subject, year=year, season=season, paper_id=paper_id))
+
+def values(choices) -> list:
+    return [c.value for c in choices]
+
+def complete(func, current: str = "", **kwargs) -> list:
+    return values(asyncio.run(func(interaction(**kwargs), current)))
+
+def test_nothing_is_suggested_without_a_subject():
+    assert complete(year_autocomplete, subject=None) == []
+    assert complete(paper_id_autocomplete, subject="nonsense") == []
+
+def test_years_are_newest_first_with_random_only_for_qp():
+    years = complete(year_autocomplete)
+    assert years[0] == -1 and years[1:] == sorted(years[1:], reverse=True)
+    assert -1 not in complete(year_autocomplete, command="ms")
+    assert all(str(y).startswith("201") for y in complete(year_autocomplete, "201"))
+
+def test_seasons_follow_the_chosen_paper():
+    # x1 papers are never sat in the March series
+    assert "march" not in complete(season_autocomplete, command="ms", year=2020, paper_id=11)
+    assert "march" in complete(season_autocomplete, command="ms", year=2020, paper_id=12)
+    assert complete(season_autocomplete, "oct", command="ms") == ["nov"]
+
+def test_paper_ids_follow_year_and_season():
+    papers = complete(paper_id_autocomplete, command="ms", year=2020, season="march")
+    assert papers and all(p % 10 == 2 for p in papers)
+    assert all(str(p).startswith("3") for p in complete(paper_id_autocomplete, "3", command="ms", year=2020))
+
+def test_invalid_filters_are_ignored():
+    # A half-typed paper ID that matches nothing should not empty the year list
+    assert complete(year_autocomplete, command="ms", paper_id=9) == complete(year_autocomplete, command="ms")
+
+def test_suggestions_are_capped_at_discords_limit():
+    assert len(complete(year_autocomplete)) <= 25
+    assert len(complete(paper_id_autocomplete, command="ms")) <= 25
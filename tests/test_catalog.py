@@ -0,0 +1,54 @@
+import random
+
+from cogs.single.paperutils import BestExamHelpIO, PaperCatalog, Subject
+
+CATALOG = BestExamHelpIO.catalog()
+MATH = BestExamHelpIO.MATH
+FURTHER_MATH = BestExamHelpIO.FURTHER_MATH
+
+def brute_force(subjects):
+    return {(s.short_subjectID, y, se, p)
+            for s in subjects for y in s.years for se in set(s.seasons.values()) for p in s.papers_for(y, se)}
+
+def test_catalog_matches_the_subject_definitions():
+    expected = brute_force(CATALOG.subjects)
+    assert len(CATALOG) == len(expected)
+    assert {(s.short_subjectID, y, se, p) for s, y, se, p in CATALOG.enumerate()} == expected
+
+def test_encode_decode_round_trip():
+    for code in random.Random(0).sample(list(CATALOG.codes), 200):
+        subject, year, season, paper_id = CATALOG.decode(code)
+        assert CATALOG.encode(subject, year, season, paper_id) == code
+        assert CATALOG.contains(subject, year, season, paper_id)
+
+def test_season_specific_papers():
+    # March only has the x2 variants from 2016, and no session before that
+    assert CATALOG.contains(MATH, 2020, "m", 12)
+    assert not CATALOG.contains(MATH, 2020, "m", 11)
+    assert not CATALOG.contains(MATH, 2015, "m", 12)
+    assert CATALOG.contains(MATH, 2015, "s", 11)
+
+def test_rejects_out_of_range_values():
+    assert not CATALOG.contains(MATH, 2009, "s", 11)
+    assert not CATALOG.contains(MATH, 2020, "x", 11)
+    assert not CATALOG.contains(MATH, 2020, "s", 500)
+    assert not CATALOG.contains(FURTHER_MATH, 2015, "m", 11)  # no March series
+    assert CATALOG.encode(MATH, 1990, "s", 11) is None
+
+def test_candidates_and_facets_agree_with_filters():
+    codes = CATALOG.candidates(MATH, season="m", years=range(2020, 2021))
+    assert {CATALOG.decode(c)[1:] for c in codes} == {(2020, "m", p) for p in (12, 22, 32, 42, 52, 62, 72)}
+    years, seasons, papers = CATALOG.facet(MATH, season="m")
+    assert years == tuple(range(2016, 2025)) and seasons == ("m",)
+    assert CATALOG.facet(FURTHER_MATH, year=2015)[2] == (11, 12, 13, 21, 22, 23)
+
+def test_sample_respects_filters():
+    for _ in range(50):
+        subject, year, season, paper_id = CATALOG.sample(MATH, years=MATH.rand_years, season="w")
+        assert subject is MATH and year in MATH.rand_years and season == "w"
+    assert CATALOG.sample(FURTHER_MATH, season="m") is None
+
+def test_small_custom_catalog():
+    subject = Subject("x-0001", "0001", {"jun": "s"}, range(2020, 2022), range(2020, 2022), [(range(2020, 2022), [1, 2])])
+    catalog = PaperCatalog([subject])
+    assert [c[1:] for c in catalog.enumerate()] == [(2020, "s", 1), (2020, "s", 2), (2021, "s", 1), (2021, "s", 2)]
@@ -0,0 +1,71 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from cogs.single.paperutils import BestExamHelpIO, PaperUtils
+from tests.helpers import KEY, GatedCollection
+from utils.existence import ExistenceIndex
+
+MATH = BestExamHelpIO.MATH
+
+def test_record_nowait_does_not_wait_for_mongo():
+    async def main():
+        collection = GatedCollection()
+        index = ExistenceIndex(None, collection)
+        index.record_nowait(KEY, True, 1234)
+        # Known in memory straight away, while the write is still blocked
+        known = index.exists(KEY), index.size_of(KEY), index.writes.pending, dict(collection.docs)
+        collection.release.set()
+        await index.writes.drain()
+        return known, collection.docs
+    known, docs = asyncio.run(main())
+    assert known == (True, 1234, 1, {})
+    assert docs["9709_s20_qp_12"]["exists"] is True
+
+def test_drain_cancels_stuck_writes():
+    async def main():
+        collection = GatedCollection()
+        index = ExistenceIndex(None, collection)
+        index.record_nowait(KEY, False)
+        await asyncio.sleep(0)
+        # Never released: drain has to give up on it
+        await index.writes.drain(timeout=0)
+        return collection.started, index.writes.pending, collection.docs
+    assert asyncio.run(main()) == (1, 0, {})
+
+def test_negative_entries_expire():
+    index = ExistenceIndex(None, negative_ttl=60)
+    asyncio.run(index.record(KEY, False))
+    assert index.exists(KEY) is False and index.check_negative(KEY)
+    index._missing[KEY] -= 61
+    assert index.exists(KEY) is None and index.needs_probe(KEY)
+
+def qp_key(paper):
+    subject, year, season, paper_id = paper
+    return BestExamHelpIO().paper_key(subject, year, season, "qp", paper_id)
+
+def pick(index, **filters):
+    # pick_random only needs the cog's existence index
+    return PaperUtils.pick_random(SimpleNamespace(existence=index, RANDOM_DRAWS=PaperUtils.RANDOM_DRAWS), MATH, **filters)
+
+def test_random_pick_prefers_papers_confirmed_to_exist():
+    index = ExistenceIndex(None)
+    papers = list(BestExamHelpIO.catalog().enumerate(MATH, year=2020))
+    confirmed = set(papers[::2])
+    for paper in confirmed:
+        index._remember(qp_key(paper), True, None)
+    random.seed(0)
+    # Unknown papers are only a fallback for when no draw is confirmed
+    picks = {pick(index, year=2020) for _ in range(50)}
+    assert picks <= confirmed and len(picks) > 1
+
+def test_random_pick_skips_known_misses():
+    index = ExistenceIndex(None)
+    papers = list(BestExamHelpIO.catalog().enumerate(MATH, year=2020, season="s"))
+    for paper in papers[1:]:
+        index._remember(qp_key(paper), False, None)
+    random.seed(0)
+    # Every draw may be a miss; the one unknown paper is still found
+    assert {pick(index, year=2020, season="s") for _ in range(20)} == {papers[0]}
+    index._remember(qp_key(papers[0]), False, None)
+    assert pick(index, year=2020, season="s") is None
@@ -0,0 +1,215 @@
+import asyncio
+import tempfile
+
+import aiohttp
+
+from tests.helpers import KEY
+from utils.existence import ExistenceIndex
+from utils.fetcher import PaperFetcher, TOO_LARGE
+from utils.memcache import HotBytesCache
+from utils.papercache import DiskPaperCache
+from utils.providers import BodyTooLarge
+
+class FakeRouter:
+    """Stands in for ProviderRouter: serves `body` after `delay`, counting calls."""
+    def __init__(self, body: bytes = b"%PDF" + bytes(1000), delay: float = 0.01):
+        self.body = body
+        self.delay = delay
+        self.calls = []
+        self.sources = []
+
+    async def get(self, key, link, headers, max_bytes, validator_source=None):
+        self.calls.append((key, headers, max_bytes))
+        self.sources.append(validator_source)
+        await asyncio.sleep(self.delay)
+        fp = tempfile.SpooledTemporaryFile()
+        fp.write(self.body)
+        return 200, fp, len(self.body), {"etag": '"v1"', "provider": "fake"}
+
+    def snapshot(self):
+        return {}
+
+def make_fetcher(root: str, router: FakeRouter, max_bytes: int = 50 * 1024**2) -> PaperFetcher:
+    return PaperFetcher(None, DiskPaperCache(root, 10 * 1024**2), HotBytesCache(1024**2), max_bytes=max_bytes, router=router)
+
+def test_callers_with_different_limits_share_one_download():
+    async def main(root):
+        router = FakeRouter()
+        fetcher = make_fetcher(root, router)
+        results = await asyncio.gather(
+            fetcher.fetch(KEY, "link", max_bytes=8 * 1024**2),
+            fetcher.fetch(KEY, "link", max_bytes=25 * 1024**2),
+            fetcher.fetch(KEY, "link", max_bytes=500),
+        )
+        return router, fetcher, results
+    with tempfile.TemporaryDirectory() as root:
+        router, fetcher, results = asyncio.run(main(root))
+    assert len(router.calls) == 1
+    assert router.calls[0][2] == fetcher.max_bytes
+    assert results[0].ok and results[1].ok
+    # The smallest limit is applied to that caller after the shared download
+    assert results[2].status == TOO_LARGE and results[2].size == 1004
+
+def test_disk_hit_does_not_hit_upstream():
+    async def main(root):
+        router = FakeRouter()
+        fetcher = make_fetcher(root, router)
+        await fetcher.disk_cache.put(KEY, b"%PDF cached", {"checked_at": 2**40})
+        return router, await fetcher.fetch(KEY, "link")
+    with tempfile.TemporaryDirectory() as root:
+        router, result = asyncio.run(main(root))
+    assert result.ok and not router.calls
+
+class GateProbe(FakeRouter):
+    """Records whether the foreground gate was held during each upstream call."""
+    def __init__(self, fetcher_ref, **kwargs):
+        super().__init__(**kwargs)
+        self.fetcher_ref = fetcher_ref
+        self.gate_busy = []
+
+    async def get(self, key, link, headers, max_bytes, validator_source=None):
+        self.gate_busy.append(self.fetcher_ref[0].gate.busy.is_set())
+        return await super().get(key, link, headers, max_bytes, validator_source)
+
+def test_disk_hit_does_not_take_the_foreground_gate(monkeypatch):
+    async def main(root):
+        fetcher = make_fetcher(root, FakeRouter())
+        await fetcher.disk_cache.put(KEY, b"%PDF cached", {"checked_at": 2**40})
+        entered = []
+        monkeypatch.setattr(fetcher.gate, "enter", lambda: entered.append(True))
+        await fetcher.fetch(KEY, "link")
+        return entered
+    with tempfile.TemporaryDirectory() as root:
+        assert asyncio.run(main(root)) == []
+
+def test_only_foreground_upstream_calls_hold_the_gate():
+    async def main(root):
+        ref = []
+        router = GateProbe(ref)
+        fetcher = make_fetcher(root, router)
+        ref.append(fetcher)
+        await fetcher.fetch(KEY, "link", background=True)
+        await fetcher.fetch(KEY._replace(paper_id=13), "link")
+        return router.gate_busy, fetcher.gate.active
+    with tempfile.TemporaryDirectory() as root:
+        assert asyncio.run(main(root)) == ([False, True], 0)
+
+def test_revalidation_names_the_provider_that_issued_the_validators():
+    async def main(root):
+        router = FakeRouter()
+        fetcher = make_fetcher(root, router)
+        await fetcher.disk_cache.put(KEY, b"%PDF old", {"etag": '"v0"', "checked_at": 0, "provider": "mirror"})
+        await fetcher.fetch(KEY, "link")
+        return router
+    with tempfile.TemporaryDirectory() as root:
+        router = asyncio.run(main(root))
+    assert router.sources == ["mirror"]
+    assert router.calls[0][1]["If-None-Match"] == '"v0"'
+
+class TooLargeRouter(FakeRouter):
+    async def get(self, key, link, headers, max_bytes, validator_source=None):
+        self.calls.append((key, headers, max_bytes))
+        raise BodyTooLarge(max_bytes + 1)
+
+def test_hot_cache_hit_respects_the_callers_limit():
+    async def main(root):
+        router = FakeRouter()
+        fetcher = PaperFetcher(None, DiskPaperCache(root, 10 * 1024**2), HotBytesCache(32 * 1024**2), router=router)
+        assert fetcher.hot_cache.put(KEY, bytes(2_000_000))
+        small = await fetcher.fetch(KEY, "link", max_bytes=1_000_000)
+        large = await fetcher.fetch(KEY, "link", max_bytes=8 * 1024**2)
+        return router, small, large
+    with tempfile.TemporaryDirectory() as root:
+        router, small, large = asyncio.run(main(root))
+    assert (small.status, small.source, small.size, small.data) == (TOO_LARGE, "memory", 2_000_000, None)
+    assert large.ok and large.source == "memory"
+    assert router.calls == []
+
+def test_known_size_over_the_limit_skips_the_download():
+    async def main(root):
+        router = FakeRouter()
+        existence = ExistenceIndex(None)
+        existence.record_nowait(KEY, True, 30 * 1024**2)
+        fetcher = PaperFetcher(None, DiskPaperCache(root, 10 * 1024**2), HotBytesCache(1024**2),
+                               existence=existence, router=router)
+        return router, await fetcher.fetch(KEY, "link", max_bytes=25 * 1024**2)
+    with tempfile.TemporaryDirectory() as root:
+        router, result = asyncio.run(main(root))
+    assert (result.status, result.source, result.size) == (TOO_LARGE, "size", 30 * 1024**2)
+    assert router.calls == []
+
+def test_body_over_the_bot_limit_is_reported_and_not_cached():
+    async def main(root):
+        router = TooLargeRouter()
+        fetcher = make_fetcher(root, router, max_bytes=1024)
+        result = await fetcher.fetch(KEY, "link")
+        return fetcher, result
+    with tempfile.TemporaryDirectory() as root:
+        fetcher, result = asyncio.run(main(root))
+    assert result.too_large and result.size == 1025
+    assert KEY not in fetcher.disk_cache and fetcher.stats.too_large == 1
+
+class ScriptedRouter(FakeRouter):
+    """Answers every call with `response` (status, body or None, validators), or raises it if it is an exception."""
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+    async def get(self, key, link, headers, max_bytes, validator_source=None):
+        self.calls.append((key, headers, max_bytes))
+        if isinstance(self.response, Exception):
+            raise self.response
+        status, body, meta = self.response
+        if body is None:
+            return status, None, 0, meta
+        fp = tempfile.SpooledTemporaryFile()
+        fp.write(body)
+        return status, fp, len(body), meta
+
+STALE_META = {"etag": '"v0"', "last_modified": "Mon, 01 Jun 2020 00:00:00 GMT", "checked_at": 0, "provider": "fake"}
+
+def served(result) -> bytes:
+    if result.data is not None:
+        return result.data
+    with open(result.path, "rb") as f:
+        return f.read()
+
+def revalidate(root, response):
+    async def main():
+        router = ScriptedRouter(response)
+        fetcher = make_fetcher(root, router)
+        await fetcher.disk_cache.put(KEY, b"%PDF old", dict(STALE_META))
+        result = await fetcher.fetch(KEY, "link")
+        return router, fetcher, result
+    return asyncio.run(main())
+
+def test_not_modified_refreshes_the_entry_and_serves_the_cached_copy():
+    with tempfile.TemporaryDirectory() as root:
+        router, fetcher, result = revalidate(root, (304, None, {"etag": '"v1"'}))
+        body, meta = served(result), fetcher.disk_cache.meta(KEY)
+    headers = router.calls[0][1]
+    assert headers["If-None-Match"] == '"v0"' and headers["If-Modified-Since"] == STALE_META["last_modified"]
+    assert result.ok and result.source in ("disk", "memory") and body == b"%PDF old"
+    assert meta["etag"] == '"v1"' and meta["last_modified"] == STALE_META["last_modified"]
+    assert fetcher.is_fresh(KEY, meta)
+    assert (fetcher.stats.revalidations, fetcher.stats.not_modified, fetcher.stats.downloads) == (1, 1, 0)
+
+def test_changed_paper_replaces_the_entry():
+    with tempfile.TemporaryDirectory() as root:
+        router, fetcher, result = revalidate(root, (200, b"%PDF new", {"etag": '"v2"', "last_modified": None, "checked_at": 2**40}))
+        body, meta = served(result), fetcher.disk_cache.meta(KEY)
+        cached = served(asyncio.run(fetcher.fetch(KEY, "link")))
+    assert result.ok and body == b"%PDF new" and cached == b"%PDF new"
+    assert meta["etag"] == '"v2"'
+    assert (fetcher.stats.revalidations, fetcher.stats.not_modified, fetcher.stats.downloads) == (1, 0, 1)
+    assert len(router.calls) == 1
+
+def test_upstream_failure_serves_the_stale_copy():
+    for response in (aiohttp.ClientConnectionError(), (503, None, None)):
+        with tempfile.TemporaryDirectory() as root:
+            router, fetcher, result = revalidate(root, response)
+            body, meta = served(result), fetcher.disk_cache.meta(KEY)
+        assert result.ok and body == b"%PDF old"
+        # Still stale, so the next request tries again
+        assert meta["etag"] == '"v0"' and not fetcher.is_fresh(KEY, meta)
+        assert fetcher.stats.stale_served == 1
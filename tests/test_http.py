@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utils.http import HTTPPool
+
+async def serve(handler):
+    app = web.Application()
+    app.router.add_get("/", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+def test_session_requires_start():
+    pool = HTTPPool()
+    with pytest.raises(RuntimeError):
+        pool.session
+
+def test_requests_share_kept_alive_connections():
+    async def handler(request):
+        return web.Response(text=request.headers["User-Agent"])
+    async def main():
+        server = await serve(handler)
+        pool = HTTPPool(user_agent="TestBot/1.0")
+        await pool.start()
+        try:
+            bodies = []
+            for _ in range(3):
+                async with pool.session.get(server.make_url("/")) as response:
+                    bodies.append(await response.text())
+            return bodies, pool.snapshot()
+        finally:
+            await pool.close()
+            await server.close()
+    bodies, stats = asyncio.run(main())
+    assert bodies == ["TestBot/1.0"] * 3
+    assert stats["requests"] == 3 and stats["in_flight"] == 0
+    assert stats["connections_created"] == 1 and stats["connections_reused"] == 2
+
+def test_failed_requests_are_counted():
+    async def main():
+        pool = HTTPPool(connect_timeout=1)
+        await pool.start()
+        try:
+            with pytest.raises(Exception):
+                # Nothing listens on port 9 (discard) locally
+                async with pool.session.get("http://127.0.0.1:9/"):
+                    pass
+            return pool.snapshot()
+        finally:
+            await pool.close()
+    stats = asyncio.run(main())
+    assert stats["failed_requests"] == 1 and stats["in_flight"] == 0
+
+def test_start_is_idempotent_and_close_resets():
+    async def main():
+        pool = HTTPPool()
+        await pool.start()
+        session = pool.session
+        await pool.start()
+        same = pool.session is session
+        await pool.close()
+        return same, pool._session
+    assert asyncio.run(main()) == (True, None)
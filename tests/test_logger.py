@@ -0,0 +1,64 @@
+import logging
+import threading
+
+import pytest
+
+import logger
+from logger import CustomFormatter, setup_logger, stop_logging
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.getMessage(), threading.current_thread()))
+
+@pytest.fixture
+def log_name(request):
+    name = f"tests.{request.node.name}"
+    yield name
+    # Leave no handlers bound to pytest's captured streams for the atexit flush
+    stop_logging()
+    for handler in logger._routes.pop(name, ()):
+        handler.close()
+    logging.getLogger(name).handlers.clear()
+
+def test_setup_is_idempotent_per_name(log_name, tmp_path):
+    first = setup_logger(log_name, console_level=logging.CRITICAL, log_dir=str(tmp_path), file_name="test")
+    second = setup_logger(log_name, console_level=logging.CRITICAL, log_dir=str(tmp_path), file_name="test")
+    assert first is second
+    assert len(first.handlers) == 1 and len(logger._routes[log_name]) == 2
+    first.info("hello %s", "world")
+    stop_logging()
+    [log_file] = tmp_path.glob("*_test.log")
+    lines = log_file.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1 and lines[0].endswith("hello world")
+
+def test_records_reach_the_handlers_through_the_queue(log_name, tmp_path):
+    log = setup_logger(log_name, console_level=logging.CRITICAL, log_dir=str(tmp_path))
+    collected = ListHandler()
+    logger._routes[log_name].append(collected)
+    items = ["a"]
+    log.info("items: %s", items)
+    # Arguments are merged when the record is queued, not when the listener gets to it
+    items.append("b")
+    stop_logging()
+    [(message, thread)] = collected.records
+    assert message == "items: ['a']"
+    assert thread is not threading.current_thread()
+
+def test_formatters_are_built_once(monkeypatch):
+    formatter = CustomFormatter()
+    built = []
+    original = logging.Formatter.__init__
+    def counting_init(self, *args, **kwargs):
+        built.append(self)
+        original(self, *args, **kwargs)
+    monkeypatch.setattr(logging.Formatter, "__init__", counting_init)
+    for level in (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL, 5):
+        record = logging.LogRecord("tests", level, __file__, 1, "message %s", ("arg",), None)
+        assert "message arg" in formatter.format(record)
+    assert built == []
+    # Per-level formatters are shared by every handler
+    assert logger.create_console_handler().formatter.FORMATS is formatter.FORMATS
@@ -0,0 +1,33 @@
+from discord import Intents, MemberCacheFlags
+
+from main import AutoShardedPPBdpy, PPBdpy
+
+def client_options(monkeypatch, cls=PPBdpy, **env) -> dict:
+    for name in ("LOW_MEMORY", "MAX_MESSAGES", "SHARD_COUNT"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    # Constants and options only: no gateway client, logging or metrics
+    bot = cls.__new__(cls)
+    bot.load_constant()
+    return bot.client_options()
+
+def test_default_options_keep_everything(monkeypatch):
+    options = client_options(monkeypatch)
+    assert options == {"intents": Intents.all(), "max_messages": 1000}
+
+def test_low_memory_options(monkeypatch):
+    options = client_options(monkeypatch, LOW_MEMORY="true")
+    assert options["intents"] == Intents(guilds=True, guild_messages=True, dm_messages=True, message_content=True)
+    assert not options["intents"].members and not options["intents"].presences
+    assert options["member_cache_flags"] == MemberCacheFlags.none()
+    assert options["chunk_guilds_at_startup"] is False
+    assert options["max_messages"] is None
+
+def test_low_memory_message_cache_can_be_enabled(monkeypatch):
+    assert client_options(monkeypatch, LOW_MEMORY="1", MAX_MESSAGES="200")["max_messages"] == 200
+
+def test_auto_sharded_options(monkeypatch):
+    assert "shard_count" not in client_options(monkeypatch, AutoShardedPPBdpy)
+    options = client_options(monkeypatch, AutoShardedPPBdpy, LOW_MEMORY="true", SHARD_COUNT="4")
+    assert options["shard_count"] == 4 and options["chunk_guilds_at_startup"] is False
@@ -0,0 +1,52 @@
+from utils.memcache import FrequencySketch, HotBytesCache
+
+def test_sketch_counts_and_saturates():
+    sketch = FrequencySketch(64)
+    for _ in range(3):
+        sketch.increment("a")
+    assert sketch.estimate("a") >= 3
+    assert sketch.estimate("never-seen") <= sketch.estimate("a")
+    for _ in range(100):
+        sketch.increment("a")
+    assert sketch.estimate("a") == FrequencySketch.MAX_COUNT
+
+def test_sketch_halves_after_sample_size():
+    sketch = FrequencySketch(16)
+    for _ in range(10):
+        sketch.increment("a")
+    before = sketch.estimate("a")
+    for i in range(sketch.sample_size):
+        sketch.increment(i)
+    assert sketch.estimate("a") < before
+
+def test_admits_while_there_is_room():
+    cache = HotBytesCache(100, max_item_bytes=50)
+    assert cache.put("a", b"x" * 40)
+    assert cache.put("b", b"x" * 40)
+    assert cache.get("a") == b"x" * 40
+    assert cache.total_bytes == 80
+
+def test_rejects_items_over_the_item_limit():
+    cache = HotBytesCache(100, max_item_bytes=50)
+    assert not cache.put("big", b"x" * 60)
+    assert "big" not in cache
+
+def test_cold_key_does_not_displace_popular_ones():
+    cache = HotBytesCache(100, max_item_bytes=50)
+    cache.put("a", b"x" * 50)
+    cache.put("b", b"x" * 50)
+    for _ in range(5):
+        cache.get("a"); cache.get("b")
+    assert not cache.would_admit("cold", 50)
+    assert not cache.put("cold", b"x" * 50)
+    assert "a" in cache and "b" in cache
+
+def test_more_frequent_key_evicts_the_lru_victim():
+    cache = HotBytesCache(100, max_item_bytes=50)
+    cache.put("a", b"x" * 50)
+    cache.put("b", b"x" * 50)
+    for _ in range(5):
+        cache.get("hot")  # misses still count towards frequency
+    assert cache.put("hot", b"y" * 50)
+    assert "hot" in cache and "a" not in cache and "b" in cache
+    assert cache.total_bytes == 100
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from utils.metrics import Histogram, LoopLagMonitor, Metrics
+
+def test_histogram_buckets_are_upper_bound_inclusive():
+    histogram = Histogram(buckets=(0.1, 1, 10))
+    for value in (0.05, 0.1, 0.5, 1, 20):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 0, 1]
+    assert histogram.count == 5 and abs(histogram.sum - 21.65) < 1e-9
+    assert histogram.quantile(0.5) == 1 and histogram.quantile(1.0) == float("inf")
+    assert Histogram().quantile(0.5) is None
+
+def test_render_prometheus_text():
+    metrics = Metrics(namespace="t")
+    metrics.describe("requests_total", "counter", "Requests served")
+    metrics.describe("latency_seconds", "histogram", "Latency", buckets=(0.5, 1))
+    metrics.inc("requests_total", command="qp")
+    metrics.inc("requests_total", 2, command="qp")
+    metrics.set("temperature", 21.5)
+    metrics.observe("latency_seconds", 0.25, command="qp")
+    metrics.observe("latency_seconds", 0.75, command="qp")
+    lines = metrics.render().splitlines()
+    assert lines[:3] == ["# HELP t_requests_total Requests served", "# TYPE t_requests_total counter",
+                         't_requests_total{command="qp"} 3']
+    assert "# TYPE t_temperature gauge" in lines and "t_temperature 21.5" in lines
+    assert [line for line in lines if line.startswith("t_latency_seconds")] == [
+        't_latency_seconds_bucket{command="qp",le="0.5"} 1',
+        't_latency_seconds_bucket{command="qp",le="1.0"} 2',
+        't_latency_seconds_bucket{command="qp",le="+Inf"} 2',
+        't_latency_seconds_sum{command="qp"} 1.0',
+        't_latency_seconds_count{command="qp"} 2',
+    ]
+
+def test_render_escapes_label_values():
+    metrics = Metrics(namespace="t")
+    metrics.inc("searches_total", query='say "hi" \\ bye')
+    assert 't_searches_total{query="say \\"hi\\" \\\\ bye"} 1' in metrics.render().splitlines()
+
+def test_render_exports_collectors_as_gauges():
+    metrics = Metrics(namespace="t")
+    metrics.add_collector("papers", lambda: {"disk": {"hit-rate": 0.5, "ready": True, "name": "ignored"}, "entries": 3})
+    metrics.add_collector("broken", lambda: 1 / 0)
+    lines = metrics.render().splitlines()
+    assert lines == ["# TYPE t_papers_disk_hit_rate gauge", "t_papers_disk_hit_rate 0.5",
+                     "# TYPE t_papers_disk_ready gauge", "t_papers_disk_ready 1.0",
+                     "# TYPE t_papers_entries gauge", "t_papers_entries 3"]
+    metrics.remove_collector("papers")
+    assert metrics.render() == "\n"
+
+def test_loop_lag_monitor_reports_a_blocking_call():
+    metrics = Metrics()
+    monitor = LoopLagMonitor(metrics, interval=0.01)
+    async def main():
+        monitor.start()
+        await asyncio.sleep(0)
+        # Blocks the loop well past the monitor's wake-up time
+        time.sleep(0.2)
+        while not metrics._gauges.get("event_loop_lag_last_seconds"):
+            await asyncio.sleep(0.01)
+        await monitor.stop()
+        return metrics.summary()
+    summary = asyncio.run(main())
+    assert summary["event_loop_lag_last_seconds[]"] >= 0.15
+    assert summary["event_loop_lag_seconds[]"]["count"] >= 1
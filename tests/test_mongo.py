@@ -0,0 +1,49 @@
+import asyncio
+import subprocess
+import sys
+from types import SimpleNamespace
+
+from cogs.single.ai_chat import AIchat, FairScheduler, ResponseCache
+from tests.helpers import GatedCollection
+from utils.mongo import LazyCollection
+from utils.metrics import Metrics
+
+class FakeBot:
+    def __init__(self, db):
+        self.const = SimpleNamespace(MONGO_DB_NAME="test")
+        self.lookups = 0
+        self._db = db
+
+    @property
+    def db(self):
+        self.lookups += 1
+        return self._db
+
+def test_lazy_collection_looks_up_the_database_on_first_use():
+    collection = GatedCollection(released=True)
+    bot = FakeBot({"test": {"chat_cache": collection}})
+    lazy = LazyCollection(bot, "chat_cache")
+    assert bot.lookups == 0
+    asyncio.run(lazy.replace_one({"_id": "a"}, {"response": "1"}))
+    asyncio.run(lazy.replace_one({"_id": "b"}, {"response": "2"}))
+    assert bot.lookups == 1
+    assert sorted(collection.docs) == ["a", "b"]
+
+def test_chat_cog_load_does_not_wait_for_the_ttl_index():
+    async def main():
+        collection = GatedCollection()
+        cog = SimpleNamespace(cache=ResponseCache(collection), scheduler=FairScheduler(),
+                              bot=SimpleNamespace(metrics=Metrics()))
+        # Returns while create_index is still blocked on the database
+        await AIchat.cog_load(cog)
+        await asyncio.sleep(0)
+        started, pending = collection.started, cog.cache.writes.pending
+        collection.release.set()
+        await cog.cache.writes.drain()
+        return started, pending, cog.cache.writes.pending
+    assert asyncio.run(main()) == (1, 1, 0)
+
+def test_warming_does_not_import_pymongo():
+    code = "import sys, utils.warming; print('pymongo' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "False"
@@ -0,0 +1,49 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import zipfile
+from types import SimpleNamespace
+
+from cogs.single.paperutils import BestExamHelpIO, PaperUtils
+from utils.fetcher import FetchResult
+from utils.papercache import PaperKey
+
+class FakeFetcher:
+    """Serves every key from a file on disk, except that `evicted` files are deleted before they are zipped."""
+    def __init__(self, root: str, evicted=()):
+        self.root = root
+        self.evicted = set(evicted)
+
+    async def fetch(self, key, link, max_bytes=None):
+        path = os.path.join(self.root, key.filename)
+        data = b"%PDF" + key.filename.encode()
+        with open(path, "wb") as f:
+            f.write(data)
+        if key in self.evicted:
+            os.remove(path)
+        return FetchResult(key, 200, path=path, source="disk", size=len(data))
+
+class FakeFollowup:
+    def __init__(self):
+        self.files = []
+
+    async def send(self, content=None, file=None, **kwargs):
+        self.files.append(file.fp.read())
+
+def build_pack(fetcher, docs, limit=10 * 1024**2):
+    cog = SimpleNamespace(fetcher=fetcher, logger=logging.getLogger("tests.pack"),
+                          bot=SimpleNamespace(const=SimpleNamespace(PAPER_PACK_CONCURRENCY=2)), _zip_add=PaperUtils._zip_add)
+    interaction = SimpleNamespace(followup=FakeFollowup())
+    msg = SimpleNamespace(edit=None)
+    parts, skipped = asyncio.run(PaperUtils._build_pack(cog, interaction, msg, BestExamHelpIO.MATH, docs, limit))
+    return parts, skipped, interaction.followup.files
+
+def test_missing_file_is_skipped_and_the_pack_still_sent():
+    keys = [PaperKey("9709", 2020, "s", "qp", p) for p in (11, 12, 13)]
+    with tempfile.TemporaryDirectory() as root:
+        parts, skipped, files = build_pack(FakeFetcher(root, evicted=[keys[1]]), [(k, "link") for k in keys])
+    assert parts == 1 and skipped == [keys[1].filename]
+    names = zipfile.ZipFile(io.BytesIO(files[0])).namelist()
+    assert sorted(names) == sorted([keys[0].filename, keys[2].filename])
@@ -0,0 +1,47 @@
+import asyncio
+import os
+import tempfile
+
+from utils.papercache import PaperKey, DiskPaperCache
+
+def key(paper_id: int) -> PaperKey:
+    return PaperKey("9709", 2020, "s", "qp", paper_id)
+
+def test_put_get_and_lru_eviction():
+    async def main(root):
+        cache = DiskPaperCache(root, 25)
+        await cache.put(key(1), b"x" * 10)
+        await cache.put(key(2), b"x" * 10)
+        assert await cache.get(key(1)) is not None  # 1 is now most recently used
+        await cache.put(key(3), b"x" * 10)
+        return cache
+    with tempfile.TemporaryDirectory() as root:
+        cache = asyncio.run(main(root))
+        assert key(2) not in cache and key(1) in cache and key(3) in cache
+        assert cache.total_bytes == 20
+        assert not os.path.exists(cache.path_for(key(2)))
+
+def test_load_rebuilds_the_index():
+    async def main(root):
+        await DiskPaperCache(root, 100).put(key(1), b"abc", {"etag": '"e"'})
+        cache = DiskPaperCache(root, 100)
+        await cache.load()
+        return cache
+    with tempfile.TemporaryDirectory() as root:
+        cache = asyncio.run(main(root))
+        assert key(1) in cache and cache.size_of(key(1)) == 3
+        assert cache.meta(key(1)) == {"etag": '"e"'}
+
+def test_entry_evicted_during_get_is_a_miss(monkeypatch):
+    async def main(root):
+        cache = DiskPaperCache(root, 100)
+        await cache.put(key(1), b"x" * 10)
+        def utime_then_evict(path):
+            # A concurrent put evicts the entry while get() awaits the utime thread
+            cache.total_bytes -= cache._index.pop(key(1))
+        monkeypatch.setattr("utils.papercache.os.utime", utime_then_evict)
+        return await cache.get(key(1)), cache
+    with tempfile.TemporaryDirectory() as root:
+        path, cache = asyncio.run(main(root))
+        assert path is None and key(1) not in cache
+        assert cache.stats.misses == 1
@@ -0,0 +1,96 @@
+import asyncio
+
+from tests.helpers import KEY
+from utils.fetcher import FetchResult, ForegroundGate
+from utils.prefetch import Prefetcher
+
+MS_KEY = KEY._replace(doctype="ms")
+
+class FakeFetcher:
+    """Background fetches block until `release` is set; finished keys land in the disk cache."""
+    def __init__(self):
+        self.hot_cache = set()
+        self.disk_cache = set()
+        self.existence = None
+        self.gate = ForegroundGate()
+        self.release = asyncio.Event()
+        self.started = []
+        self.cancelled = 0
+
+    async def fetch(self, key, link, max_bytes=None, background=False):
+        self.started.append(key)
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.disk_cache.add(key)
+        return FetchResult(key, 200, source="upstream")
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+def test_schedule_skips_warm_and_queued_papers():
+    async def main():
+        fetcher = FakeFetcher()
+        fetcher.disk_cache.add(KEY)
+        prefetcher = Prefetcher(fetcher)
+        return [prefetcher.schedule(KEY, "qp"), prefetcher.schedule(MS_KEY, "ms"), prefetcher.schedule(MS_KEY, "ms")], prefetcher.stats
+    queued, stats = asyncio.run(main())
+    assert queued == [False, True, False]
+    assert stats.scheduled == 1 and stats.skipped == 2
+
+def test_jobs_wait_for_foreground_fetches_to_finish():
+    async def main():
+        fetcher = FakeFetcher()
+        fetcher.release.set()
+        prefetcher = Prefetcher(fetcher)
+        fetcher.gate.enter()
+        prefetcher.start()
+        prefetcher.schedule(MS_KEY, "ms")
+        await settle()
+        before = list(fetcher.started)
+        fetcher.gate.exit()
+        await prefetcher.queue.join()
+        await prefetcher.stop()
+        return before, fetcher.started, prefetcher.stats
+    before, started, stats = asyncio.run(main())
+    assert before == [] and started == [MS_KEY]
+    assert stats.completed == 1
+
+def test_running_job_is_preempted_and_requeued():
+    async def main():
+        fetcher = FakeFetcher()
+        prefetcher = Prefetcher(fetcher)
+        prefetcher.start()
+        prefetcher.schedule(MS_KEY, "ms")
+        await settle()
+        # A user command starts an upstream fetch while the speculative one is running
+        fetcher.gate.enter()
+        await settle()
+        preempted = prefetcher.stats.preempted, fetcher.cancelled
+        fetcher.release.set()
+        fetcher.gate.exit()
+        await prefetcher.queue.join()
+        await prefetcher.stop()
+        return preempted, fetcher.started, MS_KEY in fetcher.disk_cache
+    preempted, started, warm = asyncio.run(main())
+    assert preempted == (1, 1)
+    assert started == [MS_KEY, MS_KEY] and warm
+
+def test_hit_rate_counts_requests_for_warmed_papers():
+    async def main():
+        fetcher = FakeFetcher()
+        fetcher.release.set()
+        prefetcher = Prefetcher(fetcher)
+        prefetcher.start()
+        prefetcher.schedule(MS_KEY, "ms")
+        await prefetcher.queue.join()
+        await prefetcher.stop()
+        prefetcher.record_request(MS_KEY, FetchResult(MS_KEY, 200, source="disk"))
+        # Only the first request after warming counts
+        prefetcher.record_request(MS_KEY, FetchResult(MS_KEY, 200, source="disk"))
+        return prefetcher.snapshot()
+    snapshot = asyncio.run(main())
+    assert snapshot["hits"] == 1 and snapshot["hit_rate"] == 1.0
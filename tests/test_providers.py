@@ -0,0 +1,124 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import pytest
+
+from tests.helpers import KEY
+from utils.providers import BodyTooLarge, PaperProvider, ProviderRouter, stream_body
+
+class FakeProvider(PaperProvider):
+    def __init__(self, name: str, status: int = 200, delay: float = 0.0, error: Exception = None):
+        super().__init__(name)
+        self.status = status
+        self.delay = delay
+        self.error = error
+        self.headers_seen = []
+
+    async def get(self, key, link_hint, headers, max_bytes, spool_bytes):
+        self.headers_seen.append(dict(headers))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        if self.status != 200:
+            return self.status, None, 0, None
+        return 200, io.BytesIO(b"%PDF"), 4, {"etag": f'"{self.name}"'}
+
+def run(router: ProviderRouter, times: int = 1, headers=None, validator_source=None):
+    async def main():
+        results = []
+        for _ in range(times):
+            results.append(await router.get(KEY, None, headers or {}, 1024, validator_source))
+        return results
+    return asyncio.run(main())
+
+def test_failing_provider_drops_behind_a_working_one():
+    broken = FakeProvider("broken", status=404)
+    good = FakeProvider("good", delay=0.01)
+    router = ProviderRouter([broken, good], hedge_delay=10)
+    results = run(router, times=5)
+    assert all(r[0] == 200 for r in results)
+    # The broken mirror was tried once, then ranked behind the one that answers
+    assert len(broken.headers_seen) == 1 and len(good.headers_seen) == 5
+    assert router.ranked()[0] is good
+
+def test_erroring_provider_is_penalised():
+    flaky = FakeProvider("flaky", error=ConnectionError("reset"))
+    good = FakeProvider("good")
+    router = ProviderRouter([flaky, good], hedge_delay=10)
+    run(router, times=3)
+    assert router.score(flaky) > router.score(good)
+    assert len(flaky.headers_seen) == 1
+
+def test_failure_penalty_fades_after_successes():
+    provider = FakeProvider("p")
+    router = ProviderRouter([provider])
+    router._observe(provider, 0.1, False)
+    penalised = router.score(provider)
+    for _ in range(20):
+        router._observe(provider, 0.1, True)
+    assert router.score(provider) < penalised and provider.stats.failure_ewma < 0.05
+
+def test_faster_provider_ranks_first():
+    slow, fast = FakeProvider("slow"), FakeProvider("fast")
+    router = ProviderRouter([slow, fast])
+    router._observe(slow, 1.0, True)
+    router._observe(fast, 0.1, True)
+    assert router.ranked() == [fast, slow]
+
+def test_hedge_to_the_next_provider_when_the_first_is_slow():
+    slow, fast = FakeProvider("slow", delay=1), FakeProvider("fast")
+    router = ProviderRouter([slow, fast], hedge_delay=0.01)
+    status, fp, size, meta = run(router)[0]
+    assert status == 200 and meta["provider"] == "fast"
+    assert router.stats.hedges == 1 and router.stats.hedge_wins == 1
+
+def test_validators_only_go_to_the_provider_that_issued_them():
+    a, b = FakeProvider("a", status=404), FakeProvider("b")
+    router = ProviderRouter([a, b], hedge_delay=10)
+    headers = {"Accept": "application/pdf", "If-None-Match": '"b"', "If-Modified-Since": "yesterday"}
+    run(router, headers=headers, validator_source="b")
+    assert a.headers_seen == [{"Accept": "application/pdf"}]
+    assert b.headers_seen == [headers]
+
+def test_validators_are_dropped_when_the_issuer_is_unknown():
+    a = FakeProvider("a")
+    router = ProviderRouter([a])
+    run(router, headers={"If-None-Match": '"x"'})
+    assert a.headers_seen == [{}]
+
+def test_all_failing_returns_the_http_answer():
+    router = ProviderRouter([FakeProvider("a", status=404), FakeProvider("b", error=ConnectionError())], hedge_delay=10)
+    assert run(router)[0][0] == 404
+
+class FakeContent:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            yield chunk
+
+def fake_response(chunks, content_length=None):
+    return SimpleNamespace(content_length=content_length, content=FakeContent(chunks))
+
+def test_stream_body_spools_the_whole_response():
+    fp, size = asyncio.run(stream_body(fake_response([b"%PDF", b"-1.7"]), max_bytes=8, spool_bytes=4))
+    fp.seek(0)
+    assert (fp.read(), size) == (b"%PDF-1.7", 8)
+
+def test_stream_body_rejects_a_declared_length_over_the_limit():
+    with pytest.raises(BodyTooLarge) as e:
+        asyncio.run(stream_body(fake_response([], content_length=100), max_bytes=10, spool_bytes=4))
+    assert e.value.size == 100
+
+def test_stream_body_stops_as_soon_as_the_limit_is_crossed():
+    read = []
+    async def chunks():
+        for chunk in (b"a" * 6, b"b" * 6, b"c" * 6):
+            read.append(chunk)
+            yield chunk
+    response = SimpleNamespace(content_length=None, content=SimpleNamespace(iter_chunked=lambda size: chunks()))
+    with pytest.raises(BodyTooLarge) as e:
+        asyncio.run(stream_body(response, max_bytes=10, spool_bytes=4))
+    assert e.value.size == 12 and len(read) == 2
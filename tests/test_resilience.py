@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from utils.resilience import CircuitBreaker, CircuitOpenError, HostGuard, RetryableStatus, TokenBucket
+
+def test_breaker_opens_after_threshold_and_half_opens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("utils.resilience.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    now[0] += 31
+    # One trial call only while half-open
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+def test_failed_trial_reopens(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("utils.resilience.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] += 11
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.times_opened == 2
+
+def test_released_trial_lets_the_next_call_through(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("utils.resilience.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] += 11
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_guard_retries_transient_errors_then_succeeds():
+    async def main():
+        guard = HostGuard("h", rate=0, retries=2, backoff_base=0)
+        calls = 0
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            if calls < 3:
+                raise RetryableStatus(503)
+            return "ok"
+        return await guard.run(attempt), calls, guard.retried
+    assert asyncio.run(main()) == ("ok", 3, 2)
+
+def test_guard_rejects_while_open():
+    async def main():
+        guard = HostGuard("h", rate=0, retries=0, failure_threshold=1, reset_timeout=60)
+        async def fail():
+            raise RetryableStatus(503)
+        with pytest.raises(RetryableStatus):
+            await guard.run(fail)
+        with pytest.raises(CircuitOpenError):
+            await guard.run(fail)
+    asyncio.run(main())
+
+def test_non_retryable_errors_are_not_retried():
+    async def main():
+        guard = HostGuard("h", rate=0, retries=3)
+        calls = 0
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            raise ValueError("bad")
+        with pytest.raises(ValueError):
+            await guard.run(attempt)
+        return calls, guard.breaker.failures
+    assert asyncio.run(main()) == (1, 0)
+
+class FakeClock:
+    """Clock and sleep to hand to a TokenBucket: sleeping advances the clock instantly."""
+    def __init__(self, now: float = 0.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def bucket(self, rate: float, burst: int) -> TokenBucket:
+        return TokenBucket(rate, burst, clock=self, sleep=self.sleep)
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def test_token_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = clock.bucket(100, 2)
+    async def main():
+        for _ in range(7):
+            await bucket.acquire()
+    asyncio.run(main())
+    # Two from the burst, five more at 100/s
+    assert abs(clock.now - 0.05) < 1e-9
+    assert bucket.waits == 5
+
+def test_token_bucket_refills_up_to_the_burst():
+    clock = FakeClock()
+    bucket = clock.bucket(10, 3)
+    async def main():
+        for _ in range(3):
+            await bucket.acquire()
+        clock.now += 60  # a long idle period refills no more than `burst`
+        for _ in range(4):
+            await bucket.acquire()
+    asyncio.run(main())
+    assert len(clock.sleeps) == 1 and abs(clock.sleeps[0] - 0.1) < 1e-9
+
+def test_zero_rate_disables_the_bucket():
+    clock = FakeClock()
+    bucket = clock.bucket(0, 1)
+    async def main():
+        for _ in range(10):
+            await bucket.acquire()
+    asyncio.run(main())
+    assert clock.sleeps == []
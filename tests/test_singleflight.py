@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_task():
+    async def main():
+        flights = SingleFlight()
+        calls = 0
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        return flights, calls, results
+    flights, calls, results = asyncio.run(main())
+    assert calls == 1
+    assert results == ["result"] * 5
+    assert flights.stats.leaders == 1 and flights.stats.coalesced == 4
+    assert not flights.in_flight("k")
+
+def test_different_keys_do_not_coalesce():
+    async def main():
+        flights = SingleFlight()
+        async def work(value):
+            await asyncio.sleep(0)
+            return value
+        return await asyncio.gather(flights.do("a", lambda: work(1)), flights.do("b", lambda: work(2)))
+    assert asyncio.run(main()) == [1, 2]
+
+def test_exception_reaches_every_waiter():
+    async def main():
+        flights = SingleFlight()
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        return await asyncio.gather(*(flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+def test_cancelling_one_waiter_keeps_the_shared_task():
+    async def main():
+        flights = SingleFlight()
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+        first = asyncio.create_task(flights.do("k", work))
+        second = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, flights.stats.abandoned
+    assert asyncio.run(main()) == ("done", 0)
+
+def test_cancelling_the_last_waiter_cancels_the_task():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = False
+        async def work():
+            nonlocal cancelled
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+        waiter = asyncio.create_task(flights.do("k", work))
+        await started.wait()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        return cancelled, flights.stats.abandoned
+    assert asyncio.run(main()) == (True, 1)
+
+def test_late_joiner_after_cancellation_starts_a_new_task():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+        async def fast():
+            return "fresh"
+        waiter = asyncio.create_task(flights.do("k", slow))
+        await started.wait()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # The abandoned task has not finished cancelling yet; joining it would raise CancelledError here
+        return await flights.do("k", fast), flights.stats.leaders
+    assert asyncio.run(main()) == ("fresh", 2)
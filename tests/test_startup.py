@@ -0,0 +1,62 @@
+import asyncio
+
+import discord
+from discord import app_commands
+
+from utils.startup import CommandSync, StartupProfile, discover_extensions
+
+def make_tree():
+    tree = app_commands.CommandTree(discord.Client(intents=discord.Intents.none()))
+    tree.synced = 0
+    async def sync():
+        tree.synced += 1
+        return tree.get_commands()
+    tree.sync = sync
+
+    @tree.command(name="ping", description="Ping the bot.")
+    async def ping(interaction: discord.Interaction):
+        pass
+    return tree
+
+def test_sync_only_when_the_tree_changes(tmp_path):
+    tree = make_tree()
+    sync = CommandSync(tree, str(tmp_path / "state" / "commands.sha256"))
+    async def main():
+        results = [await sync.run(1), await sync.run(1)]
+        @tree.command(name="pong", description="A new command.")
+        async def pong(interaction: discord.Interaction):
+            pass
+        results.append(await sync.run(1))
+        # A different application has its own commands
+        results.append(await sync.run(2))
+        return results
+    assert asyncio.run(main()) == [True, False, True, True]
+    assert tree.synced == 3
+
+def test_sync_always_and_never(tmp_path):
+    hash_file = str(tmp_path / "commands.sha256")
+    tree = make_tree()
+    async def main():
+        await CommandSync(tree, hash_file).run(1)
+        always = [await CommandSync(tree, hash_file, mode="always").run(1) for _ in range(2)]
+        never = await CommandSync(make_tree(), str(tmp_path / "other.sha256"), mode="never").run(1)
+        return always, never
+    assert asyncio.run(main()) == ([True, True], False)
+    assert tree.synced == 3
+
+def test_discover_extensions(tmp_path, monkeypatch):
+    for path in ("single/ai_chat.py", "single/_example.py", "single/README.md", "group/admin.py", "group/_private.py", "events.py"):
+        (tmp_path / "cogs" / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "cogs" / path).write_text("")
+    monkeypatch.chdir(tmp_path)
+    assert discover_extensions() == ["cogs.single.ai_chat", "cogs.group.admin"]
+    assert discover_extensions("missing") == []
+
+def test_profile_lists_nested_phases_in_order():
+    profile = StartupProfile()
+    with profile.phase("extensions"):
+        profile.mark("cogs.single.ai_chat", 0.25, depth=1)
+    profile.mark("gateway", 1.0)
+    assert [name for name, _, _ in profile.phases] == ["extensions", "cogs.single.ai_chat", "gateway"]
+    assert [name for name, _ in profile.top_level()] == ["extensions", "gateway"]
+    assert profile.report().splitlines()[1].startswith("  cogs.single.ai_chat")
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from utils.papercache import PaperKey
+from utils.textindex import TextIndex, build_segment, tokenize
+
+def make_index(root: str, pages: list) -> TextIndex:
+    """An index over `pages`, a list of (key, page text), built without PDFs or the process pool."""
+    index = TextIndex(root)
+    docs = [(doc_id, tokenize(text)) for doc_id, (_, text) in enumerate(pages)]
+    data, lexicon = build_segment(docs)
+    index.segments = [index._save_segment("seg_000000", data, lexicon)]
+    index.docs = [[*key, 1, len(tokens)] for (key, _), (_, tokens) in zip(pages, docs)]
+    index.total_length = sum(doc[6] for doc in index.docs)
+    return index
+
+def key(paper_id: int, subject: str = "9702") -> PaperKey:
+    return PaperKey(subject, 2020, "s", "qp", paper_id)
+
+def search(index: TextIndex, query: str, **kwargs) -> list:
+    return [hit.key.paper_id for hit in asyncio.run(index.search(query, **kwargs))]
+
+def test_bm25_prefers_pages_with_more_matches(tmp_path):
+    index = make_index(str(tmp_path), [
+        (key(1), "inertia of a body"),
+        (key(2), "inertia inertia and inertia of a wheel"),
+        (key(3), "electric field"),
+    ])
+    assert search(index, "inertia") == [2, 1]
+    index.close()
+
+def test_phrase_match_gets_a_bonus(tmp_path):
+    index = make_index(str(tmp_path), [
+        (key(1), "inertia has a moment to think about"),
+        (key(2), "find the moment of inertia here"),
+        (key(3), "gravity"), (key(4), "charge"), (key(5), "current"),
+    ])
+    assert search(index, "moment of inertia")[0] == 2
+    index.close()
+
+def test_repeated_query_words_are_kept_for_the_phrase(tmp_path):
+    index = make_index(str(tmp_path), [
+        (key(1), "very fast then very slow"),
+        (key(2), "very very slow then fast"),
+        (key(3), "gravity"), (key(4), "charge"), (key(5), "current"),
+    ])
+    hits = asyncio.run(index.search("very very"))
+    assert [hit.key.paper_id for hit in hits] == [2, 1]
+    # Same term frequency, so only the phrase bonus separates them
+    assert hits[0].score > hits[1].score * 1.4
+    index.close()
+
+def test_stopwords_are_skipped_unless_nothing_else_matches(tmp_path):
+    index = make_index(str(tmp_path), [
+        (key(1), "the mass of the car"),
+        (key(2), "the moment of the force"),
+        (key(3), "the field of the charge"),
+    ])
+    # "the" and "of" are on every page: only "moment" is scored
+    assert search(index, "the moment") == [2]
+    assert sorted(search(index, "of the")) == [1, 2, 3]
+    index.close()
+
+def test_phrase_skips_over_stopwords(tmp_path):
+    index = make_index(str(tmp_path), [
+        (key(1), "the moment of the force"),
+        (key(2), "force of a big moment"),
+        (key(3), "the mass of the car"),
+        (key(4), "the field of the charge"),
+    ])
+    hits = asyncio.run(index.search("moment of the force"))
+    assert hits[0].key.paper_id == 1
+    assert hits[0].score > hits[1].score * 1.4
+    index.close()
+
+def test_filters(tmp_path):
+    index = make_index(str(tmp_path), [
+        (key(1, "9702"), "moment of inertia"),
+        (key(2, "9709"), "moment of inertia"),
+    ])
+    assert search(index, "inertia", subject="9709") == [2]
+    assert search(index, "inertia", doctype="ms") == []
+    index.close()
+
+def test_extraction_pool_does_not_fork(tmp_path):
+    index = TextIndex(str(tmp_path))
+    try:
+        assert index.pool._mp_context.get_start_method() == "spawn"
+    finally:
+        index.close()
+
+def test_paperutils_does_not_import_pypdf():
+    code = "import sys, cogs.single.paperutils; print('pypdf' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=root).stdout
+    assert out.strip().splitlines()[-1] == "False"
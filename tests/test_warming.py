@@ -0,0 +1,133 @@
+import asyncio
+
+from tests.helpers import KEY
+from utils.fetcher import FetchResult, ForegroundGate
+from utils.warming import BandwidthLimiter, CacheWarmer, PopularityTracker
+
+class FakeClock:
+    """Replaces `time` and `asyncio.sleep` in utils.warming: sleeping advances the clock instantly."""
+    def __init__(self, monkeypatch, now: float = 1000.0):
+        self.now = now
+        self.sleeps = []
+        monkeypatch.setattr("utils.warming.time.time", lambda: self.now)
+        monkeypatch.setattr("utils.warming.time.monotonic", lambda: self.now)
+        monkeypatch.setattr("utils.warming.asyncio.sleep", self.sleep)
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def paper(paper_id: int):
+    return KEY._replace(paper_id=paper_id)
+
+def test_scores_decay_with_the_half_life(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    tracker = PopularityTracker(half_life=100)
+    for _ in range(4):
+        tracker.record(paper(11))
+    clock.now += 200
+    tracker.record(paper(12))
+    tracker.record(paper(12))
+    # 4 requests two half-lives ago are worth 1 now, less than 2 fresh ones
+    top = tracker.top(2)
+    assert [key.paper_id for key, _ in top] == [12, 11]
+    assert abs(top[1][1] - 1.0) < 1e-9
+
+def test_mark_scheme_requests_count_towards_the_paper(monkeypatch):
+    FakeClock(monkeypatch)
+    tracker = PopularityTracker()
+    tracker.record(KEY._replace(doctype="ms"))
+    tracker.record(KEY)
+    assert tracker.top(5) == [(KEY, 2.0)]
+
+def test_tracker_prunes_to_the_most_popular(monkeypatch):
+    FakeClock(monkeypatch)
+    tracker = PopularityTracker(max_entries=2)
+    for paper_id in range(1, 6):
+        for _ in range(6 - paper_id):
+            tracker.record(paper(paper_id))
+    # Going over twice the limit keeps only the top entries
+    assert [key.paper_id for key, _ in tracker.top(5)] == [1, 2]
+    assert len(tracker) == 2
+
+def test_bandwidth_limiter_paces_consumption(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    limiter = BandwidthLimiter(bytes_per_second=1000)
+    async def main():
+        await limiter.consume(500)
+        await limiter.consume(2000)
+        clock.now += 10  # idle time is not banked
+        await limiter.consume(1000)
+    asyncio.run(main())
+    assert clock.sleeps == [0.5, 2.0, 1.0]
+
+class FakeFetcher:
+    def __init__(self, missing=()):
+        self.hot_cache = set()
+        self.disk_cache = set()
+        self.gate = ForegroundGate()
+        self.missing = set(missing)
+        self.fetched = []
+
+    async def fetch(self, key, link, max_bytes=None, background=False):
+        assert background
+        self.fetched.append(key)
+        if key in self.missing:
+            return FetchResult(key, 404)
+        return FetchResult(key, 200, source="upstream", size=1000)
+
+def test_warmer_fetches_top_papers_and_their_mark_schemes(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    tracker = PopularityTracker()
+    tracker.record(paper(11))
+    tracker.record(paper(12))
+    tracker.record(paper(12))
+    fetcher = FakeFetcher(missing=[paper(11)._replace(doctype="ms")])
+    fetcher.disk_cache.add(paper(12))
+    warmer = CacheWarmer(fetcher, tracker, lambda key: f"https://example/{key.filename}", bytes_per_second=1000)
+    considered = asyncio.run(warmer.warm(top_n=5))
+    assert considered == 4
+    assert sorted(fetcher.fetched) == sorted([paper(11), paper(11)._replace(doctype="ms"), paper(12)._replace(doctype="ms")])
+    stats = warmer.stats
+    assert (stats.warmed, stats.already_warm, stats.failed, stats.bytes) == (2, 1, 1, 2000)
+    assert sum(clock.sleeps) == 2.0
+    assert warmer.snapshot()["tracked"] == 2
+
+class BlockingFetcher(FakeFetcher):
+    """Fetches block until `release` is set, so a test can start foreground work mid-download."""
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.cancelled = 0
+
+    async def fetch(self, key, link, max_bytes=None, background=False):
+        self.fetched.append(key)
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return FetchResult(key, 200, source="upstream", size=1000)
+
+def test_running_warm_download_is_preempted_and_retried():
+    tracker = PopularityTracker()
+    tracker.record(paper(11))
+    fetcher = BlockingFetcher()
+    fetcher.disk_cache.add(paper(11)._replace(doctype="ms"))
+    warmer = CacheWarmer(fetcher, tracker, lambda key: f"https://example/{key.filename}", bytes_per_second=0)
+    async def main():
+        run = asyncio.create_task(warmer.warm(top_n=1))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # A user command starts an upstream fetch while the warm download is running
+        fetcher.gate.enter()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        preempted = warmer.stats.preempted, fetcher.cancelled
+        fetcher.release.set()
+        fetcher.gate.exit()
+        await run
+        return preempted
+    assert asyncio.run(main()) == (1, 1)
+    assert fetcher.fetched == [paper(11), paper(11)]
+    assert warmer.stats.warmed == 1 and warmer.stats.failed == 0
@@ -0,0 +1,139 @@
+import logging
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from discord import Client, Message
+from discord.http import Route
+
+from utils.background import BackgroundTasks
+from utils.http import HTTPPool
+from utils.papercache import PaperKey
+
+class AttachmentStats:
+    def __init__(self):
+        self.reused = 0
+        self.refreshed = 0
+        self.stale = 0
+        self.recorded = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+def _expires_at(url: str) -> float:
+    """Expiry of a signed Discord CDN URL (the hex `ex` query parameter), or 0 if unsigned."""
+    try:
+        return float(int(parse_qs(urlsplit(url).query)["ex"][0], 16))
+    except (KeyError, IndexError, ValueError):
+        return 0
+
+class AttachmentRegistry:
+    """Remembers the Discord attachment each PDF was last uploaded as, so repeat requests can link it instead of re-uploading.
+
+    References are kept in memory and persisted to a MongoDB collection in the background.
+    CDN links are signed and expire, so a stored link is refreshed through Discord's API (and checked with a HEAD)
+    once it gets close to expiring. A reference that can no longer be refreshed is dropped and the caller uploads again."""
+    def __init__(self, client: Client, http_pool: HTTPPool, collection=None, refresh_margin: float = 3600):
+        self.client = client
+        self.http_pool = http_pool
+        self.collection = collection
+        self.refresh_margin = refresh_margin
+        self.stats = AttachmentStats()
+        self._refs: Dict[PaperKey, dict] = {}
+        self.writes = BackgroundTasks("attachments")
+        self.logger = logging.getLogger("main.attachments")
+
+    @staticmethod
+    def _doc_id(key: PaperKey) -> str:
+        return key.filename[:-4]
+
+    async def load(self):
+        if self.collection is None:
+            return
+        try:
+            async for doc in self.collection.find({}):
+                key = PaperKey(doc["subject"], doc["year"], doc["season"], doc["doctype"], doc["paper_id"])
+                self._refs[key] = doc
+        except Exception as e:
+            self.logger.warning(f"Could not load attachment references from MongoDB: {e.__class__.__name__}: {e}")
+            return
+        self.logger.info(f"Loaded {len(self._refs)} attachment references")
+
+    def __contains__(self, key: PaperKey) -> bool:
+        return key in self._refs
+
+    async def url_for(self, key: PaperKey) -> Optional[str]:
+        """A currently valid link to the stored attachment for `key`, or None if it has to be uploaded."""
+        ref = self._refs.get(key)
+        if ref is None:
+            return None
+        if _expires_at(ref["url"]) - time.time() > self.refresh_margin:
+            self.stats.reused += 1
+            return ref["url"]
+        url = await self._refresh(ref["url"])
+        if url is None:
+            self.stats.stale += 1
+            self.logger.debug("Attachment reference for %s is stale, dropping it", key.filename)
+            self.forget(key)
+            return None
+        self.stats.refreshed += 1
+        self.stats.reused += 1
+        ref["url"] = url
+        self._save(key, ref)
+        return url
+
+    async def _refresh(self, url: str) -> Optional[str]:
+        try:
+            data = await self.client.http.request(Route('POST', '/attachments/refresh-urls'), json={'attachment_urls': [url]})
+            refreshed = data["refreshed_urls"][0]["refreshed"]
+            # Refreshing only re-signs the URL; make sure the file is still there
+            async with self.http_pool.session.head(refreshed) as response:
+                if response.status not in range(200, 300):
+                    return None
+        except Exception as e:
+            self.logger.debug("Could not refresh attachment URL: %s", e.__class__.__name__)
+            return None
+        return refreshed
+
+    def remember(self, key: PaperKey, message: Message):
+        """Record the attachment of a message the bot just sent for `key`."""
+        attachment = next((a for a in message.attachments if a.filename == key.filename), None)
+        if attachment is None or message.flags.ephemeral:
+            return
+        ref = {
+            "subject": key.subject, "year": key.year, "season": key.season,
+            "doctype": key.doctype, "paper_id": key.paper_id,
+            "url": attachment.url, "size": attachment.size,
+            "channel_id": message.channel.id, "message_id": message.id, "stored_at": time.time(),
+        }
+        self._refs[key] = ref
+        self.stats.recorded += 1
+        self._save(key, ref)
+
+    def forget(self, key: PaperKey):
+        self._refs.pop(key, None)
+        if self.collection is not None:
+            self.writes.spawn(self._delete(key))
+
+    async def _delete(self, key: PaperKey):
+        try:
+            await self.collection.delete_one({"_id": self._doc_id(key)})
+        except Exception as e:
+            self.logger.warning(f"Could not delete attachment reference for {key.filename}: {e.__class__.__name__}")
+
+    def _save(self, key: PaperKey, ref: dict):
+        if self.collection is not None:
+            # Copy so later in-memory refreshes don't race the write
+            self.writes.spawn(self._persist(key, dict(ref)))
+
+    async def _persist(self, key: PaperKey, ref: dict):
+        try:
+            await self.collection.update_one({"_id": self._doc_id(key)},
+                                             {"$set": {k: v for k, v in ref.items() if k != "_id"}}, upsert=True)
+        except Exception as e:
+            self.logger.warning(f"Could not persist attachment reference for {key.filename}: {e.__class__.__name__}")
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["references"] = len(self._refs)
+        data["pending_writes"] = self.writes.pending
+        return data
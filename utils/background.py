@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from typing import Awaitable, Set
+
+class BackgroundTasks:
+    """Fire-and-forget coroutines, such as MongoDB writes that should not hold up a reply.
+
+    Keeps a reference to every task until it finishes, logs failures, and can wait for the stragglers on shutdown."""
+    def __init__(self, name: str):
+        self.name = name
+        self.failed = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self.logger = logging.getLogger("main.background")
+
+    def spawn(self, coro: Awaitable) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        e = task.exception()
+        if e is not None:
+            self.failed += 1
+            self.logger.warning(f"Background {self.name} task failed: {e.__class__.__name__}: {e}")
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout: float = 5):
+        """Wait up to `timeout` seconds for pending tasks, then cancel whatever is left."""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.background import BackgroundTasks
+from utils.http import HTTPPool
+from utils.papercache import PaperKey
+from utils.resilience import UpstreamGuards, RetryableStatus, RETRYABLE_STATUSES
+
+class ExistenceStats:
+    def __init__(self):
+        self.probes = 0
+        self.probe_errors = 0
+        self.negative_hits = 0
+        self.confirmed = 0
+        self.missing = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class ExistenceIndex:
+    """Which upstream paper URLs actually exist, and how large they are.
+
+    Filled by HEAD probes and by real fetches, persisted in a MongoDB collection, and mirrored in memory.
+    Misses are kept as a negative cache that expires after `negative_ttl` seconds."""
+    def __init__(self, http_pool: HTTPPool, collection=None, negative_ttl: float = 6 * 3600, recheck_seconds: float = 7 * 86400,
+                 guards: Optional[UpstreamGuards] = None):
+        self.http_pool = http_pool
+        self.guards = guards
+        self.collection = collection
+        self.negative_ttl = negative_ttl
+        self.recheck_seconds = recheck_seconds
+        self.stats = ExistenceStats()
+        self.writes = BackgroundTasks("existence")
+        self._exists: Dict[PaperKey, Tuple[Optional[int], float]] = {}  # key -> (content length, checked_at)
+        self._missing: Dict[PaperKey, float] = {}  # key -> checked_at
+        self.logger = logging.getLogger("main.existence")
+
+    @staticmethod
+    def _doc_id(key: PaperKey) -> str:
+        return key.filename[:-4]
+
+    async def load(self):
+        if self.collection is None:
+            return
+        try:
+            async for doc in self.collection.find({}):
+                key = PaperKey(doc["subject"], doc["year"], doc["season"], doc["doctype"], doc["paper_id"])
+                if doc.get("exists"):
+                    self._exists[key] = (doc.get("size"), doc.get("checked_at", 0))
+                else:
+                    self._missing[key] = doc.get("checked_at", 0)
+        except Exception as e:
+            self.logger.warning(f"Could not load the existence index from MongoDB: {e.__class__.__name__}: {e}")
+            return
+        self.logger.info(f"Loaded existence index: {len(self._exists)} existing, {len(self._missing)} missing")
+
+    def exists(self, key: PaperKey) -> Optional[bool]:
+        """True if confirmed, False if a known (unexpired) miss, None if unknown."""
+        if key in self._exists:
+            return True
+        if self.is_missing(key):
+            return False
+        return None
+
+    def size_of(self, key: PaperKey) -> Optional[int]:
+        entry = self._exists.get(key)
+        return entry[0] if entry else None
+
+    def is_missing(self, key: PaperKey) -> bool:
+        checked_at = self._missing.get(key)
+        if checked_at is None:
+            return False
+        if time.time() - checked_at >= self.negative_ttl:
+            del self._missing[key]
+            return False
+        return True
+
+    def check_negative(self, key: PaperKey) -> bool:
+        """Like `is_missing`, but counts as a negative-cache hit. Used on the request path."""
+        missing = self.is_missing(key)
+        if missing:
+            self.stats.negative_hits += 1
+        return missing
+
+    def needs_probe(self, key: PaperKey) -> bool:
+        entry = self._exists.get(key)
+        if entry is not None:
+            return time.time() - entry[1] >= self.recheck_seconds
+        return not self.is_missing(key)
+
+    def _remember(self, key: PaperKey, exists: bool, size: Optional[int]) -> float:
+        now = time.time()
+        if exists:
+            self._exists[key] = (size, now)
+            self._missing.pop(key, None)
+            self.stats.confirmed += 1
+        else:
+            self._missing[key] = now
+            self._exists.pop(key, None)
+            self.stats.missing += 1
+        return now
+
+    async def record(self, key: PaperKey, exists: bool, size: Optional[int] = None):
+        """Update the index and wait for MongoDB. Used by the probe sweep, which is background work anyway."""
+        await self._persist(key, exists, size, self._remember(key, exists, size))
+
+    def record_nowait(self, key: PaperKey, exists: bool, size: Optional[int] = None):
+        """Update the index now and persist it in the background. Used on the request path."""
+        checked_at = self._remember(key, exists, size)
+        if self.collection is not None:
+            self.writes.spawn(self._persist(key, exists, size, checked_at))
+
+    async def _persist(self, key: PaperKey, exists: bool, size: Optional[int], checked_at: float):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": self._doc_id(key)},
+                {"$set": {
+                    "subject": key.subject, "year": key.year, "season": key.season,
+                    "doctype": key.doctype, "paper_id": key.paper_id,
+                    "exists": exists, "size": size, "checked_at": checked_at,
+                }},
+                upsert=True,
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not persist existence of {key.filename}: {e.__class__.__name__}")
+
+    async def probe(self, key: PaperKey, link: str) -> Optional[bool]:
+        """HEAD one URL. Returns None when the answer is inconclusive (network error, 5xx, HEAD unsupported)."""
+        self.stats.probes += 1
+        async def attempt():
+            async with self.http_pool.session.head(link, allow_redirects=True) as response:
+                if response.status in RETRYABLE_STATUSES:
+                    raise RetryableStatus(response.status)
+                return response.status, response.content_length
+        try:
+            if self.guards is None:
+                status, size = await attempt()
+            else:
+                # Probes are best-effort and never retried
+                status, size = await self.guards.for_url(link).run(attempt, retries=0)
+        except Exception as e:
+            self.stats.probe_errors += 1
+            self.logger.debug("Probe of %s failed: %s", key.filename, e.__class__.__name__)
+            return None
+        if status in range(200, 300):
+            await self.record(key, True, size)
+            return True
+        if status in (404, 410):
+            await self.record(key, False)
+            return False
+        self.stats.probe_errors += 1
+        return None
+
+    async def probe_all(self, items: Iterable[Tuple[PaperKey, str]], concurrency: int = 4, delay: float = 0.25) -> int:
+        """Probe every (key, link) that is unknown or due for a recheck. Returns the number of probes sent."""
+        semaphore = asyncio.Semaphore(concurrency)
+        sent = 0
+        async def worker(key: PaperKey, link: str):
+            async with semaphore:
+                await self.probe(key, link)
+                await asyncio.sleep(delay)
+        tasks = []
+        for key, link in items:
+            if not self.needs_probe(key):
+                continue
+            sent += 1
+            tasks.append(asyncio.create_task(worker(key, link)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return sent
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["known_existing"] = len(self._exists)
+        data["known_missing"] = len(self._missing)
+        data["pending_writes"] = self.writes.pending
+        return data
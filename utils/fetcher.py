@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import time
+from io import BytesIO
+from typing import Optional
+
+from discord import File as dFile
+
+from utils.http import HTTPPool
+from utils.papercache import PaperKey, DiskPaperCache
+from utils.memcache import HotBytesCache
+from utils.singleflight import SingleFlight
+from utils.existence import ExistenceIndex
+from utils.resilience import UpstreamGuards, RetryableStatus
+from utils.providers import BodyTooLarge, HTTPProvider, ProviderRouter
+
+# Status used for bodies that were not downloaded because they exceed the size limit
+TOO_LARGE = 413
+
+class FetchResult:
+    """Outcome of a paper fetch. Exactly one of `path`/`data`/`url` is set when `ok`.
+
+    `url` points at an earlier Discord upload of the same PDF, which is linked instead of uploaded again."""
+    def __init__(self, key: PaperKey, status: int, path: Optional[str] = None, data: Optional[bytes] = None,
+                 source: str = "upstream", size: Optional[int] = None, url: Optional[str] = None):
+        self.key = key
+        self.status = status
+        self.path = path
+        self.data = data
+        self.url = url
+        self.source = source
+        self.size = size if size is not None else (len(data) if data is not None else None)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 304 or self.status in range(200, 300)
+
+    @property
+    def too_large(self) -> bool:
+        return self.status == TOO_LARGE
+
+    @property
+    def filename(self) -> str:
+        return self.key.filename
+
+    def to_file(self) -> dFile:
+        if self.path is not None:
+            return dFile(self.path, filename=self.filename)
+        # BytesIO shares an immutable bytes object rather than copying it
+        return dFile(BytesIO(self.data), filename=self.filename)
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def _read_all(fp) -> bytes:
+    fp.seek(0)
+    return fp.read()
+
+class ForegroundGate:
+    """Tracks foreground fetches in flight so background work can wait for, and yield to, them."""
+    def __init__(self):
+        self.active = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.busy = asyncio.Event()
+
+    def enter(self):
+        self.active += 1
+        self.idle.clear()
+        self.busy.set()
+
+    def exit(self):
+        self.active -= 1
+        if self.active == 0:
+            self.busy.clear()
+            self.idle.set()
+
+class FetcherStats:
+    def __init__(self):
+        self.downloads = 0
+        self.negative = 0
+        self.too_large = 0
+        self.revalidations = 0
+        self.not_modified = 0
+        self.stale_served = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class PaperFetcher:
+    """Serves PDFs from the in-memory hot tier, then the disk cache, falling back to the upstream host on a miss.
+
+    Cached copies older than their freshness window are revalidated with a conditional GET.
+    Upstream bodies are streamed into a spooled temp file and aborted once they exceed the caller's size limit.
+    Upstream requests go through a ProviderRouter; without one, the caller's link is fetched directly."""
+
+    def __init__(self, http_pool: HTTPPool, disk_cache: DiskPaperCache, hot_cache: HotBytesCache,
+                 fresh_seconds: float = 30 * 86400, recent_fresh_seconds: float = 86400, recent_years: int = 1,
+                 existence: Optional[ExistenceIndex] = None, max_bytes: int = 50 * 1024**2, spool_bytes: int = 1024**2,
+                 guards: Optional[UpstreamGuards] = None, router: Optional[ProviderRouter] = None):
+        self.http_pool = http_pool
+        self.disk_cache = disk_cache
+        self.hot_cache = hot_cache
+        self.fresh_seconds = fresh_seconds
+        self.recent_fresh_seconds = recent_fresh_seconds
+        self.recent_years = recent_years
+        self.existence = existence
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.guards = guards
+        self.router = router or ProviderRouter([HTTPProvider("direct", http_pool, guards=guards)], spool_bytes=spool_bytes)
+        self.flights = SingleFlight()
+        self.gate = ForegroundGate()
+        self.stats = FetcherStats()
+        self.logger = logging.getLogger("main.fetcher")
+
+    def is_fresh(self, key: PaperKey, meta: dict) -> bool:
+        # Recent sessions still get errata, so they use the shorter window
+        recent = key.year >= time.gmtime().tm_year - self.recent_years
+        max_age = self.recent_fresh_seconds if recent else self.fresh_seconds
+        return time.time() - meta.get("checked_at", 0) < max_age
+
+    def known_size(self, key: PaperKey) -> Optional[int]:
+        size = self.disk_cache.size_of(key)
+        if size is None and self.existence is not None:
+            size = self.existence.size_of(key)
+        return size
+
+    async def fetch(self, key: PaperKey, link: str, max_bytes: Optional[int] = None, background: bool = False) -> FetchResult:
+        """Fetch one PDF. `max_bytes` (e.g. the guild's upload limit) caps what is served or downloaded.
+
+        Foreground fetches hold the gate while they wait on an upstream provider, and background work yields to them."""
+        max_bytes = min(max_bytes or self.max_bytes, self.max_bytes)
+        known = self.known_size(key)
+        if known is not None and known > max_bytes:
+            self.stats.too_large += 1
+            return FetchResult(key, TOO_LARGE, source="size", size=known)
+        data = self.hot_cache.get(key)
+        if data is not None and len(data) > max_bytes:
+            self.stats.too_large += 1
+            return FetchResult(key, TOO_LARGE, source="memory", size=len(data))
+        if data is not None:
+            meta = self.disk_cache.meta(key)
+            if meta is None or self.is_fresh(key, meta):
+                return FetchResult(key, 200, data=data, source="memory")
+        if self.existence is not None and key not in self.disk_cache and self.existence.check_negative(key):
+            # Known to be missing upstream, answer without waiting on a download
+            self.stats.negative += 1
+            return FetchResult(key, 404, source="negative")
+        # Identical concurrent misses share one disk read / upstream download. The shared fetch uses the
+        # bot-wide limit so callers with different upload limits coalesce; each caller's limit is applied after.
+        result = await self.flights.do(key, lambda: self._fetch(key, link, self.max_bytes, background))
+        if result.ok and result.size is not None and result.size > max_bytes:
+            self.stats.too_large += 1
+            return FetchResult(key, TOO_LARGE, source=result.source, size=result.size)
+        return result
+
+    async def _fetch(self, key: PaperKey, link: str, max_bytes: int, background: bool) -> FetchResult:
+        path = await self.disk_cache.get(key)
+        if path is None:
+            return await self._download(key, link, max_bytes, background)
+        meta = self.disk_cache.meta(key) or {}
+        if not self.is_fresh(key, meta):
+            result = await self._revalidate(key, link, meta, max_bytes, background)
+            if result is not None:
+                return result
+        return await self._serve_disk(key, path)
+
+    async def _upstream(self, key: PaperKey, link: str, headers: dict, max_bytes: int, background: bool,
+                        validator_source: Optional[str] = None):
+        """`router.get`, holding the foreground gate unless this is background work. Disk hits never take the gate,
+        so they do not preempt prefetches."""
+        if background:
+            return await self.router.get(key, link, headers, max_bytes, validator_source)
+        self.gate.enter()
+        try:
+            return await self.router.get(key, link, headers, max_bytes, validator_source)
+        finally:
+            self.gate.exit()
+
+    async def _serve_disk(self, key: PaperKey, path: str) -> FetchResult:
+        if key in self.hot_cache:
+            return FetchResult(key, 200, data=self.hot_cache.get(key), source="memory")
+        size = self.disk_cache.size_of(key)
+        if size is not None and self.hot_cache.would_admit(key, size):
+            try:
+                data = await asyncio.to_thread(_read_file, path)
+            except OSError:
+                data = None
+            if data is not None and self.hot_cache.put(key, data):
+                return FetchResult(key, 200, data=data, source="disk")
+        return FetchResult(key, 200, path=path, source="disk", size=size)
+
+    async def _store(self, key: PaperKey, fp, size: int, meta: dict, status: int) -> FetchResult:
+        """Hand a downloaded body to the caches and build the result. Closes `fp`."""
+        try:
+            data = None
+            if self.hot_cache.would_admit(key, size):
+                data = await asyncio.to_thread(_read_all, fp)
+                self.hot_cache.put(key, data)
+            try:
+                await self.disk_cache.put_file(key, fp, size, meta)
+            except OSError as e:
+                self.logger.warning(f"Could not write {key.filename} to the paper cache: {e}")
+            if data is None:
+                path = await self.disk_cache.get(key)
+                if path is not None:
+                    return FetchResult(key, status, path=path, size=size)
+                # Neither tier kept it; fall back to holding this one body in memory
+                data = await asyncio.to_thread(_read_all, fp)
+            return FetchResult(key, status, data=data)
+        finally:
+            fp.close()
+
+    async def _revalidate(self, key: PaperKey, link: str, meta: dict, max_bytes: int, background: bool) -> Optional[FetchResult]:
+        """Conditional GET for a stale cached copy. Returns None when the cached copy should be served."""
+        headers = {
+            'Accept': 'application/pdf'
+        }
+        if meta.get("etag"):
+            headers['If-None-Match'] = meta["etag"]
+        if meta.get("last_modified"):
+            headers['If-Modified-Since'] = meta["last_modified"]
+        self.stats.revalidations += 1
+        try:
+            status, fp, size, new_meta = await self._upstream(key, link, headers, max_bytes, background,
+                                                              validator_source=meta.get("provider"))
+        except BodyTooLarge:
+            # The cached copy is still a valid answer
+            self.stats.stale_served += 1
+            return None
+        except Exception as e:
+            # Includes an open circuit: keep serving from cache while the host is unhealthy
+            self.logger.warning(f"Revalidation of {key.filename} failed ({e.__class__.__name__}), serving stale copy")
+            self.stats.stale_served += 1
+            return None
+        if status == 304:
+            self.stats.not_modified += 1
+            updated = dict(meta, checked_at=time.time())
+            if new_meta.get("etag"):
+                updated["etag"] = new_meta["etag"]
+            await self.disk_cache.update_meta(key, updated)
+            return None
+        if fp is None:
+            self.logger.warning(f"Revalidation of {key.filename} returned {status}, serving stale copy")
+            self.stats.stale_served += 1
+            return None
+        self.stats.downloads += 1
+        return await self._store(key, fp, size, new_meta, status)
+
+    async def _download(self, key: PaperKey, link: str, max_bytes: int, background: bool) -> FetchResult:
+        headers = {
+            'Accept': 'application/pdf'
+        }
+        try:
+            status, fp, size, meta = await self._upstream(key, link, headers, max_bytes, background)
+        except BodyTooLarge as e:
+            self.stats.too_large += 1
+            self.logger.info(f"Aborted download of {key.filename}: over the {max_bytes} byte limit")
+            return FetchResult(key, TOO_LARGE, size=e.size)
+        except RetryableStatus as e:
+            # Still failing after the retries
+            return FetchResult(key, e.status)
+        if fp is None:
+            if self.existence is not None and status in (404, 410):
+                self.existence.record_nowait(key, False)
+            return FetchResult(key, status)
+        self.stats.downloads += 1
+        if self.existence is not None and self.existence.exists(key) is not True:
+            self.existence.record_nowait(key, True, size)
+        return await self._store(key, fp, size, meta, status)
+
+    def snapshot(self) -> dict:
+        return {
+            "fetcher": self.stats.to_dict(),
+            "single_flight": self.flights.snapshot(),
+            "memory": self.hot_cache.snapshot(),
+            "disk": self.disk_cache.snapshot(),
+            "http": self.http_pool.snapshot(),
+            "existence": self.existence.snapshot() if self.existence is not None else None,
+            "upstream": self.guards.snapshot() if self.guards is not None else None,
+            "providers": self.router.snapshot(),
+        }
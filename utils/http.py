@@ -0,0 +1,104 @@
+import logging
+import aiohttp
+from aiohttp import TraceConfig, ClientTimeout, TCPConnector
+
+class PoolStats:
+    """Counters for the pooled HTTP client, updated from aiohttp trace hooks."""
+    def __init__(self):
+        self.requests = 0
+        self.failed_requests = 0
+        self.in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.connections_queued = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class HTTPPool:
+    """Long-lived aiohttp session shared by every upstream fetch of the bot.
+
+    Keeps TCP/TLS connections alive between commands, caches DNS lookups and caps connections per host."""
+    def __init__(self, limit: int = 100, limit_per_host: int = 10, dns_ttl: int = 300, keepalive_timeout: float = 60,
+                 total_timeout: float = 60, connect_timeout: float = 10, read_timeout: float = 30,
+                 user_agent: str = "PastPaperBot/1.0"):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = ClientTimeout(total=total_timeout, connect=connect_timeout, sock_read=read_timeout)
+        self.user_agent = user_agent
+        self.stats = PoolStats()
+        self._session: aiohttp.ClientSession = None
+        self.logger = logging.getLogger("main.http")
+
+    def _trace_config(self) -> TraceConfig:
+        stats = self.stats
+        trace = TraceConfig()
+        async def on_request_start(session, ctx, params):
+            stats.requests += 1
+            stats.in_flight += 1
+        async def on_request_end(session, ctx, params):
+            stats.in_flight -= 1
+        async def on_request_exception(session, ctx, params):
+            stats.in_flight -= 1
+            stats.failed_requests += 1
+        async def on_connection_create_end(session, ctx, params):
+            stats.connections_created += 1
+        async def on_connection_reuseconn(session, ctx, params):
+            stats.connections_reused += 1
+        async def on_connection_queued_start(session, ctx, params):
+            stats.connections_queued += 1
+        async def on_dns_cache_hit(session, ctx, params):
+            stats.dns_cache_hits += 1
+        async def on_dns_cache_miss(session, ctx, params):
+            stats.dns_cache_misses += 1
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_connection_queued_start.append(on_connection_queued_start)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers={'User-Agent': self.user_agent},
+            trace_configs=[self._trace_config()],
+        )
+        self.logger.info(f"HTTP pool started (limit={self.limit}, per_host={self.limit_per_host}, dns_ttl={self.dns_ttl}s)")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HTTP pool is not started")
+        return self._session
+
+    def snapshot(self) -> dict:
+        """Return the pool counters plus the connector's current usage."""
+        data = self.stats.to_dict()
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+            data["connections_acquired"] = len(getattr(connector, "_acquired", ()))
+            data["connections_idle"] = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        return data
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            self.logger.info(f"HTTP pool closed. Stats: {self.snapshot()}")
+        self._session = None
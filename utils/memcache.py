@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+class FrequencySketch:
+    """Count-min sketch with periodic halving, used to estimate how often a key is requested.
+
+    Counters saturate at 15 and are halved every `sample_size` increments so old popularity fades."""
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, width: int = 4096):
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self.mask = self.width - 1
+        self.table = bytearray(self.width * self.DEPTH)
+        self.sample_size = self.width * 10
+        self.additions = 0
+
+    def _indexes(self, key: Hashable):
+        h = hash(key)
+        for row in range(self.DEPTH):
+            yield row * self.width + (hash((h, row)) & self.mask)
+
+    def increment(self, key: Hashable):
+        added = False
+        for i in self._indexes(key):
+            if self.table[i] < self.MAX_COUNT:
+                self.table[i] += 1
+                added = True
+        if added:
+            self.additions += 1
+            if self.additions >= self.sample_size:
+                self._reset()
+
+    def estimate(self, key: Hashable) -> int:
+        return min(self.table[i] for i in self._indexes(key))
+
+    def _reset(self):
+        self.table = bytearray(c >> 1 for c in self.table)
+        self.additions //= 2
+
+class HotCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.evictions = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class HotBytesCache:
+    """Byte-bounded in-memory cache with TinyLFU admission.
+
+    Entries are stored as immutable `bytes`, so callers get a read-only buffer they can wrap
+    (e.g. in `BytesIO`, which shares an immutable bytes object instead of copying it).
+    A new entry only displaces LRU victims when its estimated request frequency is higher than theirs."""
+    def __init__(self, max_bytes: int, max_item_bytes: Optional[int] = None, sketch_width: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes or max_bytes // 8
+        self.total_bytes = 0
+        self.sketch = FrequencySketch(sketch_width)
+        self.stats = HotCacheStats()
+        self._data: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        self.sketch.increment(key)
+        data = self._data.get(key)
+        if data is None:
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return data
+
+    def _victims(self, size: int) -> list:
+        # LRU entries that would have to go to make room for `size` bytes
+        needed = self.total_bytes + size - self.max_bytes
+        victims = []
+        for key, data in self._data.items():
+            if needed <= 0:
+                break
+            victims.append(key)
+            needed -= len(data)
+        return victims
+
+    def would_admit(self, key: Hashable, size: int) -> bool:
+        """Check admission without storing anything, so callers can skip loading data that would be rejected."""
+        if size > self.max_item_bytes or self.max_bytes <= 0:
+            return False
+        if key in self._data:
+            return True
+        victims = self._victims(size)
+        if not victims:
+            return True
+        candidate = self.sketch.estimate(key)
+        return all(candidate > self.sketch.estimate(v) for v in victims)
+
+    def put(self, key: Hashable, data: bytes) -> bool:
+        data = bytes(data)
+        size = len(data)
+        if not self.would_admit(key, size):
+            self.stats.rejected += 1
+            return False
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        for victim in self._victims(size):
+            self.total_bytes -= len(self._data.pop(victim))
+            self.stats.evictions += 1
+        self._data[key] = data
+        self.total_bytes += size
+        self.stats.admitted += 1
+        return True
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["entries"] = len(self._data)
+        data["bytes"] = self.total_bytes
+        data["max_bytes"] = self.max_bytes
+        return data
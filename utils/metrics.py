@@ -0,0 +1,236 @@
+import asyncio
+import bisect
+import logging
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+from discord import Interaction
+from discord.utils import utcnow
+
+# Seconds; covers everything from cache hits to slow uploads
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """Process-wide counters, gauges and histograms, each keyed by a name and a set of labels.
+
+    Components also register collectors: functions returning (nested) dicts of numbers, such as their `snapshot()`,
+    which are exported as gauges at scrape time. Rendered in the Prometheus text format by `render()`."""
+    def __init__(self, namespace: str = "ppb"):
+        self.namespace = namespace
+        self._help: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._buckets: Dict[str, tuple] = {}
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str, buckets=None):
+        self._help[name] = (kind, help_text)
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, prefix: str, collect: Callable[[], dict]):
+        self._collectors[prefix] = collect
+
+    def remove_collector(self, prefix: str):
+        self._collectors.pop(prefix, None)
+
+    def _collected(self) -> Dict[str, float]:
+        values = {}
+        def flatten(prefix: str, data):
+            if isinstance(data, dict):
+                for k, v in data.items():
+                    flatten(f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', str(k))}", v)
+            elif isinstance(data, bool):
+                values[prefix] = float(data)
+            elif isinstance(data, (int, float)):
+                values[prefix] = data
+        for prefix, collect in list(self._collectors.items()):
+            try:
+                flatten(prefix, collect())
+            except Exception as e:
+                logging.getLogger("main.metrics").warning(f"Metrics collector {prefix} failed: {e.__class__.__name__}")
+        return values
+
+    def render(self) -> str:
+        lines = []
+        def header(name: str, kind: str):
+            full = f"{self.namespace}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full} {self._help[name][1]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+        for name, series in self._counters.items():
+            full = header(name, "counter")
+            lines.extend(f"{full}{_format_labels(k)} {v}" for k, v in series.items())
+        for name, series in self._gauges.items():
+            full = header(name, "gauge")
+            lines.extend(f"{full}{_format_labels(k)} {v}" for k, v in series.items())
+        for name, series in self._histograms.items():
+            full = header(name, "histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, n in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{full}_count{_format_labels(key)} {histogram.count}")
+        for name, value in self._collected().items():
+            full = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Human-readable digest: counters, gauges, and count/avg/p50/p95 for each histogram series."""
+        def label_text(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key)
+        data = {}
+        for name, series in self._counters.items():
+            data.update({f"{name}[{label_text(k)}]": v for k, v in series.items()})
+        for name, series in self._gauges.items():
+            data.update({f"{name}[{label_text(k)}]": v for k, v in series.items()})
+        for name, series in self._histograms.items():
+            for key, histogram in series.items():
+                data[f"{name}[{label_text(key)}]"] = {
+                    "count": histogram.count,
+                    "avg": histogram.sum / histogram.count if histogram.count else None,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                }
+        return data
+
+def observe_interaction(metrics: Metrics, interaction: Interaction, command: str):
+    """Record a command's end-to-end latency as the user sees it: from the interaction's creation until now."""
+    metrics.observe("command_seconds", (utcnow() - interaction.created_at).total_seconds(), command=command)
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task, i.e. how long callbacks are blocking it."""
+    def __init__(self, metrics: Metrics, interval: float = 0.5):
+        self.metrics = metrics
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.metrics.observe("event_loop_lag_seconds", lag)
+            self.metrics.set("event_loop_lag_last_seconds", lag)
+
+class MetricsServer:
+    """Serves `GET /metrics` in the Prometheus text format."""
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+        self.logger = logging.getLogger("main.metrics")
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics = Metrics()
+metrics.describe("command_seconds", "histogram", "End-to-end command latency, from the interaction being created to the reply")
+metrics.describe("command_phase_seconds", "histogram", "Time spent per command phase (defer, queue, fetch, build, query, upload)")
+metrics.describe("upstream_responses_total", "counter", "Upstream paper responses by provider and status code")
+metrics.describe("upstream_bytes_total", "counter", "Bytes downloaded from paper providers")
+metrics.describe("discord_upload_bytes_total", "counter", "Bytes uploaded to Discord as attachments")
+metrics.describe("gemini_seconds", "histogram", "Gemini latency to the first chunk and to the full response")
+metrics.describe("event_loop_lag_seconds", "histogram", "How late the event loop woke a sleeping task",
+                 buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+metrics.describe("event_loop_lag_last_seconds", "gauge", "Most recent event loop lag sample")
+metrics.describe("startup_phase_seconds", "gauge", "Time spent in each startup phase (imports, login, extensions, command sync, gateway)")
@@ -0,0 +1,14 @@
+class LazyCollection:
+    """A MongoDB collection of the bot's database that is only looked up on first use.
+
+    Cogs can hand this to their components at construction time without creating the motor client (and importing
+    motor) on the startup path; the client is created by `bot.db` when the first operation is attempted."""
+    def __init__(self, bot, name: str):
+        self._bot = bot
+        self._name = name
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = self._bot.db[self._bot.const.MONGO_DB_NAME][self._name]
+        return getattr(self._collection, attr)
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, NamedTuple, Optional
+
+class PaperKey(NamedTuple):
+    """Identifies one immutable PDF (question paper or mark scheme)."""
+    subject: str   # short subject ID, e.g. "9709"
+    year: int
+    season: str    # season code, e.g. "m", "s", "w"
+    doctype: str   # "qp" or "ms"
+    paper_id: int
+
+    @property
+    def filename(self) -> str:
+        return f"{self.subject}_{self.season}{str(self.year)[-2:]}_{self.doctype}_{self.paper_id}.pdf"
+
+    @property
+    def relpath(self) -> str:
+        return os.path.join(self.subject, str(self.year), self.filename)
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self.rejected = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class DiskPaperCache:
+    """Size-bounded LRU store of PDFs on local disk.
+
+    Recency is kept in memory and mirrored to file mtimes, so the LRU order survives restarts.
+    Writes go to a temp file in the same directory and are moved into place atomically.
+    Upstream validators (ETag / Last-Modified) and the last check time live in a `.json` sidecar next to each PDF."""
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.stats = CacheStats()
+        self._index: "OrderedDict[PaperKey, int]" = OrderedDict()
+        self._meta: Dict[PaperKey, dict] = {}
+        self._lock = asyncio.Lock()
+        self.logger = logging.getLogger("main.papercache")
+
+    def path_for(self, key: PaperKey) -> str:
+        return os.path.join(self.root, key.relpath)
+
+    def meta_path_for(self, key: PaperKey) -> str:
+        return self.path_for(key) + ".json"
+
+    def _parse_key(self, subject: str, year: str, filename: str) -> Optional[PaperKey]:
+        # {subject}_{season}{yy}_{doctype}_{paper_id}.pdf
+        if not filename.endswith(".pdf"):
+            return None
+        parts = filename[:-4].split("_")
+        if len(parts) != 4 or parts[0] != subject or not year.isdigit():
+            return None
+        try:
+            return PaperKey(subject, int(year), parts[1][0], parts[2], int(parts[3]))
+        except (ValueError, IndexError):
+            return None
+
+    def _scan(self) -> list:
+        entries = []
+        os.makedirs(self.root, exist_ok=True)
+        for dirpath, _, filenames in os.walk(self.root):
+            rel = os.path.relpath(dirpath, self.root).split(os.sep)
+            for fn in filenames:
+                path = os.path.join(dirpath, fn)
+                if fn.startswith(".tmp"):
+                    # Leftover from an interrupted write
+                    os.remove(path)
+                    continue
+                if len(rel) != 2:
+                    continue
+                key = self._parse_key(rel[0], rel[1], fn)
+                if key is None:
+                    continue
+                st = os.stat(path)
+                try:
+                    with open(path + ".json", "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    meta = {}
+                entries.append((st.st_mtime, key, st.st_size, meta))
+        entries.sort(key=lambda e: e[0])
+        return entries
+
+    async def load(self):
+        """Rebuild the index from whatever is already on disk."""
+        entries = await asyncio.to_thread(self._scan)
+        async with self._lock:
+            self._index.clear()
+            self._meta.clear()
+            self.total_bytes = 0
+            for _, key, size, meta in entries:
+                self._index[key] = size
+                self._meta[key] = meta
+                self.total_bytes += size
+            await self._evict()
+        self.logger.info(f"Loaded paper cache from {self.root}: {len(self._index)} files, {self.total_bytes} bytes")
+
+    def __contains__(self, key: PaperKey) -> bool:
+        return key in self._index
+
+    def keys(self) -> List[PaperKey]:
+        """Cached keys, least recently used first."""
+        return list(self._index)
+
+    def size_of(self, key: PaperKey) -> Optional[int]:
+        return self._index.get(key)
+
+    def meta(self, key: PaperKey) -> Optional[dict]:
+        """Validators stored for a cached PDF (`etag`, `last_modified`, `checked_at`), or None if not cached."""
+        if key not in self._index:
+            return None
+        return self._meta.get(key, {})
+
+    async def get(self, key: PaperKey) -> Optional[str]:
+        """Return the path of a cached PDF, or None on a miss."""
+        if key not in self._index:
+            self.stats.misses += 1
+            return None
+        path = self.path_for(key)
+        try:
+            await asyncio.to_thread(os.utime, path)
+        except FileNotFoundError:
+            # Removed behind our back
+            async with self._lock:
+                self.total_bytes -= self._index.pop(key, 0)
+                self._meta.pop(key, None)
+            self.stats.misses += 1
+            return None
+        if key not in self._index:
+            # Evicted by a concurrent put while we were touching it; the file is gone
+            self.stats.misses += 1
+            return None
+        self._index.move_to_end(key)
+        self.stats.hits += 1
+        return path
+
+    def _atomic_write(self, path: str, data):
+        """Write `data` (bytes or a readable binary file object) to `path` via a temp file and os.replace."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    data.seek(0)
+                    shutil.copyfileobj(data, f, 1024 * 1024)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _write(self, key: PaperKey, data, meta: dict):
+        self._atomic_write(self.path_for(key), data)
+        self._atomic_write(self.meta_path_for(key), json.dumps(meta).encode("utf-8"))
+
+    async def put(self, key: PaperKey, data: bytes, meta: Optional[dict] = None):
+        await self._put(key, data, len(data), meta)
+
+    async def put_file(self, key: PaperKey, fp: BinaryIO, size: int, meta: Optional[dict] = None):
+        """Like `put`, but copies from an open file object so large bodies never have to be held in memory."""
+        await self._put(key, fp, size, meta)
+
+    async def _put(self, key: PaperKey, data, size: int, meta: Optional[dict]):
+        if size > self.max_bytes:
+            self.stats.rejected += 1
+            return
+        meta = meta or {}
+        await asyncio.to_thread(self._write, key, data, meta)
+        async with self._lock:
+            self.total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._meta[key] = meta
+            self.stats.writes += 1
+            await self._evict()
+
+    async def update_meta(self, key: PaperKey, meta: dict):
+        if key not in self._index:
+            return
+        self._meta[key] = meta
+        await asyncio.to_thread(self._atomic_write, self.meta_path_for(key), json.dumps(meta).encode("utf-8"))
+
+    async def _evict(self):
+        while self.total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._meta.pop(key, None)
+            self.total_bytes -= size
+            self.stats.evictions += 1
+            for path in (self.path_for(key), self.meta_path_for(key)):
+                try:
+                    await asyncio.to_thread(os.remove, path)
+                except FileNotFoundError:
+                    pass
+            self.logger.debug("Evicted %s (%s bytes) from paper cache", key.filename, size)
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["files"] = len(self._index)
+        data["bytes"] = self.total_bytes
+        data["max_bytes"] = self.max_bytes
+        return data
@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, Optional
+
+from utils.fetcher import PaperFetcher, FetchResult
+from utils.papercache import PaperKey
+
+async def fetch_preemptible(fetcher: PaperFetcher, key: PaperKey, link: str,
+                            max_bytes: Optional[int] = None) -> Optional[FetchResult]:
+    """Background fetch that is cancelled as soon as foreground work starts. Returns None if it was preempted."""
+    job = asyncio.create_task(fetcher.fetch(key, link, max_bytes=max_bytes, background=True))
+    busy = asyncio.create_task(fetcher.gate.busy.wait())
+    try:
+        await asyncio.wait({job, busy}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        busy.cancel()
+    if not job.done():
+        job.cancel()
+        await asyncio.gather(job, return_exceptions=True)
+        return None
+    return job.result()
+
+class PrefetchStats:
+    def __init__(self):
+        self.scheduled = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.preempted = 0
+        self.hits = 0
+        self.misses = 0
+    def to_dict(self) -> dict:
+        data = dict(self.__dict__)
+        # Share of speculative downloads that were later requested
+        data["hit_rate"] = self.hits / self.completed if self.completed else 0.0
+        return data
+
+class Prefetcher:
+    """Low-priority background queue that warms the caches with papers users are likely to ask for next.
+
+    Jobs only start while no foreground fetch is in flight, and a running job is cancelled and requeued
+    as soon as foreground work starts."""
+    def __init__(self, fetcher: PaperFetcher, concurrency: int = 1, max_queue: int = 256, remember_seconds: float = 3600):
+        self.fetcher = fetcher
+        self.concurrency = concurrency
+        self.remember_seconds = remember_seconds
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue(max_queue)
+        self.stats = PrefetchStats()
+        self._seq = itertools.count()
+        self._pending: set = set()
+        self._warmed: Dict[PaperKey, float] = {}
+        self._workers = []
+        self.logger = logging.getLogger("main.prefetch")
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _is_warm(self, key: PaperKey) -> bool:
+        return key in self.fetcher.hot_cache or key in self.fetcher.disk_cache
+
+    def schedule(self, key: PaperKey, link: str, max_bytes: Optional[int] = None, priority: int = 10) -> bool:
+        """Queue a speculative fetch. Lower `priority` runs first. Returns False if it was not queued."""
+        existence = self.fetcher.existence
+        if key in self._pending or self._is_warm(key) or (existence is not None and existence.is_missing(key)):
+            self.stats.skipped += 1
+            return False
+        if not self._enqueue(priority, key, link, max_bytes):
+            return False
+        self.stats.scheduled += 1
+        return True
+
+    def _enqueue(self, priority: int, key: PaperKey, link: str, max_bytes: Optional[int]) -> bool:
+        try:
+            self.queue.put_nowait((priority, next(self._seq), key, link, max_bytes))
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            return False
+        self._pending.add(key)
+        return True
+
+    def record_request(self, key: PaperKey, result: FetchResult):
+        """Call when a user asks for a paper, so the hit rate of speculation can be measured."""
+        warmed_at = self._warmed.pop(key, None)
+        if warmed_at is None or time.monotonic() - warmed_at > self.remember_seconds:
+            return
+        if result.source in ("memory", "disk"):
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+
+    def _forget_old(self):
+        cutoff = time.monotonic() - self.remember_seconds
+        for key in [k for k, t in self._warmed.items() if t < cutoff]:
+            del self._warmed[key]
+
+    async def _run(self, key: PaperKey, link: str, max_bytes: Optional[int]) -> bool:
+        """Run one job, cancelling it if foreground work starts. Returns False if it was preempted."""
+        result = await fetch_preemptible(self.fetcher, key, link, max_bytes)
+        if result is None:
+            return False
+        if result.ok:
+            self.stats.completed += 1
+            self._warmed[key] = time.monotonic()
+        else:
+            self.stats.failed += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            priority, _, key, link, max_bytes = await self.queue.get()
+            self._pending.discard(key)
+            try:
+                await self.fetcher.gate.idle.wait()
+                if self._is_warm(key):
+                    continue
+                if not await self._run(key, link, max_bytes):
+                    self.stats.preempted += 1
+                    # Back of its priority class; retried once foreground work is done
+                    self._enqueue(priority, key, link, max_bytes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats.failed += 1
+                self.logger.debug("Prefetch of %s failed: %s", key.filename, e.__class__.__name__)
+            finally:
+                self.queue.task_done()
+                self._forget_old()
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["queued"] = self.queue.qsize()
+        return data
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.http import HTTPPool
+from utils.papercache import PaperKey
+from utils.metrics import metrics
+from utils.resilience import UpstreamGuards, RetryableStatus, RETRYABLE_STATUSES, CircuitBreaker
+
+# (status, body file or None, size, validators)
+ProviderResponse = Tuple[int, Optional[object], int, Optional[dict]]
+
+# Validators are only meaningful to the host that issued them
+CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+class BodyTooLarge(Exception):
+    def __init__(self, size: int):
+        super().__init__(f"Response body exceeds the size limit ({size} bytes so far)")
+        self.size = size
+
+def validators_from(headers) -> dict:
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "checked_at": time.time(),
+    }
+
+async def stream_body(response, max_bytes: int, spool_bytes: int, chunk_size: int = 64 * 1024):
+    """Stream a response into a spooled temp file. Raises BodyTooLarge as soon as the limit is crossed."""
+    if response.content_length is not None and response.content_length > max_bytes:
+        raise BodyTooLarge(response.content_length)
+    fp = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    size = 0
+    try:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            size += len(chunk)
+            if size > max_bytes:
+                raise BodyTooLarge(size)
+            fp.write(chunk)
+    except BaseException:
+        fp.close()
+        raise
+    return fp, size
+
+class ProviderStats:
+    def __init__(self):
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.wins = 0
+        self.latency_ewma: Optional[float] = None
+        self.failure_ewma = 0.0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class PaperProvider(ABC):
+    """A source of paper PDFs. Subclasses implement `get`."""
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = ProviderStats()
+
+    @property
+    def healthy(self) -> bool:
+        return True
+
+    def link(self, key: PaperKey, link_hint: Optional[str] = None) -> Optional[str]:
+        """Public URL for a paper, if this provider has one."""
+        return None
+
+    @abstractmethod
+    async def get(self, key: PaperKey, link_hint: Optional[str], headers: dict, max_bytes: int, spool_bytes: int) -> ProviderResponse:
+        """Fetch a paper. Raises BodyTooLarge when it exceeds `max_bytes`."""
+
+class HTTPProvider(PaperProvider):
+    """Fetches papers over HTTP through the shared pool and the host's upstream guard.
+
+    `link_for` maps a key to its URL on this provider; when it is None the caller's link is used."""
+    def __init__(self, name: str, http_pool: HTTPPool, link_for: Optional[Callable[[PaperKey], Optional[str]]] = None,
+                 guards: Optional[UpstreamGuards] = None):
+        super().__init__(name)
+        self.http_pool = http_pool
+        self.link_for = link_for
+        self.guards = guards
+        self._last_host: Optional[str] = None
+
+    @property
+    def healthy(self) -> bool:
+        if self.guards is None or self._last_host is None:
+            return True
+        return self.guards.for_host(self._last_host).breaker.state != CircuitBreaker.OPEN
+
+    def link(self, key: PaperKey, link_hint: Optional[str] = None) -> Optional[str]:
+        if self.link_for is None:
+            return link_hint
+        return self.link_for(key)
+
+    async def get(self, key, link_hint, headers, max_bytes, spool_bytes) -> ProviderResponse:
+        url = self.link(key, link_hint)
+        if url is None:
+            return 404, None, 0, None
+        async def attempt():
+            async with self.http_pool.session.get(url, headers=headers) as response:
+                metrics.inc("upstream_responses_total", provider=self.name, status=response.status)
+                if response.status in RETRYABLE_STATUSES:
+                    raise RetryableStatus(response.status)
+                if response.status == 304:
+                    return response.status, None, 0, {"etag": response.headers.get("ETag")}
+                if response.status not in range(200, 300):
+                    return response.status, None, 0, None
+                fp, size = await stream_body(response, max_bytes, spool_bytes)
+                metrics.inc("upstream_bytes_total", size, provider=self.name)
+                return response.status, fp, size, validators_from(response.headers)
+        if self.guards is None:
+            return await attempt()
+        guard = self.guards.for_url(url)
+        self._last_host = guard.host
+        return await guard.run(attempt)
+
+class TemplateHTTPProvider(HTTPProvider):
+    """HTTP mirror or object store addressed by a URL template.
+
+    Available fields: {full_subject} {subject} {year} {short_year} {season} {doctype} {paper_id} {filename}."""
+    def __init__(self, name: str, http_pool: HTTPPool, template: str, full_subject_ids: Dict[str, str],
+                 guards: Optional[UpstreamGuards] = None):
+        super().__init__(name, http_pool, self._format, guards)
+        self.template = template
+        self.full_subject_ids = full_subject_ids
+
+    def _format(self, key: PaperKey) -> Optional[str]:
+        full_subject = self.full_subject_ids.get(key.subject)
+        if full_subject is None:
+            return None
+        return self.template.format(
+            full_subject=full_subject, subject=key.subject, year=key.year, short_year=str(key.year)[-2:],
+            season=key.season, doctype=key.doctype, paper_id=key.paper_id, filename=key.filename,
+        )
+
+class LocalDirectoryProvider(PaperProvider):
+    """Serves PDFs from a local directory laid out as `{subject}/{year}/{filename}` or flat `{filename}`."""
+    def __init__(self, name: str, root: str):
+        super().__init__(name)
+        self.root = root
+
+    def _open(self, key: PaperKey):
+        for path in (os.path.join(self.root, key.relpath), os.path.join(self.root, key.filename)):
+            try:
+                fp = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            return fp, os.fstat(fp.fileno()).st_size
+        return None, 0
+
+    async def get(self, key, link_hint, headers, max_bytes, spool_bytes) -> ProviderResponse:
+        fp, size = await asyncio.to_thread(self._open, key)
+        if fp is None:
+            return 404, None, 0, None
+        if size > max_bytes:
+            fp.close()
+            raise BodyTooLarge(size)
+        return 200, fp, size, {"etag": None, "last_modified": None, "checked_at": time.time()}
+
+class RouterStats:
+    def __init__(self):
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class ProviderRouter:
+    """Picks the fastest healthy provider and hedges slow requests.
+
+    The best-ranked provider is asked first; if it has not answered after `hedge_delay` seconds the next one is asked too,
+    and whichever succeeds first wins. Failures (404, errors) fall through to the next provider.
+    Ranking uses an EWMA of each provider's successful latency plus `failure_penalty` seconds weighted by an EWMA of
+    its failure rate, so a source that keeps failing drops behind the ones that answer."""
+    def __init__(self, providers: List[PaperProvider], hedge_delay: float = 0.75, ewma_alpha: float = 0.2,
+                 failure_penalty: float = 5.0, spool_bytes: int = 1024**2):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.ewma_alpha = ewma_alpha
+        self.failure_penalty = failure_penalty
+        self.spool_bytes = spool_bytes
+        self.stats = RouterStats()
+        self.logger = logging.getLogger("main.providers")
+
+    def score(self, provider: PaperProvider) -> float:
+        """Expected cost in seconds. Unmeasured providers score 0 so every source gets sampled."""
+        stats = provider.stats
+        return (stats.latency_ewma or 0.0) + stats.failure_ewma * self.failure_penalty
+
+    def ranked(self) -> List[PaperProvider]:
+        return sorted(self.providers, key=lambda p: (not p.healthy, self.score(p)))
+
+    def _observe_latency(self, provider: PaperProvider, elapsed: float):
+        stats = provider.stats
+        if stats.latency_ewma is None:
+            stats.latency_ewma = elapsed
+        else:
+            stats.latency_ewma += self.ewma_alpha * (elapsed - stats.latency_ewma)
+
+    def _observe(self, provider: PaperProvider, elapsed: float, ok: bool):
+        stats = provider.stats
+        stats.failure_ewma += self.ewma_alpha * ((0.0 if ok else 1.0) - stats.failure_ewma)
+        if ok:
+            stats.successes += 1
+            self._observe_latency(provider, elapsed)
+        else:
+            stats.failures += 1
+
+    async def _attempt(self, provider: PaperProvider, key, link_hint, headers, max_bytes) -> ProviderResponse:
+        provider.stats.requests += 1
+        start = time.monotonic()
+        try:
+            result = await provider.get(key, link_hint, headers, max_bytes, self.spool_bytes)
+        except BodyTooLarge:
+            # The document is too large everywhere; not the provider's fault
+            raise
+        except asyncio.CancelledError:
+            # Lost a hedge race: the time spent so far is a lower bound on its latency
+            self._observe_latency(provider, time.monotonic() - start)
+            raise
+        except Exception:
+            self._observe(provider, time.monotonic() - start, False)
+            raise
+        status = result[0]
+        self._observe(provider, time.monotonic() - start, status == 304 or status in range(200, 300))
+        return result
+
+    @staticmethod
+    def _succeeded(task: asyncio.Task) -> bool:
+        if task.cancelled() or task.exception() is not None:
+            return False
+        status = task.result()[0]
+        return status == 304 or status in range(200, 300)
+
+    @staticmethod
+    def _discard(task: asyncio.Task):
+        if task.done() and not task.cancelled() and task.exception() is None:
+            fp = task.result()[1]
+            if fp is not None:
+                fp.close()
+        else:
+            task.cancel()
+
+    async def get(self, key: PaperKey, link_hint: Optional[str], headers: dict, max_bytes: int,
+                  validator_source: Optional[str] = None) -> ProviderResponse:
+        """Return the first successful response, or the most relevant failure when every provider failed.
+
+        Conditional headers are only sent to `validator_source`, the provider that issued the cached validators.
+        The validators of a successful response record which provider they came from under "provider"."""
+        self.stats.requests += 1
+        remaining = self.ranked()
+        running: Dict[asyncio.Task, PaperProvider] = {}
+        hedged: set = set()
+        failures: List[asyncio.Task] = []
+        unconditional = {k: v for k, v in headers.items() if k not in CONDITIONAL_HEADERS}
+        def launch() -> asyncio.Task:
+            provider = remaining.pop(0)
+            provider_headers = headers if provider.name == validator_source else unconditional
+            task = asyncio.create_task(self._attempt(provider, key, link_hint, provider_headers, max_bytes))
+            running[task] = provider
+            return task
+        launch()
+        try:
+            while running:
+                timeout = self.hedge_delay if remaining else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is slow: hedge with the next provider
+                    self.stats.hedges += 1
+                    hedged.add(launch())
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if self._succeeded(task):
+                        provider.stats.wins += 1
+                        if task in hedged:
+                            self.stats.hedge_wins += 1
+                        for other in done:
+                            if other is not task:
+                                self._discard(other)
+                        status, fp, size, meta = task.result()
+                        if meta is not None:
+                            meta["provider"] = provider.name
+                        return status, fp, size, meta
+                    if not task.cancelled() and isinstance(task.exception(), BodyTooLarge):
+                        raise task.exception()
+                    failures.append(task)
+                if not running and remaining:
+                    self.stats.fallbacks += 1
+                    launch()
+        finally:
+            for task in running:
+                self._discard(task)
+        # Prefer a real HTTP answer (e.g. 404) over an exception
+        for task in failures:
+            if task.exception() is None:
+                return task.result()
+        raise failures[-1].exception()
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["providers"] = {p.name: dict(p.stats.to_dict(), healthy=p.healthy) for p in self.providers}
+        return data
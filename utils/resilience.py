@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import aiohttp
+
+T = TypeVar("T")
+
+class RetryableStatus(Exception):
+    """Raised inside a guarded attempt when the upstream answered with a transient status (5xx, 429)."""
+    def __init__(self, status: int):
+        super().__init__(f"Upstream returned status {status}")
+        self.status = status
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream host that is currently considered unhealthy."""
+    def __init__(self, host: str):
+        super().__init__(f"{host} is temporarily unavailable, please try again later")
+        self.host = host
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, RetryableStatus)
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts of up to `burst`. Waiters are served FIFO.
+
+    `clock` and `sleep` default to `time.monotonic` and `asyncio.sleep`; tests pass fakes."""
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                self.waits += 1
+                self.wait_seconds += delay
+                await self.sleep(delay)
+                self._refill()
+                # Having slept off the deficit the token is earned, whatever the float refill came to
+                self.tokens = max(self.tokens, 1.0)
+            self.tokens -= 1
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout` seconds.
+
+    After that one trial call is let through (half-open); its outcome closes or re-opens the circuit."""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                self.rejected += 1
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def release_trial(self):
+        """Give back a half-open trial whose outcome says nothing about the host's health."""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_in_flight = False
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class HostGuard:
+    """Rate limit, concurrency cap, retries with jittered exponential backoff and a circuit breaker for one host."""
+    def __init__(self, host: str, rate: float = 5, burst: int = 10, max_concurrency: int = 8, retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 5, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.in_flight = 0
+        self.attempts = 0
+        self.retried = 0
+        self.failures = 0
+        self.logger = logging.getLogger("main.resilience")
+
+    def backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform between 0 and the capped exponential delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def run(self, attempt: Callable[[], Awaitable[T]], retries: Optional[int] = None) -> T:
+        """Run `attempt` under the guard. It should raise RetryableStatus for transient upstream statuses."""
+        retries = self.retries if retries is None else retries
+        for n in range(retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.host)
+            await self.bucket.acquire()
+            async with self.semaphore:
+                self.in_flight += 1
+                self.attempts += 1
+                try:
+                    result = await attempt()
+                except RETRYABLE_ERRORS as e:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    if n >= retries:
+                        raise
+                    self.logger.debug("Attempt %s against %s failed (%s), retrying", n + 1, self.host, e.__class__.__name__)
+                except BaseException:
+                    # Not the host's fault (cancellation, size limits, ...): release a half-open trial
+                    self.breaker.release_trial()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    return result
+                finally:
+                    self.in_flight -= 1
+            self.retried += 1
+            await asyncio.sleep(self.backoff(n))
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "rejected": self.breaker.rejected,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "attempts": self.attempts,
+            "retried": self.retried,
+            "failures": self.failures,
+            "rate_limit_waits": self.bucket.waits,
+            "rate_limit_wait_seconds": round(self.bucket.wait_seconds, 3),
+            "tokens": round(self.bucket.tokens, 2),
+        }
+
+class UpstreamGuards:
+    """One HostGuard per upstream host, created on first use with shared settings."""
+    def __init__(self, **settings):
+        self.settings = settings
+        self._guards: Dict[str, HostGuard] = {}
+
+    def for_host(self, host: str) -> HostGuard:
+        guard = self._guards.get(host)
+        if guard is None:
+            guard = self._guards[host] = HostGuard(host, **self.settings)
+        return guard
+
+    def for_url(self, url: str) -> HostGuard:
+        return self.for_host(urlsplit(url).netloc)
+
+    def snapshot(self) -> dict:
+        return {host: guard.snapshot() for host, guard in self._guards.items()}
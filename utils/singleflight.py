@@ -0,0 +1,62 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlightStats:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one shared task.
+
+    Every waiter gets the same result or exception. A waiter being cancelled does not cancel the shared
+    task unless it was the last one waiting for it."""
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = SingleFlightStats()
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def _done(self, key: Hashable, call: _Call, task: asyncio.Task):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable]):
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda t: self._done(key, call, t))
+            self.stats.leaders += 1
+        else:
+            self.stats.coalesced += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # Forget it now, not in `_done`: a caller arriving before the task finishes cancelling must start afresh
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+                self.stats.abandoned += 1
+            raise
+        finally:
+            call.waiters -= 1
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["in_flight"] = len(self._calls)
+        return data
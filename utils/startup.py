@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from discord.app_commands import CommandTree
+
+def discover_extensions(root: str = "cogs") -> List[str]:
+    """Module names of every extension under `cogs/single` and `cogs/group`, skipping `_`-prefixed files."""
+    names = []
+    for folder in ("single", "group"):
+        path = os.path.join(root, folder)
+        if not os.path.isdir(path):
+            continue
+        for fn in sorted(os.listdir(path)):
+            if fn.endswith(".py") and not fn.startswith("_"):
+                names.append(f"{root}.{folder}.{fn[:-3]}")
+    return names
+
+class StartupProfile:
+    """Wall time of each startup phase, measured from `started` (a `time.perf_counter()` reading)."""
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases: List[Tuple[str, float, int]] = []  # (name, seconds, depth)
+        self.finished = False
+
+    @contextmanager
+    def phase(self, name: str, depth: int = 0):
+        # Take the slot now so phases marked inside this one are listed after it
+        index = len(self.phases)
+        self.phases.append((name, 0.0, depth))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[index] = (name, time.perf_counter() - start, depth)
+
+    def mark(self, name: str, seconds: float, depth: int = 0):
+        self.phases.append((name, seconds, depth))
+
+    def top_level(self) -> List[Tuple[str, float]]:
+        return [(name, seconds) for name, seconds, depth in self.phases if depth == 0]
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        width = max((len(name) + 2 * depth for name, _, depth in self.phases), default=0)
+        lines = [f"{'  ' * depth + name:<{width}}  {seconds * 1000:8.1f} ms" for name, seconds, depth in self.phases]
+        lines.append(f"{'total':<{width}}  {self.elapsed() * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+def command_tree_hash(tree: CommandTree, application_id: Optional[int]) -> str:
+    """Stable hash of the global app commands as they would be sent to Discord by `tree.sync()`."""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c.get("type", 1), c["name"]))
+    data = json.dumps({"application_id": application_id, "commands": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+class CommandSync:
+    """Syncs the command tree only when its hash differs from the one recorded after the last successful sync.
+
+    `mode` is "auto" (sync on change), "always" or "never"."""
+    def __init__(self, tree: CommandTree, hash_file: str, mode: str = "auto"):
+        self.tree = tree
+        self.hash_file = hash_file
+        self.mode = mode
+        self.logger = logging.getLogger("main.startup")
+
+    def _stored_hash(self) -> Optional[str]:
+        try:
+            with open(self.hash_file, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _store_hash(self, value: str):
+        os.makedirs(os.path.dirname(self.hash_file) or ".", exist_ok=True)
+        tmp = f"{self.hash_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp, self.hash_file)
+
+    async def run(self, application_id: Optional[int]) -> bool:
+        """Sync if needed. Returns whether a sync was sent to Discord."""
+        if self.mode == "never":
+            return False
+        current = command_tree_hash(self.tree, application_id)
+        if self.mode != "always" and current == self._stored_hash():
+            self.logger.info("Command tree unchanged, skipping sync")
+            return False
+        commands = await self.tree.sync()
+        self.logger.info(f"Synced {len(commands)} app commands")
+        try:
+            self._store_hash(current)
+        except OSError as e:
+            self.logger.warning(f"Could not record the command tree hash: {e.__class__.__name__}: {e}")
+        return True
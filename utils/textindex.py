@@ -0,0 +1,378 @@
+import asyncio
+import heapq
+import importlib.util
+import json
+import logging
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import tempfile
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Optional: without it nothing gets indexed and searches come back empty.
+# Only the pool workers import it, so it stays off the bot's startup path.
+HAS_PYPDF = importlib.util.find_spec("pypdf") is not None
+
+from utils.papercache import PaperKey
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(unicodedata.normalize("NFKC", text).lower())
+
+# --- Postings encoding ---
+# Per term: for each document (ascending): doc id delta, number of positions, position deltas; all as varints.
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(buf, i: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[i]
+        i += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, i
+        shift += 7
+
+def decode_postings(buf) -> List[Tuple[int, List[int]]]:
+    result = []
+    i = doc_id = 0
+    while i < len(buf):
+        delta, i = _read_varint(buf, i)
+        doc_id += delta
+        count, i = _read_varint(buf, i)
+        positions = []
+        pos = 0
+        for _ in range(count):
+            delta, i = _read_varint(buf, i)
+            pos += delta
+            positions.append(pos)
+        result.append((doc_id, positions))
+    return result
+
+def _encode_postings(postings: Dict[str, List[Tuple[int, List[int]]]]) -> Tuple[bytes, Dict[str, Tuple[int, int, int]]]:
+    out = bytearray()
+    lexicon = {}
+    for term in sorted(postings):
+        start = len(out)
+        prev = 0
+        for doc_id, positions in postings[term]:
+            _write_varint(out, doc_id - prev)
+            prev = doc_id
+            _write_varint(out, len(positions))
+            last = 0
+            for pos in positions:
+                _write_varint(out, pos - last)
+                last = pos
+        lexicon[term] = (start, len(out) - start, len(postings[term]))
+    return bytes(out), lexicon
+
+# --- Process pool workers ---
+
+def extract_tokens(path: str) -> List[List[str]]:
+    """Tokens of every page of a PDF."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    pages = []
+    for page in reader.pages:
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        pages.append(tokenize(text))
+    return pages
+
+def build_segment(docs: List[Tuple[int, List[str]]]) -> Tuple[bytes, Dict[str, Tuple[int, int, int]]]:
+    postings: Dict[str, List[Tuple[int, List[int]]]] = {}
+    for doc_id, tokens in docs:
+        positions: Dict[str, List[int]] = {}
+        for pos, token in enumerate(tokens):
+            positions.setdefault(token, []).append(pos)
+        for token, ps in positions.items():
+            postings.setdefault(token, []).append((doc_id, ps))
+    return _encode_postings(postings)
+
+def merge_segments(paths: List[Tuple[str, str]]) -> Tuple[bytes, Dict[str, Tuple[int, int, int]]]:
+    """Merge (postings, lexicon) file pairs. Segments cover ascending doc id ranges, so lists simply concatenate."""
+    postings: Dict[str, List[Tuple[int, List[int]]]] = {}
+    for post_path, lex_path in paths:
+        with open(lex_path, "r", encoding="utf-8") as f:
+            lexicon = json.load(f)
+        with open(post_path, "rb") as f:
+            data = f.read()
+        for term, (offset, length, _) in lexicon.items():
+            postings.setdefault(term, []).extend(decode_postings(data[offset:offset + length]))
+    return _encode_postings(postings)
+
+# --- Index ---
+
+class SearchHit(NamedTuple):
+    key: PaperKey
+    page: int  # 1-based
+    score: float
+
+class Segment:
+    def __init__(self, name: str, post_path: str, lex_path: str):
+        self.name = name
+        with open(lex_path, "r", encoding="utf-8") as f:
+            self.lexicon: Dict[str, list] = json.load(f)
+        self._file = open(post_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def postings(self, term: str) -> List[Tuple[int, List[int]]]:
+        entry = self.lexicon.get(term)
+        if entry is None:
+            return []
+        offset, length, _ = entry
+        return decode_postings(self._data[offset:offset + length])
+
+    def df(self, term: str) -> int:
+        entry = self.lexicon.get(term)
+        return entry[2] if entry else 0
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+class IndexStats:
+    def __init__(self):
+        self.indexed_papers = 0
+        self.extraction_errors = 0
+        self.compactions = 0
+        self.searches = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class TextIndex:
+    """Full-text index over the pages of cached PDFs, with positional postings.
+
+    Text is extracted in a process pool. Each batch of papers becomes an immutable on-disk segment
+    (a varint postings file plus a JSON lexicon), memory-mapped for searching. Segments are merged
+    once there are more than `max_segments`. A manifest records the indexed papers and pages
+    (subject, year, season, doctype, paper, page, length). Results are ranked with BM25 plus a bonus
+    for the query appearing as a phrase. Terms on more than `MAX_DF_RATIO` of all pages (stopwords) are
+    neither scored nor decoded unless the query has nothing else, and the phrase check skips over them."""
+    K1 = 1.2
+    B = 0.75
+    PHRASE_BONUS = 1.5
+    MAX_DF_RATIO = 0.5
+
+    def __init__(self, root: str, workers: int = 2, max_segments: int = 8):
+        self.root = root
+        self.workers = workers
+        self.max_segments = max_segments
+        self.stats = IndexStats()
+        self.docs: List[list] = []  # doc id -> [subject, year, season, doctype, paper_id, page, length]
+        self.papers: Dict[str, int] = {}  # filename -> page count (-1 if extraction failed)
+        self.segments: List[Segment] = []
+        self.next_segment = 0
+        self.total_length = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = asyncio.Lock()
+        self._searching = 0  # searches running in threads, which may still read replaced segments
+        self.logger = logging.getLogger("main.textindex")
+
+    @property
+    def available(self) -> bool:
+        return HAS_PYPDF
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _load(self):
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            with open(self._path("manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        self.docs = manifest["docs"]
+        self.papers = manifest["papers"]
+        self.next_segment = manifest["next_segment"]
+        self.total_length = sum(doc[6] for doc in self.docs)
+        self.segments = [Segment(name, self._path(f"{name}.post"), self._path(f"{name}.lex")) for name in manifest["segments"]]
+
+    async def load(self):
+        await asyncio.to_thread(self._load)
+        if not self.available:
+            self.logger.warning("pypdf is not installed, past papers will not be indexed for /search")
+        self.logger.info(f"Loaded text index from {self.root}: {len(self.papers)} papers, {len(self.docs)} pages, {len(self.segments)} segments")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        for segment in self.segments:
+            segment.close()
+
+    def __contains__(self, key: PaperKey) -> bool:
+        return key.filename in self.papers
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # The bot process runs threads (to_thread workers, aiohttp's resolver), so forking it is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _write_atomic(self, name: str, data: bytes):
+        fd, tmp = tempfile.mkstemp(prefix=".tmp", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(name))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _save_segment(self, name: str, data: bytes, lexicon: dict) -> Segment:
+        self._write_atomic(f"{name}.post", data)
+        self._write_atomic(f"{name}.lex", json.dumps(lexicon, separators=(",", ":")).encode("utf-8"))
+        return Segment(name, self._path(f"{name}.post"), self._path(f"{name}.lex"))
+
+    def _save_manifest(self):
+        manifest = {
+            "docs": self.docs,
+            "papers": self.papers,
+            "segments": [segment.name for segment in self.segments],
+            "next_segment": self.next_segment,
+        }
+        self._write_atomic("manifest.json", json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+
+    async def add(self, items: Iterable[Tuple[PaperKey, str]]) -> int:
+        """Index (key, pdf path) pairs not indexed yet, as one new segment. Returns the number of pages added."""
+        if not self.available:
+            return 0
+        async with self._lock:
+            items = [(key, path) for key, path in items if key not in self]
+            if not items:
+                return 0
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(*(loop.run_in_executor(self.pool, extract_tokens, path) for _, path in items),
+                                           return_exceptions=True)
+            docs = []
+            new_docs = []
+            new_papers = {}
+            for (key, _), pages in zip(items, results):
+                if isinstance(pages, BaseException):
+                    self.stats.extraction_errors += 1
+                    self.logger.warning(f"Could not extract text from {key.filename}: {pages.__class__.__name__}")
+                    if not isinstance(pages, OSError):
+                        # Unreadable PDF; a missing file (evicted meanwhile) is retried once it is cached again
+                        new_papers[key.filename] = -1
+                    continue
+                for page, tokens in enumerate(pages, start=1):
+                    doc_id = len(self.docs) + len(new_docs)
+                    new_docs.append([key.subject, key.year, key.season, key.doctype, key.paper_id, page, len(tokens)])
+                    docs.append((doc_id, tokens))
+                new_papers[key.filename] = len(pages)
+                self.stats.indexed_papers += 1
+            if docs:
+                data, lexicon = await loop.run_in_executor(self.pool, build_segment, docs)
+                name = f"seg_{self.next_segment:06d}"
+                self.next_segment += 1
+                segment = await asyncio.to_thread(self._save_segment, name, data, lexicon)
+                # Docs first, and a new segments list, so a search running in a thread never sees unknown doc ids
+                self.docs.extend(new_docs)
+                self.total_length += sum(doc[6] for doc in new_docs)
+                self.segments = [*self.segments, segment]
+            self.papers.update(new_papers)
+            await asyncio.to_thread(self._save_manifest)
+            if len(self.segments) > self.max_segments:
+                await self._compact()
+            return len(new_docs)
+
+    async def _compact(self):
+        old = self.segments
+        name = f"seg_{self.next_segment:06d}"
+        self.next_segment += 1
+        data, lexicon = await asyncio.get_running_loop().run_in_executor(
+            self.pool, merge_segments, [(self._path(f"{s.name}.post"), self._path(f"{s.name}.lex")) for s in old])
+        self.segments = [await asyncio.to_thread(self._save_segment, name, data, lexicon)]
+        await asyncio.to_thread(self._save_manifest)
+        while self._searching:
+            await asyncio.sleep(0.05)
+        for segment in old:
+            segment.close()
+            for ext in (".post", ".lex"):
+                try:
+                    os.remove(self._path(segment.name + ext))
+                except FileNotFoundError:
+                    pass
+        self.stats.compactions += 1
+        self.logger.info(f"Compacted {len(old)} text index segments into {name}")
+
+    async def search(self, query: str, limit: int = 10, subject: Optional[str] = None,
+                     doctype: Optional[str] = None) -> List[SearchHit]:
+        """Rank pages for `query`. `subject` is a short subject ID, `doctype` "qp" or "ms".
+
+        Decoding postings is CPU-bound, so the ranking runs in a thread."""
+        self.stats.searches += 1
+        self._searching += 1
+        try:
+            return await asyncio.to_thread(self._search, query, limit, subject, doctype)
+        finally:
+            self._searching -= 1
+
+    def _search(self, query: str, limit: int, subject: Optional[str], doctype: Optional[str]) -> List[SearchHit]:
+        tokens = tokenize(query)
+        # `add` and `_compact` replace or append to these rather than rewriting them, so a snapshot stays consistent
+        segments, docs, total_length = self.segments, self.docs, self.total_length
+        n = len(docs)
+        if not tokens or not n:
+            return []
+        avg_length = total_length / n or 1
+        dfs = {term: sum(segment.df(term) for segment in segments) for term in dict.fromkeys(tokens)}
+        terms = [term for term, df in dfs.items() if 0 < df <= n * self.MAX_DF_RATIO]
+        if not terms:
+            terms = [term for term, df in dfs.items() if df]
+        scores: Dict[int, float] = {}
+        positions: Dict[int, Dict[str, List[int]]] = {}
+        for term in terms:
+            df = dfs[term]
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for segment in segments:
+                for doc_id, ps in segment.postings(term):
+                    doc = docs[doc_id]
+                    if (subject is not None and doc[0] != subject) or (doctype is not None and doc[3] != doctype):
+                        continue
+                    tf = len(ps)
+                    norm = self.K1 * (1 - self.B + self.B * doc[6] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+                    positions.setdefault(doc_id, {})[term] = ps
+        # The scored words at their offsets in the query; repeated words are kept, skipped stopwords leave gaps
+        phrase = [(offset, token) for offset, token in enumerate(tokens) if token in terms]
+        if len(phrase) > 1:
+            for doc_id, found in positions.items():
+                if len(found) == len(terms) and self._has_phrase(found, phrase):
+                    scores[doc_id] *= self.PHRASE_BONUS
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [SearchHit(PaperKey(*docs[doc_id][:5]), docs[doc_id][5], score) for doc_id, score in best]
+
+    @staticmethod
+    def _has_phrase(found: Dict[str, List[int]], phrase: List[Tuple[int, str]]) -> bool:
+        """Whether every (offset, term) of `phrase` occurs at the same position relative to the others."""
+        starts = None
+        for offset, term in phrase:
+            shifted = {p - offset for p in found[term]}
+            starts = shifted if starts is None else starts & shifted
+            if not starts:
+                return False
+        return True
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data.update(papers=len(self.papers), pages=len(self.docs), segments=len(self.segments))
+        return data
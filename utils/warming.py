@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.fetcher import PaperFetcher
+from utils.papercache import PaperKey
+from utils.prefetch import fetch_preemptible
+
+class PopularityTracker:
+    """Exponentially decayed request counters per paper.
+
+    A request adds 1 to the paper's score and scores halve every `half_life` seconds,
+    so the ranking follows what is being asked for now (e.g. right before an exam session)."""
+    def __init__(self, half_life: float = 3 * 86400, max_entries: int = 5000, collection=None):
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self.collection = collection
+        self._scores: Dict[PaperKey, Tuple[float, float]] = {}  # key -> (score, updated_at)
+        self.logger = logging.getLogger("main.warming")
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    @staticmethod
+    def normalise(key: PaperKey) -> PaperKey:
+        # QP and MS requests both count towards the paper
+        return key._replace(doctype="qp")
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * math.pow(0.5, (now - updated_at) / self.half_life)
+
+    def record(self, key: PaperKey, weight: float = 1.0):
+        key = self.normalise(key)
+        now = time.time()
+        score, updated_at = self._scores.get(key, (0.0, now))
+        self._scores[key] = (self._decayed(score, updated_at, now) + weight, now)
+        if len(self._scores) > self.max_entries * 2:
+            self._prune()
+
+    def _prune(self):
+        keep = dict(self.top(self.max_entries))
+        self._scores = {k: v for k, v in self._scores.items() if k in keep}
+
+    def top(self, n: int) -> List[Tuple[PaperKey, float]]:
+        now = time.time()
+        scored = [(k, self._decayed(s, t, now)) for k, (s, t) in self._scores.items()]
+        scored.sort(key=lambda e: e[1], reverse=True)
+        return scored[:n]
+
+    async def load(self):
+        if self.collection is None:
+            return
+        try:
+            async for doc in self.collection.find({}):
+                key = PaperKey(doc["subject"], doc["year"], doc["season"], "qp", doc["paper_id"])
+                self._scores[key] = (doc["score"], doc["updated_at"])
+        except Exception as e:
+            self.logger.warning(f"Could not load popularity counters: {e.__class__.__name__}: {e}")
+            return
+        self.logger.info(f"Loaded {len(self._scores)} popularity counters")
+
+    async def save(self):
+        if self.collection is None or not self._scores:
+            return
+        from pymongo import ReplaceOne  # pymongo is slow to import; keep it off the startup path
+        ops = [
+            ReplaceOne({"_id": key.filename[:-4]}, {
+                "subject": key.subject, "year": key.year, "season": key.season,
+                "paper_id": key.paper_id, "score": score, "updated_at": updated_at,
+            }, upsert=True)
+            for key, (score, updated_at) in self._scores.items()
+        ]
+        try:
+            await self.collection.bulk_write(ops, ordered=False)
+        except Exception as e:
+            self.logger.warning(f"Could not save popularity counters: {e.__class__.__name__}: {e}")
+
+class BandwidthLimiter:
+    """Paces background downloads so their combined throughput stays under `bytes_per_second`."""
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._next = 0.0
+
+    async def consume(self, size: int):
+        if not self.bytes_per_second or size <= 0:
+            return
+        now = time.monotonic()
+        self._next = max(now, self._next) + size / self.bytes_per_second
+        await asyncio.sleep(self._next - now)
+
+class WarmStats:
+    def __init__(self):
+        self.runs = 0
+        self.warmed = 0
+        self.already_warm = 0
+        self.failed = 0
+        self.preempted = 0
+        self.bytes = 0
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class CacheWarmer:
+    """Prefetches the most popular papers and their mark schemes into the local caches.
+
+    Like the Prefetcher, a warm download is cancelled when a foreground fetch starts and retried once it is done."""
+    def __init__(self, fetcher: PaperFetcher, tracker: PopularityTracker, link_for: Callable[[PaperKey], Optional[str]],
+                 concurrency: int = 2, bytes_per_second: float = 2 * 1024**2):
+        self.fetcher = fetcher
+        self.tracker = tracker
+        self.link_for = link_for
+        self.concurrency = concurrency
+        self.bandwidth = BandwidthLimiter(bytes_per_second)
+        self.stats = WarmStats()
+        self.logger = logging.getLogger("main.warming")
+
+    async def _warm_one(self, key: PaperKey, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            if key in self.fetcher.hot_cache or key in self.fetcher.disk_cache:
+                self.stats.already_warm += 1
+                return
+            link = self.link_for(key)
+            if link is None:
+                return
+            # Never compete with live requests: start only while idle and yield as soon as foreground work starts
+            while True:
+                await self.fetcher.gate.idle.wait()
+                try:
+                    result = await fetch_preemptible(self.fetcher, key, link)
+                except Exception as e:
+                    self.stats.failed += 1
+                    self.logger.debug("Warming %s failed: %s", key.filename, e.__class__.__name__)
+                    return
+                if result is not None:
+                    break
+                self.stats.preempted += 1
+            if not result.ok:
+                self.stats.failed += 1
+                return
+            self.stats.warmed += 1
+            if result.source == "upstream" and result.size:
+                self.stats.bytes += result.size
+                await self.bandwidth.consume(result.size)
+
+    async def warm(self, top_n: int) -> int:
+        """Warm the `top_n` most popular papers (QP and MS). Returns the number of documents considered."""
+        self.stats.runs += 1
+        keys = []
+        for key, _ in self.tracker.top(top_n):
+            keys.append(key)
+            keys.append(key._replace(doctype="ms"))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._warm_one(key, semaphore) for key in keys))
+        return len(keys)
+
+    def snapshot(self) -> dict:
+        data = self.stats.to_dict()
+        data["tracked"] = len(self.tracker)
+        return data